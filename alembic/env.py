@@ -7,8 +7,9 @@ from alembic import context
 
 from src.db.db_setup import Base
 from src.todoitems.models import ToDoItem
-from src.todolists.models import ToDoList
+from src.todolists.models import ToDoList, ToDoListShare
 from src.auth.models import User
+from src.sync.models import Tombstone
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
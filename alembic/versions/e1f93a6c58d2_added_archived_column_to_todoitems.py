@@ -0,0 +1,86 @@
+"""added archived column to todoitems
+
+Revision ID: e1f93a6c58d2
+Revises: c4a8d17e2b96
+Create Date: 2026-10-19 14:05:51.612390
+
+Completed items older than ARCHIVE_COMPLETED_AFTER_DAYS are flagged as
+archived by the archive Celery job and hidden from the item queries.
+
+Run with ``alembic -x partition_todoitems=true upgrade head`` to also turn
+``todoitems`` into a table LIST partitioned on ``archived`` (PostgreSQL
+only), with a ``todoitems_hot`` and a ``todoitems_archive`` partition. The
+archive job then moves rows between partitions and the item queries, which
+filter on ``archived = false`` unless they ask for archived items, only scan
+the hot one. The items of a list read (ToDoList.items) are all loaded, so
+those reads and the sync feed scan both partitions.
+Partitioning rewrites the table, plan a maintenance window on big databases.
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1f93a6c58d2'
+down_revision: Union[str, None] = 'c4a8d17e2b96'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Indexes of todoitems. A partitioned table can't have a unique index
+# that doesn't contain the partition key, so ix_todoitems_id is only
+# unique on the plain table; uuid4 ids keep it unique in practice.
+INDEXES = [
+    "CREATE {unique} INDEX ix_todoitems_id ON todoitems (id)",
+    "CREATE INDEX ix_todoitems_name ON todoitems (name)",
+    "CREATE INDEX ix_todoitems_updated_at_id ON todoitems (updated_at, id)",
+    "CREATE INDEX ix_todoitems_todolist_id_live ON todoitems (todolist_id) WHERE deleted_at IS NULL",
+    "CREATE INDEX ix_todoitems_deleted_at ON todoitems (deleted_at) WHERE deleted_at IS NOT NULL",
+    "CREATE INDEX ix_todoitems_todolist_id_hot ON todoitems (todolist_id) WHERE NOT archived AND deleted_at IS NULL",
+]
+
+
+def _is_partitioned() -> bool:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+    relkind = bind.execute(sa.text("SELECT relkind FROM pg_class WHERE relname = 'todoitems'")).scalar()
+    return relkind == 'p'
+
+
+def _rebuild_todoitems(partitioned: bool) -> None:
+    """Copy todoitems into a new plain or partitioned table with the same indexes"""
+    op.execute("ALTER TABLE todoitems RENAME TO todoitems_rebuild")
+    if partitioned:
+        op.execute("CREATE TABLE todoitems (LIKE todoitems_rebuild INCLUDING DEFAULTS) PARTITION BY LIST (archived)")
+        op.execute("CREATE TABLE todoitems_hot PARTITION OF todoitems FOR VALUES IN (false)")
+        op.execute("CREATE TABLE todoitems_archive PARTITION OF todoitems FOR VALUES IN (true)")
+    else:
+        op.execute("CREATE TABLE todoitems (LIKE todoitems_rebuild INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO todoitems SELECT * FROM todoitems_rebuild")
+    op.execute("DROP TABLE todoitems_rebuild")
+
+    op.execute("ALTER TABLE todoitems ADD PRIMARY KEY ({})".format("id, archived" if partitioned else "id"))
+    for index in INDEXES:
+        op.execute(index.format(unique="" if partitioned else "UNIQUE"))
+    op.create_foreign_key('todoitems_todolist_id_fkey', 'todoitems', 'todolist', ['todolist_id'], ['id'], ondelete='CASCADE')
+
+
+def upgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.add_column('todoitems', sa.Column('archived', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    op.create_index('ix_todoitems_todolist_id_hot', 'todoitems', ['todolist_id'], unique=False, postgresql_where=sa.text('NOT archived AND deleted_at IS NULL'))
+    # ### end Alembic commands ###
+    partition = context.get_x_argument(as_dictionary=True).get('partition_todoitems') == 'true'
+    if partition and op.get_bind().dialect.name == 'postgresql' and not _is_partitioned():
+        _rebuild_todoitems(partitioned=True)
+
+
+def downgrade() -> None:
+    if _is_partitioned():
+        _rebuild_todoitems(partitioned=False)
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index('ix_todoitems_todolist_id_hot', table_name='todoitems', postgresql_where=sa.text('NOT archived AND deleted_at IS NULL'))
+    op.drop_column('todoitems', 'archived')
+    # ### end Alembic commands ###
@@ -0,0 +1,220 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The app reads its settings from the environment at import time, so
+``configure_environment`` must be called before anything under ``src`` or
+``main`` is imported.
+"""
+import json
+import math
+import os
+import random
+import subprocess
+import time
+import uuid
+from datetime import datetime
+
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///./benchmark.db"
+
+# Placeholder values for the settings the benchmarks do not exercise.
+# Anything already set in the environment (or in .env) wins.
+BENCHMARK_SETTINGS = {
+    "API_PATH_PREFIX": "/api/v1",
+    "API_VERSION": "benchmark",
+    "API_TITLE": "ToDo API benchmark",
+    "API_DESCRIPTION": "benchmark",
+    "SECRET_KEY": "benchmark-secret",
+    "ALGORITHM": "HS256",
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+    "REDIS_PASS": "",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "REFRESH_TOKEN_EXPIRE_MINUTES": "120",
+    "API_BASE_URL": "localhost:8000",
+    "MAIL_USERNAME": "benchmark",
+    "MAIL_PASSWORD": "benchmark",
+    "MAIL_FROM": "benchmark@example.com",
+    "MAIL_PORT": "1025",
+    "MAIL_SERVER": "localhost",
+    "MAIL_FROM_NAME": "benchmark",
+    "CELERY_BROKER_URL": "memory://",
+    "CELERY_RESULT_BACKEND": "cache+memory://",
+}
+
+
+def configure_environment(database_url: str | None = None) -> None:
+    """
+    Fill in the settings the app needs to start and point it at the
+    benchmark database.
+
+    Args:
+        database_url (str): SQLAlchemy async url, overrides POSTGRES_URL
+    """
+    for key, value in BENCHMARK_SETTINGS.items():
+        os.environ.setdefault(key, value)
+    if database_url:
+        os.environ["POSTGRES_URL"] = database_url
+    os.environ.setdefault("POSTGRES_URL", DEFAULT_DATABASE_URL)
+
+
+def use_fake_redis() -> None:
+    """Swap the redis client for an in-process fakeredis instance"""
+    try:
+        from fakeredis import FakeAsyncRedis
+    except ImportError:
+        raise SystemExit("--fake-redis needs the fakeredis package: pip install fakeredis")
+    from src.db import redis
+
+    redis.token_blocklist = FakeAsyncRedis()
+
+
+async def reset_database() -> None:
+    """Drop and recreate all tables on the benchmark database"""
+    from src.db.db_setup import Base, get_engine, init_db
+
+    # init_db also imports the models, so drop_all knows every table.
+    await init_db()
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+
+
+async def seed(users: int, lists: int, items_per_list: int, batch_size: int = 5000, rng: random.Random | None = None) -> dict:
+    """
+    Insert synthetic users, todo lists and todo items with bulk inserts.
+
+    Every user gets the password ``benchmark`` (hashed once and reused).
+    Lists are owned by the users in turn, or by nobody without users.
+
+    Returns:
+        dict: the generated usernames, list ids, their owners' usernames and item ids
+    """
+    from sqlalchemy import insert
+    from src.db.db_setup import AsyncSessionLocal, get_engine
+    from src.auth.models import User
+    from src.auth.utils import get_password_hash
+    from src.todolists.models import ToDoList
+    from src.todoitems.models import ToDoItem
+
+    rng = rng or random.Random(0)
+    get_engine()
+    now = datetime.now()
+    password = get_password_hash("benchmark") if users else None
+
+    user_rows = [
+        {
+            "id": uuid.UUID(int=rng.getrandbits(128)),
+            "username": f"bench_user_{i}",
+            "email": f"bench_user_{i}@example.com",
+            "password": password,
+            "first_name": "Bench",
+            "last_name": f"User{i}",
+            "role": "user",
+            "is_active": True,
+            "is_verified": True,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(users)
+    ]
+    list_rows = [
+        {
+            "id": uuid.UUID(int=rng.getrandbits(128)),
+            "title": f"list {i}",
+            "is_active": True,
+            "owner_id": user_rows[i % users]["id"] if users else None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(lists)
+    ]
+    item_ids = []
+
+    async with AsyncSessionLocal() as session:
+        for table, rows in ((User, user_rows), (ToDoList, list_rows)):
+            for start in range(0, len(rows), batch_size):
+                await session.execute(insert(table), rows[start:start + batch_size])
+
+        batch = []
+        for todo_list in list_rows:
+            for n in range(items_per_list):
+                item_id = uuid.UUID(int=rng.getrandbits(128))
+                item_ids.append(item_id)
+                batch.append({
+                    "id": item_id,
+                    "name": f"item {n}",
+                    "description": "synthetic benchmark item",
+                    "is_complete": rng.random() < 0.3,
+                    "todolist_id": todo_list["id"],
+                    "created_at": now,
+                    "updated_at": now,
+                })
+                if len(batch) >= batch_size:
+                    await session.execute(insert(ToDoItem), batch)
+                    batch = []
+        if batch:
+            await session.execute(insert(ToDoItem), batch)
+        await session.commit()
+
+    return {
+        "usernames": [row["username"] for row in user_rows],
+        "list_ids": [row["id"] for row in list_rows],
+        "list_owners": [user_rows[i % users]["username"] if users else None for i in range(lists)],
+        "item_ids": item_ids,
+    }
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    """
+    Summarize request latencies (in seconds) as milliseconds.
+
+    Returns:
+        dict: request count, errors, throughput and latency percentiles
+    """
+    values = sorted(latencies)
+    to_ms = lambda v: round(v * 1000, 3)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": to_ms(sum(values) / len(values)) if values else 0.0,
+        "p50_ms": to_ms(percentile(values, 50)),
+        "p95_ms": to_ms(percentile(values, 95)),
+        "p99_ms": to_ms(percentile(values, 99)),
+        "max_ms": to_ms(values[-1]) if values else 0.0,
+    }
+
+
+def run_metadata() -> dict:
+    """Describe the environment a benchmark ran in"""
+    import platform
+
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_report(report: dict, path: str | None) -> None:
+    """Print the report as JSON, and save it to ``path`` when given"""
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
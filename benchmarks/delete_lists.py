@@ -0,0 +1,110 @@
+"""
+Benchmark of deleting todo lists of different sizes.
+
+For every list size each strategy runs against a freshly seeded list:
+
+- orm_cascade: the previous behaviour, load the list (and through selectin
+  every item) and let the ORM cascade issue one DELETE per item
+- soft_delete: ToDoListService.delete_todo_list, the request path today
+- set_based_purge: soft delete followed by ToDoListService.purge_deleted_lists,
+  a single DELETE on the list with the items removed by ON DELETE CASCADE
+
+Usage (from the repository root):
+    python -m benchmarks.delete_lists --sizes 10 1000 100000 --output delete.json
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+from .common import configure_environment, run_metadata, write_report
+
+STRATEGIES = ["orm_cascade", "soft_delete", "set_based_purge"]
+
+
+def enable_sqlite_foreign_keys(engine):
+    """SQLite only enforces ON DELETE CASCADE with the foreign_keys pragma"""
+    from sqlalchemy import event
+
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+async def delete_once(strategy: str, list_id) -> float:
+    from sqlalchemy.future import select
+    from src.db.db_setup import AsyncSessionLocal
+    from src.todolists.models import ToDoList
+    from src.todolists.service import ToDoListService
+
+    async with AsyncSessionLocal() as session:
+        started = time.perf_counter()
+        if strategy == "orm_cascade":
+            results = await session.execute(select(ToDoList).where(ToDoList.id == list_id))
+            await session.delete(results.scalar_one())
+            await session.commit()
+        elif strategy == "soft_delete":
+            await ToDoListService(session).delete_todo_list(id=list_id)
+        else:
+            service = ToDoListService(session)
+            await service.delete_todo_list(id=list_id)
+            await service.purge_deleted_lists(datetime.now() + timedelta(seconds=1))
+        return time.perf_counter() - started
+
+
+async def remaining_items() -> int:
+    from sqlalchemy import func
+    from sqlalchemy.future import select
+    from src.db.db_setup import AsyncSessionLocal
+    from src.todoitems.models import ToDoItem
+
+    async with AsyncSessionLocal() as session:
+        query = select(func.count()).select_from(ToDoItem.__table__)
+        return (await session.execute(query)).scalar_one()
+
+
+async def run(args) -> dict:
+    from .common import reset_database, seed
+    from src.db.db_setup import dispose_engine, get_engine
+
+    enable_sqlite_foreign_keys(get_engine())
+    report = {"meta": {**run_metadata(), "config": vars(args)}, "results": {}}
+    for size in args.sizes:
+        report["results"][str(size)] = {}
+        for strategy in args.strategies:
+            timings = []
+            for _ in range(args.repeat):
+                await reset_database()
+                data = await seed(users=0, lists=1, items_per_list=size)
+                timings.append(await delete_once(strategy, data["list_ids"][0]))
+            report["results"][str(size)][strategy] = {
+                "best_ms": round(min(timings) * 1000, 3),
+                "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+                "items_left_in_table": await remaining_items(),
+            }
+    await dispose_engine()
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="async SQLAlchemy url (default: a local SQLite file)")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 1000, 100000], help="items per deleted list")
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=STRATEGIES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    write_report(asyncio.run(run(args)), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Pick the password hashing cost for the current hardware.
+
+Times hashing one password at increasing costs of a scheme and reports the
+highest cost whose median hash time stays under the target. The target is
+the CPU time a login may spend hashing: each login verifies one hash, and
+signups, password resets and rehashes compute one.
+
+- bcrypt: PASSWORD_BCRYPT_ROUNDS, each round doubles the time
+- argon2: PASSWORD_ARGON2_TIME_COST at the configured memory cost and
+  parallelism (needs the optional ``argon2-cffi`` package)
+
+Usage (from the repository root):
+    python -m benchmarks.hashing --scheme bcrypt --target-ms 250 --output hashing.json
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from .common import configure_environment, run_metadata, write_report
+
+SCHEMES = ["bcrypt", "argon2"]
+COST_SETTINGS = {"bcrypt": "PASSWORD_BCRYPT_ROUNDS", "argon2": "PASSWORD_ARGON2_TIME_COST"}
+# The valid range of the cost of each scheme.
+COST_RANGES = {"bcrypt": range(4, 32), "argon2": range(1, 64)}
+
+
+def hasher(scheme: str, cost: int):
+    """The passlib handler of a scheme at a cost, other options from the settings"""
+    from passlib import hash as handlers
+    from src.utils.config import settings
+
+    if scheme == "bcrypt":
+        return handlers.bcrypt.using(rounds=cost)
+    if not handlers.argon2.has_backend():
+        raise SystemExit("--scheme argon2 needs the argon2-cffi package: pip install argon2-cffi")
+    return handlers.argon2.using(
+        time_cost=cost,
+        memory_cost=settings.PASSWORD_ARGON2_MEMORY_COST,
+        parallelism=settings.PASSWORD_ARGON2_PARALLELISM,
+    )
+
+
+def time_cost(scheme: str, cost: int, samples: int) -> dict:
+    handler = hasher(scheme, cost)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.hash("correct horse battery staple")
+        timings.append(time.perf_counter() - started)
+    return {
+        "cost": cost,
+        "samples": samples,
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+    }
+
+
+def run(args) -> dict:
+    results = []
+    for cost in COST_RANGES[args.scheme]:
+        if args.min_cost is not None and cost < args.min_cost:
+            continue
+        result = time_cost(args.scheme, cost, args.samples)
+        results.append(result)
+        # Stop once a cost is over the target: the next ones only take longer.
+        if result["median_ms"] > args.target_ms:
+            break
+
+    within_target = [result for result in results if result["median_ms"] <= args.target_ms]
+    chosen = within_target[-1] if within_target else results[0]
+    return {
+        "meta": {**run_metadata(), "config": vars(args)},
+        "results": results,
+        "recommended": {
+            "setting": COST_SETTINGS[args.scheme],
+            "value": chosen["cost"],
+            "median_ms": chosen["median_ms"],
+            "within_target": bool(within_target),
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", choices=SCHEMES, default="bcrypt")
+    parser.add_argument("--target-ms", type=float, default=250.0, help="hash time to stay under")
+    parser.add_argument("--samples", type=int, default=5, help="hashes timed per cost")
+    parser.add_argument("--min-cost", type=int, help="first cost to time (default: the scheme's minimum)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    configure_environment()
+    write_report(run(args), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
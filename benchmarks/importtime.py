@@ -0,0 +1,111 @@
+"""
+Import-time benchmark for the API.
+
+Imports ``main`` in fresh interpreters with ``python -X importtime`` and
+fails when the median cumulative import time goes over the budget, or when
+one of the subsystems that should only load on first use is imported at
+startup.
+
+Usage (from the repository root):
+    python -m benchmarks.importtime --runs 5 --budget-ms 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Subsystems that must not be imported just to register routes.
+LAZY_MODULES = [
+    "celery",
+    "kombu",
+    "fastapi_mail",
+    "aiosmtplib",
+    "passlib",
+    "itsdangerous",
+    "asyncpg",
+]
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """
+    Parse the ``-X importtime`` output.
+
+    Returns:
+        dict: module name -> (self microseconds, cumulative microseconds)
+    """
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        timings[parts[2].strip()] = (int(parts[0]), int(parts[1]))
+    return timings
+
+
+def run_once(module: str) -> dict[str, tuple[int, int]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": ""},
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"importing {module} failed")
+    return parse_importtime(proc.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", 2000)))
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules to report")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    # The first run warms the bytecode cache and is not counted.
+    run_once(args.module)
+    runs = [run_once(args.module) for _ in range(args.runs)]
+
+    totals_ms = [r[args.module][1] / 1000 for r in runs]
+    median_ms = statistics.median(totals_ms)
+    slowest = sorted(runs[-1].items(), key=lambda kv: kv[1][0], reverse=True)[: args.top]
+    eager = sorted(m for m in runs[-1] if m in LAZY_MODULES)
+
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "median_ms": round(median_ms, 1),
+        "min_ms": round(min(totals_ms), 1),
+        "max_ms": round(max(totals_ms), 1),
+        "budget_ms": args.budget_ms,
+        "eagerly_imported": eager,
+        "slowest_self_ms": {m: round(t[0] / 1000, 1) for m, t in slowest},
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {args.module}: median {report['median_ms']}ms "
+              f"(min {report['min_ms']}ms, max {report['max_ms']}ms, budget {args.budget_ms}ms)")
+        print("slowest modules (self time):")
+        for m, ms in report["slowest_self_ms"].items():
+            print(f"  {ms:>8.1f}ms  {m}")
+
+    failed = False
+    if eager:
+        print(f"FAIL: lazily loaded subsystems imported at startup: {', '.join(eager)}", file=sys.stderr)
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"FAIL: import time {median_ms:.1f}ms is over the {args.budget_ms}ms budget", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Load-testing benchmark for the API.
+
+Seeds a database with synthetic users, todo lists and items, then drives
+concurrent traffic against the app in-process through httpx's ASGI
+transport and reports throughput and p50/p95/p99 latency per endpoint as
+JSON. Runs are reproducible for a given ``--seed`` and scale.
+
+toggle_todoitem and complete_todoitem compare checking items off through
+PUT /todoitems/{id} and through the batched PUT /todoitems/{id}/complete;
+their throughput_rps is the toggles per second.
+
+Postgres/Redis are used when their urls are provided; otherwise a local
+SQLite file (needs aiosqlite) and fakeredis stand in for them.
+
+Usage (from the repository root):
+    python -m benchmarks.load --users 50 --lists 200 --items-per-list 20 \\
+        --requests 500 --concurrency 20 --fake-redis --output run.json
+    python -m benchmarks.load ... --compare run.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from .common import configure_environment, run_metadata, summarize, write_report
+
+SCENARIOS = ["list_todolists", "get_todolist", "list_todoitems", "create_todoitem", "toggle_todoitem", "complete_todoitem", "login"]
+
+
+def build_requests(scenario: str, data: dict, prefix: str, rng: random.Random):
+    """
+    Build a factory returning the (method, url, json body, username) of the
+    next request for a scenario. Requests on a list are sent as its owner,
+    the others (username None) as a random user.
+    """
+    def random_list():
+        index = rng.randrange(len(data["list_ids"]))
+        return data["list_ids"][index], data["list_owners"][index]
+
+    def get_todolist():
+        list_id, owner = random_list()
+        return "GET", f"{prefix}/todolists/{list_id}", None, owner
+
+    def create_todoitem():
+        list_id, owner = random_list()
+        return "POST", f"{prefix}/todoitems/", {
+            "name": "benchmark item",
+            "description": "created by the load benchmark",
+            "is_complete": False,
+            "todolist_id": str(list_id),
+        }, owner
+
+    def random_item():
+        index = rng.randrange(len(data["item_ids"]))
+        owner = data["list_owners"][index // (len(data["item_ids"]) // len(data["list_ids"]))]
+        return data["item_ids"][index], owner
+
+    def toggle_todoitem():
+        item_id, owner = random_item()
+        return "PUT", f"{prefix}/todoitems/{item_id}", {"is_complete": rng.random() < 0.5}, owner
+
+    def complete_todoitem():
+        item_id, owner = random_item()
+        return "PUT", f"{prefix}/todoitems/{item_id}/complete", {"is_complete": rng.random() < 0.5}, owner
+
+    if scenario == "list_todolists":
+        return lambda: ("GET", f"{prefix}/todolists/", None, None)
+    if scenario == "get_todolist":
+        return get_todolist
+    if scenario == "list_todoitems":
+        return lambda: ("GET", f"{prefix}/todoitems/", None, None)
+    if scenario == "create_todoitem":
+        return create_todoitem
+    if scenario == "toggle_todoitem":
+        return toggle_todoitem
+    if scenario == "complete_todoitem":
+        return complete_todoitem
+    if scenario == "login":
+        return lambda: ("POST", f"{prefix}/auth/users/login", {
+            "username": rng.choice(data["usernames"]),
+            "password": "benchmark",
+        }, None)
+    raise ValueError(f"unknown scenario: {scenario}")
+
+
+async def run_scenario(client, next_request, headers_for, total: int, concurrency: int) -> dict:
+    """Send ``total`` requests with at most ``concurrency`` in flight"""
+    latencies: list[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, body, username = next_request()
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body, headers=headers_for(username))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run(args) -> dict:
+    import httpx
+    from .common import reset_database, seed, use_fake_redis
+    from src.auth.utils import create_access_token
+    from src.utils.config import settings
+    from main import app
+
+    if args.fake_redis:
+        use_fake_redis()
+
+    rng = random.Random(args.seed)
+    report = {"meta": {**run_metadata(), "config": vars(args)}, "endpoints": {}}
+
+    async with app.router.lifespan_context(app):
+        await reset_database()
+        seed_started = time.perf_counter()
+        data = await seed(args.users, args.lists, args.items_per_list, rng=rng)
+        report["meta"]["seed_seconds"] = round(time.perf_counter() - seed_started, 3)
+
+        tokens = {username: create_access_token(username) for username in data["usernames"]}
+        headers_for = lambda username: {"Authorization": f"Bearer {tokens[username or rng.choice(data['usernames'])]}"}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+            for scenario in args.scenarios:
+                next_request = build_requests(scenario, data, settings.API_PATH_PREFIX, rng)
+                # Warm up connection pools and caches before measuring.
+                await run_scenario(client, next_request, headers_for, args.warmup, args.concurrency)
+                report["endpoints"][scenario] = await run_scenario(
+                    client, next_request, headers_for, args.requests, args.concurrency
+                )
+    return report
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """Relative change of throughput and latency percentiles against a baseline run"""
+    changes = {}
+    for scenario, stats in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(scenario)
+        if not before:
+            continue
+        changes[scenario] = {
+            key: round((stats[key] - before[key]) / before[key] * 100, 1) if before[key] else None
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+        }
+    return changes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="async SQLAlchemy url (default: a local SQLite file)")
+    parser.add_argument("--fake-redis", action="store_true", help="use fakeredis instead of REDIS_HOST")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--lists", type=int, default=100)
+    parser.add_argument("--items-per-list", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=300, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--compare", help="JSON report of a previous run to compare against")
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    report = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as f:
+            report["change_pct"] = compare(report, json.load(f))
+    write_report(report, args.output)
+    return 1 if any(stats["errors"] for stats in report["endpoints"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Queue latency of the Celery email tasks under mixed load.
+
+Enqueues a burst of bulk emails, then paces transactional emails (account
+verification, password reset) over a few seconds, and reports how long
+each kind waited between being enqueued and starting to send. Two setups
+are compared:
+
+- single: every email on one queue, the previous behaviour
+- routed: the task routes of src.utils.celery_tasks, with workers on the
+  transactional queue and others on the bulk queue
+
+The broker is kombu's in-memory transport and the workers run in this
+process. Emails are not sent: the SMTP client is replaced by a stand-in
+taking ``--send-ms`` per email. Rate limits are the configured ones unless
+``--bulk-rate-limit`` is given.
+
+Usage (from the repository root):
+    python -m benchmarks.queues --bulk 200 --transactional 20 --output queues.json
+"""
+import argparse
+import asyncio
+import contextlib
+import sys
+import threading
+import time
+
+from .common import configure_environment, run_metadata, summarize, write_report
+
+SETUPS = ["single", "routed"]
+
+
+class StandInMail:
+    """Records when each email starts sending, by recipient, and takes ``send_ms`` to send it"""
+
+    def __init__(self, send_ms: float):
+        self.send_ms = send_ms
+        self.started: dict[str, float] = {}
+        self.done = threading.Semaphore(0)
+
+    async def send_message(self, message):
+        recipient = str(getattr(message.recipients[0], "email", message.recipients[0]))
+        self.started[recipient.split("@")[0]] = time.perf_counter()
+        await asyncio.sleep(self.send_ms / 1000)
+        self.done.release()
+
+
+def solo_workers(app, count: int, queues: list[str]) -> list:
+    """
+    Embedded workers with the solo pool, one per unit of concurrency. Pool
+    threads of an embedded worker only get their acks through on the next
+    2 s poll of the in-memory broker, which would hide the queueing.
+    """
+    from celery.contrib.testing.worker import start_worker
+
+    return [start_worker(app, pool="solo", perform_ping_check=False, queues=queues) for _ in range(count)]
+
+
+def run_setup(setup: str, args, mail: StandInMail) -> dict:
+    from src.utils.celery_tasks import (
+        BULK_QUEUE, TRANSACTIONAL_QUEUE, celery_app, send_bulk_email, send_email,
+    )
+
+    mail.started.clear()
+    if setup == "single":
+        workers = solo_workers(celery_app, args.concurrency, [BULK_QUEUE])
+        options = {"queue": BULK_QUEUE}
+    else:
+        workers = (
+            solo_workers(celery_app, args.transactional_concurrency, [TRANSACTIONAL_QUEUE])
+            + solo_workers(celery_app, args.concurrency, [BULK_QUEUE])
+        )
+        options = {}
+
+    enqueued = {}
+    with contextlib.ExitStack() as stack:
+        for worker in workers:
+            stack.enter_context(worker)
+        started = time.perf_counter()
+        for i in range(args.bulk):
+            name = f"bulk-{i}"
+            enqueued[name] = time.perf_counter()
+            send_bulk_email.apply_async(([f"{name}@example.com"], "welcome", {}), **options)
+        for i in range(args.transactional):
+            name = f"transactional-{i}"
+            enqueued[name] = time.perf_counter()
+            send_email.apply_async(([f"{name}@example.com"], "verify_email", {"link": "http://localhost"}), **options)
+            time.sleep(args.duration / max(args.transactional, 1))
+
+        deadline = time.monotonic() + args.timeout
+        for _ in range(len(enqueued)):
+            if not mail.done.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                break
+        elapsed = time.perf_counter() - started
+
+    results = {}
+    for kind in ("transactional", "bulk"):
+        names = [name for name in enqueued if name.startswith(kind)]
+        waits = [mail.started[name] - enqueued[name] for name in names if name in mail.started]
+        summary = summarize(waits, errors=len(names) - len(waits), elapsed=elapsed)
+        summary["queued"] = summary.pop("requests")
+        summary["not_started"] = summary.pop("errors")
+        del summary["throughput_rps"]
+        results[kind] = summary
+    return results
+
+
+def run(args) -> dict:
+    import src.utils.mail
+    from src.utils.celery_tasks import celery_app, send_bulk_email
+
+    mail = StandInMail(args.send_ms)
+    src.utils.mail.get_mail = lambda: mail
+    celery_app.conf.broker_transport_options = {
+        **celery_app.conf.broker_transport_options,
+        "polling_interval": 0.01,
+    }
+    if args.bulk_rate_limit is not None:
+        send_bulk_email.rate_limit = args.bulk_rate_limit or None
+
+    report = {"meta": {**run_metadata(), "config": vars(args)}, "results": {}}
+    for setup in args.setups:
+        report["results"][setup] = run_setup(setup, args, mail)
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--setups", nargs="+", choices=SETUPS, default=SETUPS)
+    parser.add_argument("--bulk", type=int, default=200, help="bulk emails enqueued at once")
+    parser.add_argument("--transactional", type=int, default=20, help="transactional emails paced over --duration")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds to spread the transactional emails over")
+    parser.add_argument("--send-ms", type=float, default=20.0, help="time the stand-in SMTP client takes per email")
+    parser.add_argument("--concurrency", type=int, default=4, help="workers on the bulk queue, or on the only queue")
+    parser.add_argument("--transactional-concurrency", type=int, default=1, help="workers on the transactional queue")
+    parser.add_argument("--bulk-rate-limit", help='e.g. "600/m", "" for none (default: CELERY_BULK_RATE_LIMIT)')
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for the emails to start")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    configure_environment()
+    write_report(run(args), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Micro-benchmark of the hot single-row lookups.
+
+Each lookup is timed with three ways of building its statement, all on the
+same session and rows:
+
+- fresh: build the select on every call, the previous behaviour
+- cached: the service method, executing a statement built once at import
+- uncached: the cached statement with SQLAlchemy's compiled cache turned off,
+  so every call compiles the SQL again
+
+On PostgreSQL the driver side of the cost depends on
+DB_PREPARED_STATEMENT_CACHE_SIZE and DB_PGBOUNCER_TRANSACTION_MODE, set
+them in the environment to compare.
+
+Usage (from the repository root):
+    python -m benchmarks.statements --calls 2000 --output statements.json
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from .common import configure_environment, run_metadata, write_report
+
+LOOKUPS = ["get_todo_item", "get_user_by_username"]
+STRATEGIES = ["fresh", "cached", "uncached"]
+
+
+def lookup(name: str, strategy: str, session, user):
+    """Return a coroutine function running one lookup of a key"""
+    from sqlalchemy.future import select
+    from src.auth.models import User
+    from src.auth.service import UserService
+    from src.todoitems.models import ToDoItem
+    from src.todoitems.service import ToDoItemService
+    from src.todolists.service import accessible_list_ids
+
+    if name == "get_todo_item":
+        if strategy != "fresh":
+            return ToDoItemService(session, user).get_todo_item
+
+        def fresh(key):
+            query = (
+                select(ToDoItem)
+                .where(ToDoItem.id == key)
+                .where(ToDoItem.todolist_id.in_(accessible_list_ids(user.id)))
+                .execution_options(include_archived=True)
+            )
+            return session.execute(query)
+        return fresh
+
+    if strategy != "fresh":
+        return lambda key: UserService().get_user_by_username(session, key)
+    return lambda key: session.execute(select(User).where(User.username == key))
+
+
+async def time_lookup(name: str, strategy: str, keys: list, user) -> dict:
+    from src.db.db_setup import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        if strategy == "uncached":
+            await session.connection(execution_options={"compiled_cache": None})
+        run_once = lookup(name, strategy, session, user)
+        for key in keys[:50]:
+            await run_once(key)
+        timings = []
+        for key in keys:
+            started = time.perf_counter()
+            await run_once(key)
+            timings.append(time.perf_counter() - started)
+            session.expunge_all()
+    timings.sort()
+    return {
+        "calls": len(timings),
+        "mean_us": round(sum(timings) / len(timings) * 1e6, 1),
+        "p50_us": round(timings[len(timings) // 2] * 1e6, 1),
+        "p99_us": round(timings[int(len(timings) * 0.99)] * 1e6, 1),
+    }
+
+
+async def run(args) -> dict:
+    from sqlalchemy.future import select
+    from .common import reset_database, seed
+    from src.auth.models import User
+    from src.db.db_setup import AsyncSessionLocal, dispose_engine, engine_options, get_engine
+    from src.utils.config import settings
+
+    await reset_database()
+    data = await seed(users=args.users, lists=args.users, items_per_list=args.items_per_list)
+    async with AsyncSessionLocal() as session:
+        owner = (await session.execute(select(User).where(User.username == data["list_owners"][0]))).scalar_one()
+    # Items of the first list, so every lookup passes the access check.
+    item_ids = data["item_ids"][:args.items_per_list]
+
+    rng = random.Random(0)
+    keys = {
+        "get_todo_item": [rng.choice(item_ids) for _ in range(args.calls)],
+        "get_user_by_username": [rng.choice(data["usernames"]) for _ in range(args.calls)],
+    }
+    options = engine_options(settings.POSTGRES_URL)
+    report = {
+        "meta": {
+            **run_metadata(),
+            "config": vars(args),
+            "engine_options": {key: str(value) for key, value in options.items()},
+        },
+        "results": {},
+    }
+    get_engine()
+    for name in args.lookups:
+        report["results"][name] = {}
+        for strategy in args.strategies:
+            report["results"][name][strategy] = await time_lookup(name, strategy, keys[name], owner)
+    await dispose_engine()
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="async SQLAlchemy url (default: a local SQLite file)")
+    parser.add_argument("--lookups", nargs="+", choices=LOOKUPS, default=LOOKUPS)
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=STRATEGIES)
+    parser.add_argument("--calls", type=int, default=2000, help="timed calls per lookup and strategy")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--items-per-list", type=int, default=100)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    write_report(asyncio.run(run(args)), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
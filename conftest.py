@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+import pytest
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """
+    The FastAPI app on a throwaway SQLite database.
+    Settings are read from the environment when ``src`` is first imported,
+    so nothing from the app is imported before this fixture runs.
+    """
+    pytest.importorskip("fakeredis")
+    from benchmarks.common import configure_environment
+
+    configure_environment(f"sqlite+aiosqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}")
+    from main import app
+
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """
+    A TestClient on an empty database and a fresh in-process redis, signed
+    in as a verified admin
+    """
+    from fakeredis import FakeAsyncRedis
+    from fastapi.testclient import TestClient
+    from benchmarks.common import reset_database
+    from src.db import redis
+
+    async def setup():
+        # Created here so the client is bound to this TestClient's event loop.
+        redis.token_blocklist = FakeAsyncRedis()
+        await reset_database()
+
+    with TestClient(app, base_url="http://localhost") as client:
+        client.portal.call(setup)
+        client.headers.update(_create_user(client, "admin", role="admin"))
+        yield client
+
+
+@pytest.fixture
+def create_user(client):
+    """
+    Add a verified user, returning the headers that sign in as them
+
+        def test_share(client, create_user):
+            headers = create_user("bob")
+            client.get("/api/v1/todolists/", headers=headers)
+    """
+    return lambda username, role="user": _create_user(client, username, role)
+
+
+def _create_user(client, username: str, role: str = "user") -> dict[str, str]:
+    from src.auth.models import User
+    from src.auth.utils import create_access_token, get_password_hash
+    from src.db.db_setup import AsyncSessionLocal
+
+    async def add():
+        async with AsyncSessionLocal() as session:
+            session.add(User(
+                username=username, email=f"{username}@example.com", password=get_password_hash("password"),
+                first_name=username, last_name="Test", role=role, is_verified=True, is_active=True,
+            ))
+            await session.commit()
+
+    client.portal.call(add)
+    return {"Authorization": f"Bearer {create_access_token(username)}"}
+
+
+@pytest.fixture
+def safety_window(monkeypatch):
+    """Set SYNC_SAFETY_WINDOW_SECONDS, none by default so changes sync at once"""
+    from src.utils.config import settings
+
+    monkeypatch.setattr(settings, "SYNC_SAFETY_WINDOW_SECONDS", 0)
+    return lambda seconds: monkeypatch.setattr(settings, "SYNC_SAFETY_WINDOW_SECONDS", seconds)
+
+
+@pytest.fixture
+def assert_max_queries():
+    """
+    Fail the test when a block runs more SQL statements than allowed.
+
+        def test_read_todo_lists(client, assert_max_queries):
+            with assert_max_queries(2):
+                client.get("/api/v1/todolists/")
+    """
+    from src.db.instrumentation import count_queries
+
+    @contextmanager
+    def checker(limit: int):
+        with count_queries(all_contexts=True) as stats:
+            yield stats
+        assert stats.count <= limit, (
+            f"expected at most {limit} queries, {stats.count} were executed:\n" + "\n".join(stats.statements)
+        )
+    return checker
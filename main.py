@@ -1,20 +1,41 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-# from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager
 from src.todolists.routes import todo_list_router
 from src.todoitems.routes import todo_items_router
 from src.systemcheck.routes import system_health_router
 from src.auth.routes import auth_router
-# from src.db.db_setup import init_db
+from src.changefeed.routes import change_feed_router
+from src.changefeed.service import change_feed
+from src.sync.routes import sync_router
+from src.profiling.routes import profiling_router
+from src.profiling.sampler import RequestProfilerMiddleware
+from src.db.db_setup import get_engine, dispose_engine
+from src.db.redis import get_redis, close_redis
+from src.db.instrumentation import QueryStatsMiddleware
+from src.utils.loop_monitor import loop_monitor, LoopMonitorMiddleware
+from src.utils.compression import CompressionMiddleware
 from src.utils.config import settings
+from src.utils.idempotency import IdempotencyMiddleware
 from src.utils.errors import register_custom_errors
+from src.utils.logs import RequestLoggingMiddleware, configure_logging
 
+configure_logging()
 
-# @asynccontextmanager
-# async def lifespan(app: FastAPI):
-#     await init_db()
-#     yield
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_engine()
+    get_redis()
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    yield
+    if settings.LOOP_MONITOR_ENABLED:
+        await loop_monitor.stop()
+    await change_feed.close()
+    await close_redis()
+    await dispose_engine()
 
 description = """
 A REST API for managing ToDo list and items.
@@ -37,6 +58,7 @@ app = FastAPI(
     openapi_url=f"{settings.API_PATH_PREFIX}/openapi.json",
     docs_url=f"{settings.API_PATH_PREFIX}/docs",
     redoc_url=f"{settings.API_PATH_PREFIX}/redoc",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -52,9 +74,32 @@ app.add_middleware(
     allowed_hosts=["localhost", "127.0.0.1"],
 )
 
+# Added before compression so the stored responses are not compressed.
+app.add_middleware(IdempotencyMiddleware)
+
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+if settings.SQL_INSTRUMENTATION_ENABLED:
+    app.add_middleware(QueryStatsMiddleware)
+
+if settings.LOOP_MONITOR_ENABLED:
+    app.add_middleware(LoopMonitorMiddleware, monitor=loop_monitor)
+
+if settings.PROFILING_ENABLED and settings.PROFILING_REQUEST_TOKEN:
+    app.add_middleware(RequestProfilerMiddleware)
+
+# Outermost, so the records of every other middleware carry the request id.
+app.add_middleware(RequestLoggingMiddleware)
+
 register_custom_errors(app)
 
 app.include_router(todo_items_router, tags=["Todo items"], prefix=settings.API_PATH_PREFIX)
 app.include_router(todo_list_router, tags=["Todo lists"], prefix=settings.API_PATH_PREFIX)
 app.include_router(system_health_router, tags=["Health checks"], prefix=settings.API_PATH_PREFIX)
 app.include_router(auth_router, tags=["Authentication"], prefix=settings.API_PATH_PREFIX)
+app.include_router(change_feed_router, tags=["Change feed"], prefix=settings.API_PATH_PREFIX)
+app.include_router(sync_router, tags=["Sync"], prefix=settings.API_PATH_PREFIX)
+
+if settings.PROFILING_ENABLED:
+    app.include_router(profiling_router, tags=["Profiling"], prefix=settings.API_PATH_PREFIX)
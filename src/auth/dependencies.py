@@ -1,3 +1,4 @@
+import uuid
 from typing import Annotated, List, Any
 from fastapi.security import HTTPBearer
 from fastapi import Request, HTTPException, status, Depends
@@ -5,6 +6,7 @@ from fastapi.security.http import HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.db_setup import get_async_session
 from src.db.redis import is_token_id_in_blocklist
+from src.db.sharding import check_write_fence, pin_shard
 from .service import UserService
 from .models import User
 from .utils import decode_token
@@ -21,6 +23,9 @@ from src.utils.errors import (
 
 user_service: UserService = UserService()
 
+# Methods of the requests that only read, let through while a user is fenced.
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
 
 class TokenBearer(HTTPBearer):
     def __init__(self, auto_error=True):
@@ -28,7 +33,10 @@ class TokenBearer(HTTPBearer):
 
     async def __call__(self, request: Request) -> HTTPAuthorizationCredentials | None:
         creds = await super().__call__(request)
-        token = creds.credentials
+        return await self.validate(creds.credentials)
+
+    async def validate(self, token: str) -> dict:
+        """Check a token the way the Authorization header is checked and return its data"""
         token_data = self.token_valid(token)
 
         if not token_data:
@@ -61,7 +69,7 @@ class TokenBearer(HTTPBearer):
 
 class AccessTokenBearer(TokenBearer):
     def verify_token_data(self, token_data: dict) -> None:
-        if token_data and token_data.get("refresh"):
+        if token_data and (token_data.get("refresh") or token_data.get("purpose")):
             raise AccessTokenRequiredException()
 
 
@@ -71,14 +79,43 @@ class RefreshTokenBearer(TokenBearer):
             raise RefreshTokenRequiredException()
 
 
+class FeedTokenBearer(TokenBearer):
+    def verify_token_data(self, token_data: dict) -> None:
+        if token_data and token_data.get("purpose") != "feed":
+            raise InvalidTokenException()
+
+
+async def _get_token_user(token_details: dict, session: AsyncSession) -> User | None:
+    """
+    Load the user of a token and route the rest of the request to their
+    shard. Tokens carrying the user id are looked up on that shard only.
+    """
+    username = token_details.get("sub")
+    if token_details.get("user_id"):
+        try:
+            user_id = uuid.UUID(token_details["user_id"])
+        except ValueError:
+            raise InvalidTokenDataException()
+        user = await user_service.get_user_by_id(session=session, id=user_id)
+        user = user if user is not None and user.username == username else None
+    else:
+        user = await user_service.get_user_by_username(session=session, username=username)
+    if user is not None:
+        pin_shard(user.id)
+    return user
+
+
 async def get_current_user(
         token_details: Annotated[dict, Depends(AccessTokenBearer())],
+        request: Request,
         session: AsyncSession = Depends(get_async_session)
 ):
     """
-    Get the current authenticated user making a request.
+    Get the current authenticated user making a request. Requests that
+    write are refused while the user's rows move to another shard.
     Args:
         token: str
+        request: Request
         session: AsyncSession
 
     Returns:
@@ -88,9 +125,11 @@ async def get_current_user(
     if not username:
         raise InvalidTokenDataException()
     
-    user = await user_service.get_user_by_username(session=session, username=username)
+    user = await _get_token_user(token_details, session)
     if not user:
         raise InvalidTokenDataException()
+    if request.method not in READ_METHODS:
+        await check_write_fence(user.id)
     return user
 
 async def get_current_active_user(current_user: Annotated[User, Depends(get_current_user)], request: Request):
@@ -108,6 +147,48 @@ async def get_current_active_user(current_user: Annotated[User, Depends(get_curr
     return current_user
 
 
+async def get_user_from_access_token(token: str, session: AsyncSession) -> User:
+    """
+    Get the active user of an access token checked outside of a dependency,
+    e.g. by a streaming route that must not hold a session while it runs.
+    Args:
+        token: str
+        session: AsyncSession
+
+    Returns:
+        A user: User
+    """
+    return await _get_active_token_user(await AccessTokenBearer().validate(token), session)
+
+
+async def get_user_from_feed_token(token: str, list_id: uuid.UUID, session: AsyncSession) -> User:
+    """
+    Get the active user of a feed token, which comes in the query string of
+    a WebSocket or an EventSource stream since browsers can't add headers
+    to those. The token must have been issued for the list.
+    Args:
+        token: str
+        list_id: uuid.UUID
+        session: AsyncSession
+
+    Returns:
+        A user: User
+    """
+    token_details = await FeedTokenBearer().validate(token)
+    if token_details.get("list_id") != str(list_id):
+        raise InvalidTokenDataException()
+    return await _get_active_token_user(token_details, session)
+
+
+async def _get_active_token_user(token_details: dict, session: AsyncSession) -> User:
+    user = await _get_token_user(token_details, session) if token_details.get("sub") else None
+    if not user:
+        raise InvalidTokenDataException()
+    if not user.is_active:
+        raise InactiveUSerException()
+    return user
+
+
 class RoleChecker:
     def __init__(self, allowed_roles: List[str]) -> None:
         self.allowed_roles = allowed_roles
@@ -1,12 +1,15 @@
 import fastapi
+import uuid
+import logging
 from datetime import timedelta, datetime, timezone
 from typing import Union, List, Annotated
-from fastapi import Depends, HTTPException, status
+from fastapi import BackgroundTasks, Depends, Header, HTTPException, status
 from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.db_setup import get_async_session
 from src.db.redis import add_token_id_to_blocklist
-from .service import UserService
+from src.db.sharding import sharding_enabled
+from .service import UserService, rehash_password
 from .schemas import (
     UserSignUp, UserExist, User, 
     Token, UserLogin, EmailModel, 
@@ -14,11 +17,11 @@ from .schemas import (
     UserUpdate, AdminSignUp,
 )
 from .utils import (
-    create_access_token, create_refresh_token, decode_url_safe_token, get_password_hash, send_user_verification_email, send_password_reset_email,
+    create_access_token, create_refresh_token, decode_url_safe_token, get_password_hash, password_needs_rehash, send_user_verification_email, send_password_reset_email,
 )
 from .dependencies import AccessTokenBearer, RefreshTokenBearer, RoleChecker
 from src.utils.config import settings
-from src.utils.celery_tasks import send_email
+from src.utils.email_templates import preferred_locale
 from src.utils.errors import (
     InvalidCredentialsException,
     InvalidTokenException,
@@ -27,10 +30,12 @@ from src.utils.errors import (
     PasswordsMismatchException,
     UserInactiveOrNotFoundException,
     InternalServerErrorException,
+    UserAlreadyExistsException,
 )
 
 
 auth_router = fastapi.APIRouter(prefix="/auth")
+logger = logging.getLogger(__name__)
 access_token_bearer: AccessTokenBearer = AccessTokenBearer()
 refresh_token_bearer: RefreshTokenBearer = RefreshTokenBearer()
 user_service: UserService = UserService()
@@ -44,6 +49,8 @@ async def read_users(
     _ = Depends(access_token_bearer),
     allowed_admin: User = Depends(RoleChecker(["admin"]))
 ):
+    if sharding_enabled():
+        return await user_service.get_users_across_shards(offset=offset, limit=limit)
     return await user_service.get_users(session=session, offset=offset, limit=limit)
 
 @auth_router.get("/users/profile", response_model=User, status_code=status.HTTP_200_OK)
@@ -104,13 +111,15 @@ async def refresh_access_token(
     if not expiry_time or not user_name:
         raise InvalidTokenException()
     if datetime.fromtimestamp(expiry_time).replace(tzinfo=timezone.utc) > datetime.now(timezone.utc):
-        new_access_token = create_access_token(user_name, expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+        new_access_token = create_access_token(
+            user_name, expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES), user_id=token_details.get("user_id")
+        )
         return JSONResponse(content={"access_token": new_access_token})
     
     raise InvalidTokenException()
 
 @auth_router.get("/users/{id}", response_model=User, status_code=status.HTTP_200_OK)
-async def get_user(id: str, _: Annotated[User, Depends(RoleChecker(["admin"]))], session: AsyncSession = Depends(get_async_session)):
+async def get_user(id: uuid.UUID, _: Annotated[User, Depends(RoleChecker(["admin"]))], session: AsyncSession = Depends(get_async_session)):
     existing_user = await user_service.get_user_by_id(session=session, id=id)
     if not existing_user:
         raise ResourceNotFoundException()
@@ -139,28 +148,26 @@ async def verify_user_account(token: str, session: AsyncSession = Depends(get_as
     )
 
 @auth_router.post("/send-mail", status_code=status.HTTP_200_OK)
-async def send_mail(emails: EmailModel):
+async def send_mail(emails: EmailModel, accept_language: str | None = Header(default=None)):
+    from src.utils.celery_tasks import send_bulk_email
+
     try:
         emails = emails.addresses
-        html = "<h1>Welcome to ToDO API</h1>"
-        subject="Welcome"
-        send_email.delay(emails, subject, html)
+        send_bulk_email.delay(emails, "welcome", {}, preferred_locale(accept_language))
         return {"message": "email sent successfully"}
-    except Exception as e:
-        print("===================================")
-        print(f"Request processing error: {str(e)}")
-        print("===================================")
+    except Exception:
+        logger.exception("request processing error")
         raise InternalServerErrorException()
 
 @auth_router.post("/users/signup", response_model=Union[UserSignUpResponse, UserExist], status_code=status.HTTP_201_CREATED)
-async def user_sign_up(user: UserSignUp, session: AsyncSession = Depends(get_async_session)):
+async def user_sign_up(user: UserSignUp, session: AsyncSession = Depends(get_async_session), accept_language: str | None = Header(default=None)):
     results = await user_service.create_user(session=session, user=user)
     if not results:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="user sign up has failed, try again")
     if isinstance(results, UserExist):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=results.model_dump())
     
-    send_user_verification_email(email=user.email)
+    send_user_verification_email(email=user.email, locale=preferred_locale(accept_language))
 
     return {
         "message": "account created! Check email to verify your account.",
@@ -183,19 +190,22 @@ async def register_admin_user(admin: AdminSignUp, _: Annotated[User, Depends(Rol
     }
 
 @auth_router.post("/users/login", response_model=Token, status_code=status.HTTP_200_OK)
-async def user_login(login_data: UserLogin, session: AsyncSession = Depends(get_async_session)):
+async def user_login(login_data: UserLogin, background_tasks: BackgroundTasks, session: AsyncSession = Depends(get_async_session)):
     results = await user_service.authenticate_user(session=session, username=login_data.username, password=login_data.password)
     if not results:
         raise InvalidCredentialsException()
+    if password_needs_rehash(results.password):
+        # upgrade the hash to the configured scheme and cost after responding
+        background_tasks.add_task(rehash_password, results.id, login_data.password, results.password)
     return Token(
-        access_token=create_access_token(results.username, expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)),
-        refresh_token=create_refresh_token(results.username, expires_delta=timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES)),
+        access_token=create_access_token(results.username, expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES), user_id=results.id),
+        refresh_token=create_refresh_token(results.username, expires_delta=timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES), user_id=results.id),
         token_type="bearer"
     )
 
 @auth_router.post("/users/password-reset")
-async def password_reset_request(email_data: PasswordResetRequest):
-    send_password_reset_email(email=email_data.email)
+async def password_reset_request(email_data: PasswordResetRequest, accept_language: str | None = Header(default=None)):
+    send_password_reset_email(email=email_data.email, locale=preferred_locale(accept_language))
 
     return JSONResponse(
         content={
@@ -232,38 +242,41 @@ async def password_reset_request(token: str, password_data: PasswordResetConfirm
     )
 
 @auth_router.put("/users/{id}", response_model=UserSignUpResponse, status_code=status.HTTP_200_OK)
-async def modify_user(id: str, current_user: Annotated[User, Depends(RoleChecker(["admin", "user"]))], update_data: UserUpdate, session: AsyncSession = Depends(get_async_session)):
+async def modify_user(id: uuid.UUID, current_user: Annotated[User, Depends(RoleChecker(["admin", "user"]))], update_data: UserUpdate, session: AsyncSession = Depends(get_async_session)):
     existing_user = await user_service.get_user_by_id(session=session, id=id)
     send_verification_email = False
 
     if not existing_user:
         raise ResourceNotFoundException()
     
-    # check if a new email is being set and if it is unique
+    # a new email must be verified again, its uniqueness is enforced by the
+    # unique constraint when the update is committed
     if update_data.email != existing_user.email:
         send_verification_email = True
-        email_exists = await user_service.get_user_by_email(session=session, email=update_data.email)
-        if email_exists:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, 
-                detail={
-                    "message": "user with the provided data already exist",
-                    "error_code": "CE006"
-                }
-            )
-    results = await user_service.modify_user_logic(
-        session=session,
-        send_verification_email=send_verification_email,
-        existing_user=existing_user,
-        current_user=current_user,
-        update_data=update_data
-    )
+    try:
+        if send_verification_email and sharding_enabled() and await user_service.is_taken(session=session, email=update_data.email):
+            raise UserAlreadyExistsException()
+        results = await user_service.modify_user_logic(
+            session=session,
+            send_verification_email=send_verification_email,
+            existing_user=existing_user,
+            current_user=current_user,
+            update_data=update_data
+        )
+    except UserAlreadyExistsException:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, 
+            detail={
+                "message": "user with the provided data already exist",
+                "error_code": "CE006"
+            }
+        )
     return results
 
 # Add a delete user endpoint
 @auth_router.delete("/users/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user(id: str, current_user: Annotated[User, Depends(RoleChecker(["admin", "user"]))], session: AsyncSession = Depends(get_async_session), token_details=Depends(access_token_bearer)):
-    if current_user.role == "user" and str(current_user.id) != id:
+async def delete_user(id: uuid.UUID, current_user: Annotated[User, Depends(RoleChecker(["admin", "user"]))], session: AsyncSession = Depends(get_async_session), token_details=Depends(access_token_bearer)):
+    if current_user.role == "user" and current_user.id != id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
             detail={
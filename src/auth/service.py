@@ -1,6 +1,16 @@
+import heapq
+import logging
+import uuid
+from itertools import islice
 from typing import Union
+from sqlalchemy import bindparam, delete, insert, or_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from starlette.concurrency import run_in_threadpool
+from src.db.db_setup import AsyncSessionLocal
+from src.db.sharding import scatter_gather, sharding_enabled, use_shard, use_user_shard
+from src.utils.errors import UserAlreadyExistsException
 from .models import User
 from .schemas import UserSignUp, UserUpdate, UserExist, AdminSignUp
 from .utils import (
@@ -8,6 +18,46 @@ from .utils import (
     send_user_verification_email,
 )
 
+logger = logging.getLogger(__name__)
+
+# Hot lookups are built once: executing the same statement object reuses its
+# compiled form from the engine cache without rebuilding the cache key.
+GET_USER_BY_ID = select(User).where(User.id == bindparam("id"))
+GET_USER_BY_USERNAME = select(User).where(User.username == bindparam("username"))
+GET_USER_BY_EMAIL = select(User).where(User.email == bindparam("email"))
+TAKEN_USERNAME_OR_EMAIL = select(User.id).where(
+    or_(User.username == bindparam("username"), User.email == bindparam("email"))
+).limit(1)
+
+
+async def rehash_password(user_id: uuid.UUID, password: str, old_hash: str):
+    """
+    Replace a user's password hash with one of the configured scheme and
+    cost, with its own session. Run after the login response is sent: the
+    hash is computed in a thread pool and only written when the stored
+    hash was not changed in the meantime, e.g. by a password reset.
+
+    Args:
+        user_id (uuid.UUID): the id of the user who just logged in
+        password (str): the password they logged in with
+        old_hash (str): the hash it was verified against
+    """
+    new_hash = await run_in_threadpool(get_password_hash, password)
+    query = (
+        update(User)
+        .where(User.id == user_id, User.password == old_hash)
+        .values(password=new_hash)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        with use_user_shard(user_id):
+            async with AsyncSessionLocal() as session:
+                await session.execute(query)
+                await session.commit()
+    except Exception as e:
+        logger.warning("could not upgrade the password hash of user %s: %s", user_id, e)
+
+
 class UserService:
     """
     This class provides methods to create, read, update, and delete users
@@ -16,18 +66,18 @@ class UserService:
     def __init__(self):
         pass
 
-    async def get_user_by_id(self, session: AsyncSession, id: str):
+    async def get_user_by_id(self, session: AsyncSession, id: uuid.UUID):
         """
         Get a user by their id
 
         Args:
-            id (str): provided user id
+            id (uuid.UUID): provided user id
 
         Returns:
             User: an existing user
         """
-        query = select(User).where(User.id == id)
-        results = await session.execute(query)
+        with use_user_shard(id):
+            results = await session.execute(GET_USER_BY_ID, {"id": id})
         return results.scalars().first()
     
     async def get_user_by_username(self, session: AsyncSession, username: str):
@@ -40,8 +90,8 @@ class UserService:
         Returns:
             User: an existing user
         """
-        query = select(User).where(User.username == username)
-        results = await session.execute(query)
+        with use_shard(None):
+            results = await session.execute(GET_USER_BY_USERNAME, {"username": username})
         return results.scalars().first()
     
     async def get_user_by_email(self, session: AsyncSession, email: str):
@@ -54,8 +104,8 @@ class UserService:
         Returns:
             User: an existing user
         """
-        query = select(User).where(User.email == email)
-        results = await session.execute(query)
+        with use_shard(None):
+            results = await session.execute(GET_USER_BY_EMAIL, {"email": email})
         return results.scalars().first()
     
     async def create_user(self, session: AsyncSession, user: Union[UserSignUp, AdminSignUp]):
@@ -68,33 +118,49 @@ class UserService:
         Returns:
             User: the newly created user
         """
-        username_exists = await self.get_user_by_username(session, user.username)
-        email_exists = await self.get_user_by_email(session, user.email)
-        
-        if username_exists:
-            return UserExist(message="user with the provided data already exist", error_code="CE006")
-        
-        if email_exists:
-            return UserExist(message="user with the provided data already exist", error_code="CE006")
-        
+        # The unique constraints on username and email reject duplicates, so
+        # signing up is a single INSERT ... RETURNING, without a racy lookup first.
         hashed_password = get_password_hash(user.password)
-        
-        new_user = User(
+        values = dict(
+            id=uuid.uuid4(),
             username=user.username,
             password=hashed_password,
             email=user.email,
             first_name=user.first_name,
-            last_name=user.last_name
+            last_name=user.last_name,
         )
         if isinstance(user, AdminSignUp):
-            new_user.role=user.role
-            new_user.is_verified=user.is_verified
-        
-        session.add(new_user)
-        await session.commit()
-        await session.refresh(new_user)
+            values.update(role=user.role, is_verified=user.is_verified)
+
+        if sharding_enabled() and await self.is_taken(session, user.username, user.email):
+            return UserExist(message="user with the provided data already exist", error_code="CE006")
+        try:
+            with use_user_shard(values["id"]):
+                results = await session.execute(insert(User).values(**values).returning(User))
+            new_user = results.scalar_one()
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            return UserExist(message="user with the provided data already exist", error_code="CE006")
         return new_user
-    
+
+    async def is_taken(self, session: AsyncSession, username: str | None = None, email: str | None = None) -> bool:
+        """
+        Check on every shard if a username or an email is already used. The
+        unique constraints only hold within a shard, so with sharding enabled
+        this is still needed before writing them.
+
+        Args:
+            username (str): the username to check
+            email (str): the email to check
+
+        Returns:
+            bool: True when a user already has either of them
+        """
+        with use_shard(None):
+            results = await session.execute(TAKEN_USERNAME_OR_EMAIL, {"username": username, "email": email})
+        return results.first() is not None
+
     async def authenticate_user(self, session: AsyncSession, username: str, password: str):
         """
         Authenticate/login a user
@@ -106,8 +172,8 @@ class UserService:
         Returns:
             User: authenticated user
         """
-        query = select(User).where(User.username == username)
-        results = await session.execute(query)
+        with use_shard(None):
+            results = await session.execute(GET_USER_BY_USERNAME, {"username": username})
         existing_user = results.scalars().first()
 
         if not existing_user:
@@ -126,6 +192,25 @@ class UserService:
         query = select(User).offset(offset).limit(limit)
         results = await session.execute(query)
         return results.scalars().all()
+
+    async def get_users_across_shards(self, offset: int = 0, limit: int = 100):
+        """
+        Get a page of users when sharding is enabled: every shard returns
+        its first ``offset + limit`` users by creation date and the sorted
+        results are merged
+
+        Returns:
+            list: list of users
+        """
+        query = select(User).order_by(User.created_at, User.id).limit(offset + limit)
+
+        async def fetch(session: AsyncSession):
+            results = await session.execute(query)
+            return results.scalars().all()
+
+        results = await scatter_gather(fetch)
+        merged = heapq.merge(*results.values(), key=lambda user: (user.created_at, str(user.id)))
+        return list(islice(merged, offset, offset + limit))
     
     async def update_user(self, session: AsyncSession, user: User, update_data: dict):
         """
@@ -136,11 +221,16 @@ class UserService:
             update_data (dict): provided data ti update a user
 
         Returns:
-            User: an updated user object
+            User: an updated user object, UserAlreadyExistsException is raised
+            when the new email belongs to another user
         """
         for k, v in update_data.items():
             setattr(user, k, v)
-        await session.commit()
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            raise UserAlreadyExistsException()
         return user
     
     async def modify_user_logic(self, session: AsyncSession, send_verification_email: bool, existing_user: User, current_user: User, update_data: UserUpdate):
@@ -165,19 +255,32 @@ class UserService:
             "user": existing_user
         }
     
-    async def delete_user(self, session: AsyncSession, id: str):
+    async def delete_user(self, session: AsyncSession, id: uuid.UUID):
         """
-        Delete a user
+        Delete a user. Their lists are deleted first like any deleted list,
+        so the users they were shared with drop them at their next sync and
+        their change feeds end; the rows then go with the user through the
+        ON DELETE CASCADE foreign keys.
 
         Args:
-            id (str): the id of the user to delete
+            id (uuid.UUID): the id of the user to delete
         """
-        query = select(User).where(User.id == id)
-        results = await session.execute(query)
-        existing_user = results.scalars().first()
+        from src.todolists.models import ToDoList
+        from src.todolists.service import ToDoListService
 
-        if not existing_user:
+        query = delete(User).where(User.id == id).returning(User.id).execution_options(synchronize_session=False)
+        with use_user_shard(id):
+            user = await session.get(User, id)
+            if user is None:
+                return {}
+            lists = ToDoListService(session, user)
+            owned = await session.execute(select(ToDoList.id).where(ToDoList.owner_id == id))
+            for list_id in owned.scalars().all():
+                await lists.delete_todo_list(list_id)
+            results = await session.execute(query)
+        deleted_id = results.scalar_one_or_none()
+
+        if not deleted_id:
             return {}
-        await session.delete(existing_user)
         await session.commit()
         return {}
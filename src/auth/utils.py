@@ -1,19 +1,49 @@
 import jwt
 import uuid
 from jwt.exceptions import PyJWTError
+from functools import lru_cache
 from typing import Union, Any
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta, timezone
-from passlib.context import CryptContext
-from itsdangerous import URLSafeTimedSerializer
 from src.utils.config import settings
-from src.utils.celery_tasks import send_email
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_PATH_PREFIX}/auth/login")
 
 
+def password_hash_options(schemes: list[str]) -> dict:
+    """
+    The cost options of each scheme for a CryptContext, from the settings.
+    Args:
+        schemes: list of passlib scheme names
+
+    Returns:
+        dict
+    """
+    options = {}
+    if "bcrypt" in schemes:
+        options["bcrypt__rounds"] = settings.PASSWORD_BCRYPT_ROUNDS
+    if "argon2" in schemes:
+        options["argon2__time_cost"] = settings.PASSWORD_ARGON2_TIME_COST
+        options["argon2__memory_cost"] = settings.PASSWORD_ARGON2_MEMORY_COST
+        options["argon2__parallelism"] = settings.PASSWORD_ARGON2_PARALLELISM
+    return options
+
+@lru_cache
+def get_password_context():
+    """
+    Build the passlib context on first use so that importing this module
+    does not load passlib and the bcrypt backend.
+    New hashes use the first of PASSWORD_HASH_SCHEMES with the configured
+    cost, hashes of another scheme or cost need an update.
+    Returns:
+        CryptContext
+    """
+    from passlib.context import CryptContext
+
+    schemes = settings.PASSWORD_HASH_SCHEMES
+    return CryptContext(schemes=schemes, deprecated="auto", **password_hash_options(schemes))
+
 def verify_password(plain_password: str, hashed_password: str)-> bool:
     """
     Compares provided palin password with a stored hashed password.
@@ -24,25 +54,38 @@ def verify_password(plain_password: str, hashed_password: str)-> bool:
     Returns:
         bool
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_password_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """
-    Creates a bcrypt hashed password.
+    Creates a hashed password with the configured scheme and cost.
     Args:
         password: str
 
     Returns:
         hashed_password: str
     """
-    return pwd_context.hash(password)
+    return get_password_context().hash(password)
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """
+    Whether a stored hash uses a deprecated scheme or another cost than
+    the configured one, and should be replaced at the next login.
+    Args:
+        hashed_password: str
+
+    Returns:
+        bool
+    """
+    return get_password_context().needs_update(hashed_password)
 
-def create_access_token(subject: Union[str, Any], expires_delta: timedelta | None = None, refresh: bool = False) -> str:
+def create_access_token(subject: Union[str, Any], expires_delta: timedelta | None = None, refresh: bool = False, user_id: Any = None) -> str:
     """
     Create a JWT access token.
     Args:
         subject: str/Any
         expires_delta: tomedelta
+        user_id: the user's id, used to route requests to their shard
 
     Returns:
         str
@@ -53,15 +96,19 @@ def create_access_token(subject: Union[str, Any], expires_delta: timedelta | Non
         expires = datetime.now(timezone.utc) + timedelta(minutes=5)
 
     to_encode = {"token_id": str(uuid.uuid4()), "exp": expires, "sub": str(subject), "refresh": refresh}
+    if user_id is not None:
+        # Lets the request be routed to the user's shard without a lookup.
+        to_encode["user_id"] = str(user_id)
     encoded_jwt = jwt.encode(payload=to_encode, key=settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def create_refresh_token(subject: Union[str, Any], expires_delta: timedelta | None = None, refresh: bool = True) -> str:
+def create_refresh_token(subject: Union[str, Any], expires_delta: timedelta | None = None, refresh: bool = True, user_id: Any = None) -> str:
     """
     Create a JWT refresh token.
     Args:
         subject: str/Any
         expires_delta: tomedelta
+        user_id: the user's id, used to route requests to their shard
 
     Returns:
         str
@@ -72,6 +119,32 @@ def create_refresh_token(subject: Union[str, Any], expires_delta: timedelta | No
         expires = datetime.now(timezone.utc) + timedelta(minutes=10)
 
     to_encode = {"token_id": str(uuid.uuid4()), "exp": expires, "sub": str(subject), "refresh": refresh}
+    if user_id is not None:
+        # Lets the request be routed to the user's shard without a lookup.
+        to_encode["user_id"] = str(user_id)
+    encoded_jwt = jwt.encode(payload=to_encode, key=settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return encoded_jwt
+
+def create_feed_token(subject: Union[str, Any], list_id: Any, user_id: Any = None) -> str:
+    """
+    Create a JWT that only opens the change feed of one list. EventSource
+    and WebSocket clients have to put it in the URL, where access and proxy
+    logs keep it, so it expires after FEED_TOKEN_EXPIRE_SECONDS.
+    Args:
+        subject: str/Any
+        list_id: the list whose change feed it opens
+        user_id: the user's id, used to route requests to their shard
+
+    Returns:
+        str
+    """
+    expires = datetime.now(timezone.utc) + timedelta(seconds=settings.FEED_TOKEN_EXPIRE_SECONDS)
+    to_encode = {
+        "token_id": str(uuid.uuid4()), "exp": expires, "sub": str(subject), "refresh": False,
+        "purpose": "feed", "list_id": str(list_id),
+    }
+    if user_id is not None:
+        to_encode["user_id"] = str(user_id)
     encoded_jwt = jwt.encode(payload=to_encode, key=settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
@@ -87,39 +160,35 @@ def decode_token(token: str):
         error_data = {"error": str(e)}
         return error_data
     
-serializer = URLSafeTimedSerializer(
-    secret_key=settings.SECRET_KEY,
-    salt="email-verification"
-)
+@lru_cache
+def get_url_safe_serializer():
+    from itsdangerous import URLSafeTimedSerializer
+
+    return URLSafeTimedSerializer(
+        secret_key=settings.SECRET_KEY,
+        salt="email-verification"
+    )
 
 def create_url_safe_token(data: dict):
-    return serializer.dumps(data)
+    return get_url_safe_serializer().dumps(data)
 
 def decode_url_safe_token(token: str):
     try:
-        token_data = serializer.loads(token)
+        token_data = get_url_safe_serializer().loads(token)
         return token_data
     except Exception as e:
         return {"error": str(e)}
 
-def send_user_verification_email(email: str):
+def send_user_verification_email(email: str, locale: str | None = None):
+    from src.utils.celery_tasks import send_email
+
     token = create_url_safe_token({"email": email})
     link = f"http://{settings.API_BASE_URL}{settings.API_PATH_PREFIX}/auth/users/verify/{token}"
-    html_message = f"""
-    <h1>Verify your Email</h1>
-    <p>Please click this <a href="{link}">link</a> to verify your email.</p>
-    """
-    subject = "Verify Email"
-    
-    send_email.delay([email], subject, html_message)
+    send_email.delay([email], "verify_email", {"link": link}, locale)
+
+def send_password_reset_email(email: str, locale: str | None = None):
+    from src.utils.celery_tasks import send_email
 
-def send_password_reset_email(email: str):
     token = create_url_safe_token({"email": email})
     link = f"http://{settings.API_BASE_URL}{settings.API_PATH_PREFIX}/auth/users/password-reset-confirm/{token}"
-    html_message = f"""
-    <h1>Reset Your Password</h1>
-    <p>Please click this <a href="{link}">link</a> to reset your password.</p>
-    """
-    subject = "Password Reset Request"
-    
-    send_email.delay([email], subject, html_message)
+    send_email.delay([email], "password_reset", {"link": link}, locale)
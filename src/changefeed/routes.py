@@ -0,0 +1,163 @@
+import re
+import uuid
+from contextlib import aclosing
+import fastapi
+from fastapi import Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.auth.dependencies import get_current_active_user, get_user_from_access_token, get_user_from_feed_token
+from src.auth.models import User
+from src.auth.utils import create_feed_token
+from src.db.db_setup import AsyncSessionLocal, get_async_session, get_engine
+from src.todolists.service import ToDoListService
+from src.utils.config import settings
+from src.utils.errors import InvalidTokenException, ResourceNotFoundException, ToDOApiException
+from .schemas import ChangeEvent, FeedToken
+from .service import change_feed
+
+change_feed_router = fastapi.APIRouter(prefix="/todolists")
+
+EVENT_ID_PATTERN = re.compile(r"^\d+(-\d+)?$")
+
+# Events after which a subscriber may have lost access to the list.
+REVOKING_EVENTS = {"list.unshared", "list.deleted"}
+
+
+def _resume_from(*candidates: str | None) -> str | None:
+    for event_id in candidates:
+        if event_id:
+            if not EVENT_ID_PATTERN.match(event_id):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail={"message": "invalid event id", "error_code": "CE019"}
+                )
+            return event_id
+    return None
+
+
+async def _authorize(list_id: uuid.UUID, access_token: str | None = None, feed_token: str | None = None) -> User:
+    """
+    Check that the user of an access token, or of a feed token issued for
+    the list, can access the list. The session is only held for the check,
+    not for the lifetime of the stream.
+
+    Returns:
+        User: the token's user
+    """
+    if not access_token and not feed_token:
+        raise InvalidTokenException()
+    get_engine()
+    async with AsyncSessionLocal() as session:
+        if access_token:
+            user = await get_user_from_access_token(access_token, session)
+        else:
+            user = await get_user_from_feed_token(feed_token, list_id, session)
+        if not await ToDoListService(session, user).has_access(list_id):
+            raise ResourceNotFoundException()
+    return user
+
+
+async def _still_authorized(user: User, event: ChangeEvent) -> bool:
+    """
+    Whether a subscriber can still access the list after an event. Access
+    is only checked again after the events that can revoke it, so a stream
+    ends once the list is deleted or no longer shared with its user.
+    """
+    if event.type not in REVOKING_EVENTS:
+        return True
+    if event.type == "list.unshared" and event.data.get("user_id") != str(user.id):
+        return True
+    async with AsyncSessionLocal() as session:
+        return await ToDoListService(session, user).has_access(event.list_id)
+
+
+@change_feed_router.post("/{id}/feed-token", response_model=FeedToken, status_code=status.HTTP_200_OK)
+async def create_todo_list_feed_token(
+    id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Token opening the change feed of the list for FEED_TOKEN_EXPIRE_SECONDS,
+    for the EventSource and WebSocket clients that can't send the access
+    token in a header. Streams already open are not cut when it expires.
+    """
+    if not await ToDoListService(session, current_user).has_access(id):
+        raise ResourceNotFoundException()
+    return {
+        "feed_token": create_feed_token(current_user.username, id, user_id=current_user.id),
+        "expires_in": settings.FEED_TOKEN_EXPIRE_SECONDS,
+    }
+
+@change_feed_router.get("/{id}/events", status_code=status.HTTP_200_OK)
+async def stream_todo_list_events(
+    id: uuid.UUID,
+    last_event_id: str | None = Query(default=None),
+    last_event_id_header: str | None = Header(default=None, alias="Last-Event-ID"),
+    feed_token: str | None = Query(default=None),
+    authorization: str | None = Header(default=None),
+):
+    """
+    Server-Sent Events stream of the item and list changes of a todo list.
+    Reconnecting with ``Last-Event-ID`` (sent automatically by EventSource)
+    replays the changes that were missed; that is also how a client whose
+    stream was closed for falling behind catches up. EventSource can't send
+    headers, so a ``feed_token`` from POST /todolists/{id}/feed-token is
+    accepted in the query string instead; once it has expired a reconnecting
+    client needs a new one.
+    """
+    resume_from = _resume_from(last_event_id_header, last_event_id)
+    scheme, _, bearer_token = (authorization or "").partition(" ")
+    if scheme.lower() == "bearer" and bearer_token:
+        user = await _authorize(id, access_token=bearer_token)
+    else:
+        user = await _authorize(id, feed_token=feed_token)
+
+    async def event_source():
+        # Closed explicitly so the subscription ends with the stream.
+        async with aclosing(change_feed.subscribe(id, last_event_id=resume_from)) as events:
+            async for event in events:
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {event.id}\nevent: {event.type}\ndata: {event.model_dump_json()}\n\n"
+                if not await _still_authorized(user, event):
+                    return
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@change_feed_router.websocket("/{id}/ws")
+async def todo_list_events_websocket(
+    websocket: WebSocket, id: uuid.UUID, last_event_id: str | None = None, feed_token: str | None = None
+):
+    """
+    WebSocket variant of the change feed, one JSON message per change,
+    opened with a ``feed_token`` from POST /todolists/{id}/feed-token
+    """
+    if last_event_id and not EVENT_ID_PATTERN.match(last_event_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    try:
+        user = await _authorize(id, feed_token=feed_token)
+    except (ToDOApiException, HTTPException):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    try:
+        async with aclosing(change_feed.subscribe(id, last_event_id=last_event_id)) as events:
+            async for event in events:
+                if event is None:
+                    await websocket.send_json({"type": "keep-alive"})
+                    continue
+                await websocket.send_text(event.model_dump_json())
+                if not await _still_authorized(user, event):
+                    await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                    return
+        # The subscriber fell behind: reconnect with the last event id.
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except WebSocketDisconnect:
+        pass
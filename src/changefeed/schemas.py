@@ -0,0 +1,15 @@
+import uuid
+from typing import Any
+from pydantic import BaseModel
+
+
+class ChangeEvent(BaseModel):
+    id: str
+    type: str
+    list_id: uuid.UUID
+    data: dict[str, Any]
+
+
+class FeedToken(BaseModel):
+    feed_token: str
+    expires_in: int
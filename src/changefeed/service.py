@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import AsyncIterator
+from src.db.redis import get_redis
+from src.utils.config import settings
+from .schemas import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+
+def stream_key(list_id: uuid.UUID | str) -> str:
+    return f"todolist:{list_id}:events"
+
+
+def _parse_event_id(event_id: str) -> tuple[int, int]:
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _to_event(list_id: uuid.UUID | str, event_id: bytes | str, fields: dict) -> ChangeEvent:
+    decode = lambda v: v.decode() if isinstance(v, bytes) else v
+    fields = {decode(k): decode(v) for k, v in fields.items()}
+    return ChangeEvent(id=decode(event_id), type=fields["type"], list_id=list_id, data=json.loads(fields["data"]))
+
+
+async def publish_change(list_id: uuid.UUID | str, event_type: str, data: dict) -> dict:
+    """
+    Append a change to the list's Redis stream. Every worker with
+    subscribers for the list picks it up from there. The list's cached
+    document is dropped in the same round trip.
+
+    Args:
+        list_id (uuid.UUID): the list the change belongs to
+        event_type (str): e.g. "item.created", "list.deleted"
+        data (dict): JSON serializable payload
+
+    Returns:
+        dict: the event id, or the error when redis is unavailable
+    """
+    from src.todolists.cache import invalidate_document
+
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            invalidate_document(pipe, list_id)
+            pipe.xadd(
+                stream_key(list_id),
+                {"type": event_type, "data": json.dumps(data, default=str)},
+                maxlen=settings.CHANGE_FEED_MAXLEN,
+                approximate=True,
+            )
+            *_, event_id = await pipe.execute()
+        return {"id": event_id.decode()}
+    except Exception as e:
+        logger.warning("could not publish %s for list %s: %s", event_type, list_id, e)
+        return {"error": str(e)}
+
+
+class ChangeFeedHub:
+    """
+    Per-worker fan-out of list change events.
+
+    A single task reads every stream that has local subscribers with one
+    blocking XREAD and hands the events to the subscribers' queues, so the
+    number of Redis connections does not grow with the number of clients.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._positions: dict[str, str] = {}
+        self._reader: asyncio.Task | None = None
+
+    async def _register(self, list_id: str, queue: asyncio.Queue):
+        key = stream_key(list_id)
+        # Joined before any await, so concurrent first subscribers of a list
+        # share one set and none of their queues is dropped.
+        first = key not in self._subscribers
+        self._subscribers.setdefault(key, set()).add(queue)
+        if first:
+            # Start from the current end of the stream; anything older is
+            # served to the subscriber from its own backlog read. The stream
+            # is not read until its position is known.
+            try:
+                latest = await get_redis().xrevrange(key, count=1)
+            except Exception:
+                self._unregister(list_id, queue)
+                raise
+            if key in self._subscribers and key not in self._positions:
+                self._positions[key] = latest[0][0].decode() if latest else "0-0"
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+
+    def _unregister(self, list_id: str, queue: asyncio.Queue):
+        key = stream_key(list_id)
+        queues = self._subscribers.get(key)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[key]
+            self._positions.pop(key, None)
+
+    async def _read(self):
+        while self._subscribers:
+            if not self._positions:
+                await asyncio.sleep(settings.CHANGE_FEED_POLL_MS / 1000)
+                continue
+            try:
+                results = await get_redis().xread(dict(self._positions), block=settings.CHANGE_FEED_POLL_MS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("change feed read failed: %s", e)
+                await asyncio.sleep(settings.CHANGE_FEED_POLL_MS / 1000)
+                continue
+            for key, entries in results or []:
+                key = key.decode()
+                if key not in self._subscribers:
+                    continue
+                list_id = key.split(":")[1]
+                for event_id, fields in entries:
+                    event = _to_event(list_id, event_id, fields)
+                    self._positions[key] = event.id
+                    for queue in list(self._subscribers[key]):
+                        try:
+                            queue.put_nowait(event)
+                        except asyncio.QueueFull:
+                            self._drop(list_id, queue)
+                    if key not in self._subscribers:
+                        break
+
+    def _drop(self, list_id: str, queue: asyncio.Queue):
+        """
+        End the stream of a subscriber that fell CHANGE_FEED_QUEUE_SIZE
+        events behind. Its queued events are discarded; the client resumes
+        from the last event it got with Last-Event-ID.
+        """
+        self._unregister(list_id, queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def subscribe(self, list_id: uuid.UUID | str, last_event_id: str | None = None) -> AsyncIterator[ChangeEvent | None]:
+        """
+        Stream the changes of a list. When ``last_event_id`` is given the
+        events after it that are still retained are replayed first, so a
+        reconnecting client does not need to reload the list. The stream
+        ends when the subscriber falls too far behind.
+
+        Yields:
+            ChangeEvent, or None when nothing happened for a heartbeat interval
+        """
+        list_id = str(list_id)
+        # None is queued when the subscriber was dropped for falling behind.
+        queue: asyncio.Queue[ChangeEvent | None] = asyncio.Queue(maxsize=settings.CHANGE_FEED_QUEUE_SIZE)
+        await self._register(list_id, queue)
+        try:
+            last_seen = (0, 0)
+            if last_event_id:
+                backlog = await get_redis().xrange(stream_key(list_id), min=f"({last_event_id}")
+                for event_id, fields in backlog:
+                    event = _to_event(list_id, event_id, fields)
+                    last_seen = _parse_event_id(event.id)
+                    yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.CHANGE_FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is None:
+                    logger.info("change feed subscriber of list %s fell behind, closing its stream", list_id)
+                    return
+                if _parse_event_id(event.id) <= last_seen:
+                    continue
+                last_seen = _parse_event_id(event.id)
+                yield event
+        finally:
+            self._unregister(list_id, queue)
+
+    async def close(self):
+        """Stop the reader task"""
+        self._subscribers.clear()
+        self._positions.clear()
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+
+
+change_feed = ChangeFeedHub()
@@ -1,28 +1,103 @@
+import uuid
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from src.utils.config import settings
 
 
 Base = declarative_base()
 
 # Async configuration
-async_engine = create_async_engine(url=settings.POSTGRES_URL, echo=False, future=True)
+# The engine is created on first use (or in the app lifespan) so that importing
+# the models and routes does not load the database driver.
+async_engine: AsyncEngine | None = None
+# One engine per shard when SHARD_URLS is set, see src/db/sharding.py.
+shard_engines: dict[str, AsyncEngine] = {}
 
-AsyncSessionLocal = sessionmaker(
-    async_engine, class_=AsyncSession, expire_on_commit=False
-)
+AsyncSessionLocal = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+def engine_options(url: str) -> dict:
+    """
+    Statement caching options of an engine.
+
+    SQLAlchemy keeps SQL_COMPILED_CACHE_SIZE compiled statements per engine.
+    asyncpg also prepares every statement on the server and keeps
+    DB_PREPARED_STATEMENT_CACHE_SIZE of them per connection. Behind pgbouncer
+    in transaction mode a connection's prepared statements may live on
+    another server connection. Then the caches are turned off, the
+    statements get unique names and pooling is left to pgbouncer.
+    """
+    options = {"query_cache_size": settings.SQL_COMPILED_CACHE_SIZE}
+    if make_url(url).get_driver_name() != "asyncpg":
+        return options
+    if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+        options["poolclass"] = NullPool
+        options["connect_args"] = {
+            "prepared_statement_cache_size": 0,
+            "statement_cache_size": 0,
+            "prepared_statement_name_func": _unique_statement_name,
+        }
+    else:
+        options["connect_args"] = {"prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE}
+    return options
+
+def _create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(url=url, echo=False, future=True, **engine_options(url))
+    if settings.SQL_INSTRUMENTATION_ENABLED:
+        from .instrumentation import instrument_engine
+        instrument_engine(engine)
+    return engine
+
+def get_engine() -> AsyncEngine:
+    """
+    Get the async engine, creating it and binding the session factory on
+    first use. With sharding enabled this is the engine of the first shard;
+    the session factory spans all of them.
+    """
+    global async_engine
+    if async_engine is None:
+        if settings.SHARD_URLS:
+            from .sharding import configure_sharded_sessions
+            shard_engines.update({shard_id: _create_engine(url) for shard_id, url in settings.SHARD_URLS.items()})
+            configure_sharded_sessions(AsyncSessionLocal, shard_engines)
+            async_engine = next(iter(shard_engines.values()))
+        else:
+            async_engine = _create_engine(settings.POSTGRES_URL)
+            AsyncSessionLocal.configure(bind=async_engine)
+    return async_engine
+
+def get_engines() -> list[AsyncEngine]:
+    """Get the engine of every database, one per shard with sharding enabled"""
+    get_engine()
+    return list(shard_engines.values()) or [async_engine]
+
+async def dispose_engine():
+    """Close all pooled connections and drop the engines"""
+    global async_engine
+    if async_engine is not None:
+        for engine in get_engines():
+            await engine.dispose()
+        shard_engines.clear()
+        async_engine = None
 
 async def init_db():
-    """Create the database tables"""
-    async with async_engine.begin() as conn:
-        from src.todolists.models import ToDoList
-        from src.todoitems.models import ToDoItem
-        from src.auth.models import User
-        await conn.run_sync(Base.metadata.create_all)
+    """Create the database tables, on every shard with sharding enabled"""
+    from src.todolists.models import ToDoList, ToDoListShare
+    from src.todoitems.models import ToDoItem
+    from src.auth.models import User
+    from src.sync.models import Tombstone
+    for engine in get_engines():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
 
 async def get_async_session():
     """Dependency to provide the session object"""
+    get_engine()
     async with AsyncSessionLocal() as session:
         yield session
         await session.commit()
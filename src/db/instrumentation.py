@@ -0,0 +1,142 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Statements kept per collector for the slow request log.
+MAX_RECORDED_STATEMENTS = 100
+
+
+@dataclass
+class QueryStats:
+    """Statements executed and time spent in the database by one unit of work"""
+    count: int = 0
+    duration: float = 0.0
+    statements: list[str] = field(default_factory=list)
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        if len(self.statements) < MAX_RECORDED_STATEMENTS:
+            self.statements.append(statement)
+
+
+# Every active collector gets each statement, so a test can count the
+# queries of a request that also has its own per-request collector.
+_active_collectors: ContextVar[tuple[QueryStats, ...]] = ContextVar("sql_query_collectors", default=())
+# Collectors that see statements from every task and thread (e.g. a test
+# driving the app through TestClient, which runs it in another thread).
+_global_collectors: list[QueryStats] = []
+
+
+def current_query_stats() -> QueryStats | None:
+    """Get the innermost collector of the current request/context, if any"""
+    collectors = _active_collectors.get()
+    return collectors[-1] if collectors else None
+
+
+@contextmanager
+def count_queries(all_contexts: bool = False):
+    """
+    Collect the statements executed inside the block.
+
+    Args:
+        all_contexts (bool): also count statements run by other tasks and threads
+
+    Yields:
+        QueryStats: updated as statements run
+    """
+    stats = QueryStats()
+    if all_contexts:
+        _global_collectors.append(stats)
+        try:
+            yield stats
+        finally:
+            _global_collectors.remove(stats)
+        return
+
+    token = _active_collectors.set(_active_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active_collectors.reset(token)
+
+
+# The start time is kept on the statement's execution context, which goes
+# away with it when the statement fails. The few statements run without a
+# context (e.g. sequences) overwrite a single slot of the connection.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start_time = time.perf_counter()
+    else:
+        conn.info["query_start_time"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = context._query_start_time if context is not None else conn.info.pop("query_start_time")
+    collectors = _active_collectors.get() + tuple(_global_collectors)
+    if not collectors:
+        return
+    duration = time.perf_counter() - started
+    for stats in collectors:
+        stats.record(statement, duration)
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Register the query timing hooks on an async engine"""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware counting the SQL statements and database time of each
+    request. The totals are sent back in a ``Server-Timing`` header, and the
+    statements of requests over the configured thresholds are logged.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        with count_queries() as stats:
+            async def send_with_server_timing(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((
+                        b"server-timing",
+                        f'db;dur={stats.duration_ms:.2f};desc="{stats.count} queries"'.encode("latin-1"),
+                    ))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_server_timing)
+            finally:
+                if (
+                    stats.duration_ms >= settings.SQL_SLOW_REQUEST_MS
+                    or stats.count >= settings.SQL_SLOW_REQUEST_QUERY_COUNT
+                ):
+                    logger.warning(
+                        "slow request %s %s: %d queries, %.2fms in db, %.2fms total\n%s",
+                        scope["method"],
+                        scope["path"],
+                        stats.count,
+                        stats.duration_ms,
+                        (time.perf_counter() - started) * 1000,
+                        "\n".join(stats.statements),
+                    )
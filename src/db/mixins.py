@@ -1,6 +1,6 @@
 from datetime import datetime
-from sqlalchemy import Column
-from sqlalchemy.orm import declarative_mixin
+from sqlalchemy import Column, event
+from sqlalchemy.orm import Session, declarative_mixin, with_loader_criteria
 import sqlalchemy.dialects.postgresql as pg
 
 
@@ -8,3 +8,28 @@ import sqlalchemy.dialects.postgresql as pg
 class Timestamp:
     created_at = Column(pg.TIMESTAMP, default=datetime.now, nullable=False)
     updated_at = Column(pg.TIMESTAMP, default=datetime.now, nullable=False, onupdate=datetime.now)
+
+
+@declarative_mixin
+class SoftDelete:
+    deleted_at = Column(pg.TIMESTAMP, nullable=True)
+
+
+def soft_delete_filter_applies(execute_state) -> bool:
+    """
+    Whether soft deleted rows should be hidden from an ORM statement.
+    Pass ``execution_options(include_deleted=True)`` to see them.
+    """
+    return (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.execution_options.get("include_deleted", False)
+    )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _hide_soft_deleted(execute_state):
+    if soft_delete_filter_applies(execute_state):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(SoftDelete, lambda cls: cls.deleted_at.is_(None), include_aliases=True)
+        )
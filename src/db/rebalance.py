@@ -0,0 +1,248 @@
+"""
+Move users to the shard the hash ring assigns them, after shards were
+added to or removed from SHARD_URLS. Removed shards must stay listed under
+SHARD_REBALANCE_FROM_URLS until they have been drained.
+
+Each user is moved with their lists, items and tombstones: the rows are
+first copied to the target shard (replacing any copy left by an interrupted
+run), then deleted from the source, so the tool can be run again after a
+failure.
+
+Users with shares (of their lists, or of other lists with them) are not
+moved, since the two users may end up on different shards: the report
+lists their shares as LIST_ID:USER_ID. A user is moved, dropping their
+shares, once every one of them is passed to --drop-shares. Run --dry-run
+first and review the shares it reports. Dropped shares leave a tombstone
+for the user losing access, so their next sync removes the list, and end
+their change feed streams.
+
+Downtime: the app routes users by the new SHARD_URLS as soon as it is
+deployed, so a user whose shard changes can't sign in until they have been
+moved; run the tool right after the deploy, in a maintenance window. While
+a user is moved, they and the users sharing lists with them are fenced:
+their requests that write get a 503, for SHARD_FENCE_GRACE_SECONDS (so the
+writes already past the check finish) plus the time of the copy. A fence
+left by a failed run expires after SHARD_FENCE_SECONDS. Redis must be the
+one the app uses.
+
+Usage (from the repository root):
+    python -m src.db.rebalance --dry-run
+    python -m src.db.rebalance [--drop-shares LIST_ID:USER_ID ...]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+from collections import Counter
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from src.utils.config import settings
+from .sharding import fence_users, unfence_users
+
+
+def _tables():
+    from src.auth.models import User
+    from src.sync.models import Tombstone
+    from src.todoitems.models import ToDoItem
+    from src.todolists.models import ToDoList, ToDoListShare
+
+    return User.__table__, ToDoList.__table__, ToDoListShare.__table__, ToDoItem.__table__, Tombstone.__table__
+
+
+def owned_rows(user_id):
+    """(table, condition) of the rows belonging to a user, parents first"""
+    users, todolist, shares, todoitems, tombstones = _tables()
+    lists = select(todolist.c.id).where(todolist.c.owner_id == user_id)
+    return [
+        (users, users.c.id == user_id),
+        (todolist, todolist.c.owner_id == user_id),
+        (todoitems, todoitems.c.todolist_id.in_(lists)),
+        (tombstones, or_(
+            tombstones.c.user_id == user_id,
+            and_(tombstones.c.user_id.is_(None), tombstones.c.todolist_id.in_(lists)),
+        )),
+    ]
+
+
+def shares_of(user_id):
+    users, todolist, shares, todoitems, tombstones = _tables()
+    lists = select(todolist.c.id).where(todolist.c.owner_id == user_id)
+    return shares, or_(shares.c.user_id == user_id, shares.c.todolist_id.in_(lists))
+
+
+async def user_shares(conn: AsyncConnection, user_id) -> list:
+    """The shares of a user's lists and of other lists with them, with the list's owner"""
+    todolist = _tables()[1]
+    shares, condition = shares_of(user_id)
+    query = (
+        select(shares.c.todolist_id, shares.c.user_id, todolist.c.owner_id)
+        .join(todolist, todolist.c.id == shares.c.todolist_id)
+        .where(condition)
+    )
+    return (await conn.execute(query)).all()
+
+
+async def _tombstone_shares(conn: AsyncConnection, shares: list):
+    """Tell the users losing a shared list to drop it at their next sync"""
+    tombstones = _tables()[4]
+    if shares:
+        await conn.execute(insert(tombstones), [
+            {"entity": "list", "entity_id": share.todolist_id, "todolist_id": share.todolist_id, "user_id": share.user_id}
+            for share in shares
+        ])
+
+
+async def _delete_user_rows(conn: AsyncConnection, user_id) -> int:
+    shares, condition = shares_of(user_id)
+    dropped = (await conn.execute(delete(shares).where(condition))).rowcount
+    for table, condition in reversed(owned_rows(user_id)):
+        await conn.execute(delete(table).where(condition))
+    return dropped
+
+
+async def move_user(
+    user_id, source: AsyncEngine, target: AsyncEngine, batch_size: int = 1000, drop_shares=(),
+) -> dict | None:
+    """
+    Copy a user's rows to the target shard, then delete them from the
+    source. The user, and the users sharing lists with them, are fenced
+    for the whole move. Their shares are dropped, and must all be listed
+    in ``drop_shares`` as (list id, user id) pairs.
+
+    Returns:
+        dict: the number of copied rows per table and of dropped shares,
+        None when the user was not moved because of an unlisted share
+    """
+    from src.changefeed.service import publish_change
+
+    fenced = [user_id]
+    await fence_users(fenced, settings.SHARD_FENCE_SECONDS)
+    try:
+        # Nobody can share with or unshare from the user once they are fenced.
+        async with source.connect() as src:
+            shares = await user_shares(src, user_id)
+        if not {(share.todolist_id, share.user_id) for share in shares} <= set(drop_shares):
+            # Shared since the plan was made
+            return None
+        partners = {share.user_id for share in shares} | {share.owner_id for share in shares}
+        fenced += [partner for partner in partners if partner != user_id]
+        await fence_users(fenced, settings.SHARD_FENCE_SECONDS)
+        await asyncio.sleep(settings.SHARD_FENCE_GRACE_SECONDS)
+
+        copied = Counter()
+        async with source.connect() as src, target.begin() as dst:
+            await _delete_user_rows(dst, user_id)
+            for table, condition in owned_rows(user_id):
+                rows = [dict(row) for row in (await src.execute(select(table).where(condition))).mappings()]
+                for start in range(0, len(rows), batch_size):
+                    await dst.execute(insert(table), rows[start:start + batch_size])
+                copied[table.name] += len(rows)
+            # The user goes, with the tombstones of the lists shared with them.
+            await _tombstone_shares(dst, [share for share in shares if share.user_id == user_id])
+        async with source.begin() as src:
+            # The users the user's lists were shared with stay.
+            await _tombstone_shares(src, [share for share in shares if share.user_id != user_id])
+            copied["dropped_shares"] = await _delete_user_rows(src, user_id)
+    finally:
+        await unfence_users(fenced)
+
+    for share in shares:
+        await publish_change(share.todolist_id, "list.unshared", {"user_id": str(share.user_id)})
+    return dict(copied)
+
+
+async def plan(engines: dict[str, AsyncEngine], ring) -> list[tuple]:
+    """Find the users whose shard is not the one the ring assigns them"""
+    users = _tables()[0]
+    moves = []
+    for shard_id, engine in engines.items():
+        async with engine.connect() as conn:
+            user_ids = (await conn.execute(select(users.c.id))).scalars().all()
+        for user_id in user_ids:
+            target = ring.shard_for(user_id)
+            if target != shard_id:
+                moves.append((user_id, shard_id, target))
+    return moves
+
+
+def share_key(value: str) -> tuple[uuid.UUID, uuid.UUID]:
+    """Parse a LIST_ID:USER_ID share"""
+    list_id, _, user_id = value.partition(":")
+    try:
+        return uuid.UUID(list_id), uuid.UUID(user_id)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected LIST_ID:USER_ID, got {value!r}")
+
+
+async def rebalance(dry_run: bool = False, batch_size: int = 1000, drop_shares=()) -> dict:
+    """
+    Move the users whose shard changed. A user with shares is only moved
+    when all of them are in ``drop_shares``, as (list id, user id) pairs.
+
+    Returns:
+        dict: the moves, the copied rows, and the users left in place with
+        the shares to drop to move them
+    """
+    from .db_setup import _create_engine, dispose_engine, get_engine, shard_engines
+    from .redis import close_redis
+    from .sharding import get_ring
+
+    if not settings.SHARD_URLS:
+        raise SystemExit("sharding is not enabled, set SHARD_URLS")
+    get_engine()
+    engines = dict(shard_engines)
+    draining = {shard_id: _create_engine(url) for shard_id, url in settings.SHARD_REBALANCE_FROM_URLS.items()}
+    engines.update(draining)
+
+    try:
+        moves = await plan(engines, get_ring())
+        report = {
+            "moves": Counter(f"{source}->{target}" for _, source, target in moves),
+            "users": len(moves),
+            "rows": Counter(),
+            # Users with shares not passed to --drop-shares, left in place,
+            # and those shares.
+            "blocked": [],
+            "shares": [],
+        }
+        drop_shares = set(drop_shares)
+        for user_id, source, target in moves:
+            async with engines[source].connect() as conn:
+                shares = {(share.todolist_id, share.user_id) for share in await user_shares(conn, user_id)}
+            if not shares <= drop_shares:
+                report["blocked"].append(user_id)
+                report["shares"] += [f"{list_id}:{share_user_id}" for list_id, share_user_id in sorted(shares)]
+                continue
+            if dry_run:
+                continue
+            rows = await move_user(user_id, engines[source], engines[target], batch_size, drop_shares)
+            if rows is None:
+                report["blocked"].append(user_id)
+                continue
+            report["rows"].update(rows)
+        return report
+    finally:
+        for engine in draining.values():
+            await engine.dispose()
+        await dispose_engine()
+        await close_redis()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only report the users that would move")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per INSERT")
+    parser.add_argument(
+        "--drop-shares", nargs="+", type=share_key, default=[], metavar="LIST_ID:USER_ID",
+        help="shares to drop, as reported by --dry-run; users are moved once all their shares are listed",
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(rebalance(dry_run=args.dry_run, batch_size=args.batch_size, drop_shares=args.drop_shares))
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
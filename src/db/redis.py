@@ -3,23 +3,38 @@ from src.utils.config import settings
 
 TOKEN_ID_EXPIRY = 1200
 
-token_blocklist = aioredis.StrictRedis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=0,
-    password=settings.REDIS_PASS
-)
+# Created on first use (or in the app lifespan) rather than at import time.
+token_blocklist: aioredis.StrictRedis | None = None
+
+def get_redis() -> aioredis.StrictRedis:
+    """Get the redis client, creating it on first use"""
+    global token_blocklist
+    if token_blocklist is None:
+        token_blocklist = aioredis.StrictRedis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=0,
+            password=settings.REDIS_PASS
+        )
+    return token_blocklist
+
+async def close_redis():
+    """Close the redis connection pool"""
+    global token_blocklist
+    if token_blocklist is not None:
+        await token_blocklist.aclose()
+        token_blocklist = None
 
 async def add_token_id_to_blocklist(token_id: str) -> dict:
     try:
-        await token_blocklist.set(name=token_id, value="_", ex=TOKEN_ID_EXPIRY)
+        await get_redis().set(name=token_id, value="_", ex=TOKEN_ID_EXPIRY)
         return {"message": "token id saved in redis successfully."}
     except Exception as e:
         return {"error": str(e)}
 
 async def is_token_id_in_blocklist(token_id: str) -> dict:
     try:
-        results = await token_blocklist.get(token_id)
+        results = await get_redis().get(token_id)
         return {"results": results is not None}
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,212 @@
+"""
+Optional horizontal sharding across several databases.
+
+Enabled by setting SHARD_URLS to a JSON object of shard id to database url.
+A user and everything they own (lists, items, shares of their lists and
+tombstones) live on the shard picked by consistent hashing of the user id,
+so adding a shard only moves about 1/N of the users (see src.db.rebalance).
+
+AsyncSessionLocal stays the session factory: with sharding enabled it
+builds sessions over a ShardedSession that routes each statement to the
+shard pinned for the current request (``pin_shard``), and runs it on every
+shard when nothing is pinned, e.g. login, admin endpoints and Celery jobs.
+
+While src.db.rebalance moves a user, the user is fenced: their requests
+that write get a 503 (see ``check_write_fence``).
+"""
+import asyncio
+import bisect
+import hashlib
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, TypeVar
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Mapper, sessionmaker
+from src.utils.config import settings
+from src.utils.errors import ShardMoveInProgressException
+
+T = TypeVar("T")
+
+# Shard of the principal of the current request (or job), None when unknown.
+current_shard: ContextVar[str | None] = ContextVar("current_shard", default=None)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring with virtual nodes.
+
+    Args:
+        shard_ids (list): the shards on the ring
+        virtual_nodes (int): points per shard, more points spread the keys more evenly
+    """
+
+    def __init__(self, shard_ids: list[str], virtual_nodes: int = 64):
+        self.shard_ids = list(shard_ids)
+        points = sorted(
+            (_hash(f"{shard_id}#{i}"), shard_id) for shard_id in self.shard_ids for i in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard_id for _, shard_id in points]
+
+    def shard_for(self, key: uuid.UUID | str) -> str:
+        """The shard owning a key: the first point clockwise of the key's hash"""
+        index = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._shards[index]
+
+
+_ring: HashRing | None = None
+
+
+def sharding_enabled() -> bool:
+    return bool(settings.SHARD_URLS)
+
+
+def get_ring() -> HashRing:
+    global _ring
+    if _ring is None:
+        _ring = HashRing(list(settings.SHARD_URLS), settings.SHARD_VIRTUAL_NODES)
+    return _ring
+
+
+def shard_for_user(user_id: uuid.UUID | str) -> str:
+    return get_ring().shard_for(user_id)
+
+
+def pin_shard(user_id: uuid.UUID | str | None):
+    """Route the rest of the current request or task to a user's shard"""
+    if sharding_enabled() and user_id is not None:
+        current_shard.set(shard_for_user(user_id))
+
+
+@contextmanager
+def use_shard(shard_id: str | None):
+    """Route the statements run inside the block to one shard, or to all of them with None"""
+    token = current_shard.set(shard_id)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+@contextmanager
+def use_user_shard(user_id: uuid.UUID | str):
+    """Route the statements run inside the block to a user's shard"""
+    with use_shard(shard_for_user(user_id) if sharding_enabled() else current_shard.get()):
+        yield
+
+
+def fence_key(user_id: uuid.UUID | str) -> str:
+    return f"shard:fence:{user_id}"
+
+
+async def fence_users(user_ids: list, seconds: int):
+    """
+    Refuse the writes of users for at most ``seconds``, so the expiry lifts
+    the fence when the rebalancing tool dies before ``unfence_users``.
+    """
+    from .redis import get_redis
+
+    if not user_ids:
+        return
+    async with get_redis().pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            pipe.set(fence_key(user_id), "1", ex=seconds)
+        await pipe.execute()
+
+
+async def unfence_users(user_ids: list):
+    from .redis import get_redis
+
+    if user_ids:
+        await get_redis().delete(*(fence_key(user_id) for user_id in user_ids))
+
+
+async def check_write_fence(user_id: uuid.UUID | str):
+    """Refuse a write of a user whose rows are being moved to another shard"""
+    from .redis import get_redis
+
+    if sharding_enabled() and await get_redis().exists(fence_key(user_id)):
+        raise ShardMoveInProgressException()
+
+
+def _instance_shard(instance) -> str | None:
+    from src.auth.models import User
+    from src.todolists.models import ToDoList
+
+    if isinstance(instance, User):
+        if instance.id is None:
+            # The id is the shard key, assign it before the INSERT picks a shard.
+            instance.id = uuid.uuid4()
+        return shard_for_user(instance.id)
+    if isinstance(instance, ToDoList) and instance.owner_id is not None:
+        return shard_for_user(instance.owner_id)
+    return None
+
+
+def _pinned_shard() -> str:
+    shard_id = current_shard.get()
+    if shard_id is None:
+        raise RuntimeError("no shard selected, use pin_shard() or use_shard() before writing")
+    return shard_id
+
+
+def _shard_chooser(mapper: Mapper, instance, clause=None) -> str:
+    return (_instance_shard(instance) if instance is not None else None) or _pinned_shard()
+
+
+def _identity_chooser(mapper: Mapper, primary_key, **kw) -> list[str]:
+    shard_id = current_shard.get()
+    return [shard_id] if shard_id else get_ring().shard_ids
+
+
+def _execute_chooser(orm_context) -> list[str]:
+    shard_id = current_shard.get()
+    return [shard_id] if shard_id else get_ring().shard_ids
+
+
+class RoutedShardedSession(ShardedSession):
+    """ShardedSession that also routes Core statements to the pinned shard"""
+
+    def get_bind(self, mapper=None, *, shard_id=None, instance=None, clause=None, **kw):
+        if shard_id is None and mapper is None and instance is None:
+            shard_id = _pinned_shard()
+        return super().get_bind(mapper, shard_id=shard_id, instance=instance, clause=clause, **kw)
+
+
+def configure_sharded_sessions(factory: sessionmaker, engines: dict[str, AsyncEngine]):
+    """Make a sessionmaker of AsyncSession build sessions spanning the shards"""
+    factory.configure(
+        sync_session_class=RoutedShardedSession,
+        shards={shard_id: engine.sync_engine for shard_id, engine in engines.items()},
+        shard_chooser=_shard_chooser,
+        identity_chooser=_identity_chooser,
+        execute_chooser=_execute_chooser,
+    )
+
+
+async def scatter_gather(query: Callable[[AsyncSession], Awaitable[T]]) -> dict[str, T]:
+    """
+    Run a query on every shard concurrently, each with its own session.
+
+    Args:
+        query (callable): coroutine function taking a session
+
+    Returns:
+        dict: the result of each shard by shard id
+    """
+    from .db_setup import AsyncSessionLocal
+
+    async def run(shard_id: str):
+        with use_shard(shard_id):
+            async with AsyncSessionLocal() as session:
+                return await query(session)
+
+    shard_ids = get_ring().shard_ids
+    results = await asyncio.gather(*(run(shard_id) for shard_id in shard_ids))
+    return dict(zip(shard_ids, results))
@@ -0,0 +1,33 @@
+import fastapi
+from typing import Annotated
+from fastapi import Depends, Query, status
+from fastapi.responses import PlainTextResponse
+from src.auth.dependencies import RoleChecker
+from src.auth.schemas import User
+from src.utils.config import settings
+from src.utils.errors import ProfilerBusyException, ResourceNotFoundException
+from .sampler import profile_worker, profiler_lock, stored_profiles
+
+profiling_router = fastapi.APIRouter(prefix="/profiling")
+
+COLLAPSED_HEADERS = {"Content-Disposition": 'attachment; filename="profile.collapsed"'}
+
+
+@profiling_router.get("/cpu", response_class=PlainTextResponse, status_code=status.HTTP_200_OK)
+async def profile_worker_cpu(
+    _: Annotated[User, Depends(RoleChecker(["admin"]))],
+    seconds: float = Query(default=10, gt=0, le=settings.PROFILING_MAX_SECONDS),
+    interval_ms: float = Query(default=10, ge=1, le=1000),
+):
+    if profiler_lock.locked():
+        raise ProfilerBusyException()
+    async with profiler_lock:
+        profile = await profile_worker(seconds=seconds, interval=interval_ms / 1000)
+    return PlainTextResponse(content=profile, headers=COLLAPSED_HEADERS)
+
+@profiling_router.get("/requests/{profile_id}", response_class=PlainTextResponse, status_code=status.HTTP_200_OK)
+async def read_request_profile(profile_id: str, _: Annotated[User, Depends(RoleChecker(["admin"]))]):
+    profile = stored_profiles.pop(profile_id, None)
+    if profile is None:
+        raise ResourceNotFoundException()
+    return PlainTextResponse(content=profile, headers=COLLAPSED_HEADERS)
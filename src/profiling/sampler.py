@@ -0,0 +1,122 @@
+import asyncio
+import sys
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from typing import Callable
+from src.utils.config import settings
+
+# Per-request profiles kept on this worker until fetched or evicted.
+MAX_STORED_PROFILES = 20
+
+stored_profiles: OrderedDict[str, str] = OrderedDict()
+profiler_lock = asyncio.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({code.co_filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """
+    Statistical profiler sampling the stack of one thread from a background
+    thread, aggregated in the collapsed format used by flamegraph.pl and
+    speedscope (``root;caller;callee count``).
+
+    Args:
+        thread_id (int): the thread to sample
+        interval (float): seconds between samples
+        should_sample (callable): optional predicate, samples are skipped when it returns False
+    """
+
+    def __init__(self, thread_id: int, interval: float, should_sample: Callable[[], bool] | None = None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.should_sample = should_sample
+        self.samples: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks"""
+        self._stopped.set()
+        self._thread.join()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if self.should_sample is not None and not self.should_sample():
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.samples[";".join(reversed(labels))] += 1
+
+
+async def profile_worker(seconds: float, interval: float) -> str:
+    """
+    Sample the event loop thread of this worker for ``seconds``.
+
+    Returns:
+        str: the collapsed stacks
+    """
+    sampler = StackSampler(threading.get_ident(), interval)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profile = sampler.stop()
+    return profile
+
+
+def store_profile(profile_id: str, profile: str):
+    stored_profiles[profile_id] = profile
+    while len(stored_profiles) > MAX_STORED_PROFILES:
+        stored_profiles.popitem(last=False)
+
+
+class RequestProfilerMiddleware:
+    """
+    ASGI middleware profiling single requests that carry an ``X-Profile``
+    header matching PROFILING_REQUEST_TOKEN. Only samples taken while the
+    request's own task is running are kept. The response gets an
+    ``X-Profile-Id`` header; the profile is fetched from the admin endpoint.
+    """
+
+    def __init__(self, app, interval: float = 0.001):
+        self.app = app
+        self.interval = interval
+        self.token = settings.PROFILING_REQUEST_TOKEN.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.token or dict(scope["headers"]).get(b"x-profile") != self.token:
+            return await self.app(scope, receive, send)
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        profile_id = str(uuid.uuid4())
+        sampler = StackSampler(
+            threading.get_ident(), self.interval, should_sample=lambda: asyncio.current_task(loop) is task
+        )
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            store_profile(profile_id, sampler.stop())
@@ -0,0 +1,27 @@
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, Index, String
+from sqlalchemy.dialects.postgresql import UUID
+import sqlalchemy.dialects.postgresql as pg
+
+from src.db.db_setup import Base
+
+
+class Tombstone(Base):
+    """Record of a hard-deleted list or item, so sync clients can drop it"""
+    __tablename__ = "tombstones"
+    id: uuid.UUID = Column(UUID, default=uuid.uuid4, primary_key=True)
+    entity: str = Column(String(10), nullable=False)
+    entity_id: uuid.UUID = Column(UUID, nullable=False)
+    todolist_id: uuid.UUID = Column(UUID, nullable=False)
+    # The only user the tombstone is for (a list's owner and sharees when it
+    # is deleted, a user losing access to a shared list). None for item
+    # tombstones, which go to everyone who can access the list.
+    user_id: uuid.UUID = Column(UUID, nullable=True)
+    deleted_at: datetime = Column(pg.TIMESTAMP, default=datetime.now, nullable=False)
+
+    __table_args__ = (
+        Index("ix_tombstones_deleted_at_id", "deleted_at", "id"),
+        Index("ix_tombstones_user_id_deleted_at_id", "user_id", "deleted_at", "id"),
+        Index("ix_tombstones_todolist_id", "todolist_id"),
+    )
@@ -0,0 +1,20 @@
+import fastapi
+from fastapi import Depends, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.auth.dependencies import get_current_active_user
+from src.auth.models import User
+from src.db.db_setup import get_async_session
+from .schemas import SyncChanges
+from .service import SyncService
+
+sync_router = fastapi.APIRouter(prefix="/sync")
+
+
+@sync_router.get("/changes", response_model=SyncChanges, status_code=status.HTTP_200_OK)
+async def read_changes(
+    cursor: str | None = None,
+    limit: int = Query(default=500, ge=1, le=5000),
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    return await SyncService(session, current_user).get_changes(cursor=cursor, limit=limit)
@@ -0,0 +1,24 @@
+import uuid
+from typing import List
+from datetime import datetime
+from pydantic import BaseModel
+from src.todoitems.schemas import ToDoItem
+from src.todolists.schemas import ToDoListSummary
+
+
+class Tombstone(BaseModel):
+    entity: str
+    entity_id: uuid.UUID
+    todolist_id: uuid.UUID
+    deleted_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class SyncChanges(BaseModel):
+    lists: List[ToDoListSummary] = []
+    items: List[ToDoItem] = []
+    deleted: List[Tombstone] = []
+    cursor: str
+    has_more: bool
@@ -0,0 +1,209 @@
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import noload
+from src.auth.models import User
+from src.todoitems.models import ToDoItem
+from src.todolists.models import ToDoList, ToDoListShare
+from src.todolists.service import accessible_list_ids
+from src.utils.config import settings
+from src.utils.errors import InvalidSyncCursorException
+from .models import Tombstone
+
+# Position reached in each change source, as (timestamp, id) keyset pairs.
+# The backfill of a newly shared list adds the id of that list.
+CursorPosition = dict[str, tuple[datetime, uuid.UUID] | tuple[datetime, uuid.UUID, uuid.UUID] | None]
+
+SOURCES = ("lists", "items", "deleted", "shared", "backfill")
+
+
+def encode_cursor(position: CursorPosition) -> str:
+    data = {k: [v[0].isoformat(), *map(str, v[1:])] if v else None for k, v in position.items()}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor: str | None) -> CursorPosition:
+    if not cursor:
+        return {source: None for source in SOURCES}
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {
+            # Cursors issued before a source existed start it from the beginning.
+            source: (
+                datetime.fromisoformat(data[source][0]), uuid.UUID(data[source][1]), *map(uuid.UUID, data[source][2:])
+            ) if data.get(source) else None
+            for source in SOURCES
+        }
+    except (ValueError, KeyError, TypeError, IndexError):
+        raise InvalidSyncCursorException()
+
+
+class SyncService:
+    """
+    This class provides the changes made to the todo lists and items a user
+    can access since a cursor
+    """
+
+    def __init__(self, session: AsyncSession, user: User | None = None):
+        self.session = session
+        self.user = user
+
+    async def _changed_since(self, query, timestamp_column, id_column, position, until: datetime, limit: int):
+        query = query.where(timestamp_column <= until)
+        if position is not None:
+            timestamp, id = position
+            query = query.where(
+                or_(timestamp_column > timestamp, and_(timestamp_column == timestamp, id_column > id))
+            )
+        query = query.order_by(timestamp_column, id_column).limit(limit)
+        results = await self.session.execute(query)
+        return results.scalars().all()
+
+    async def get_changes(self, cursor: str | None = None, limit: int = 500):
+        """
+        Get the lists and items created or updated, and the ones deleted,
+        after a cursor. Every source is read with a keyset query on its
+        (timestamp, id) index, so the cost follows the number of changes.
+
+        Sharing a list does not change it, so the lists shared with the user
+        after the cursor are read from the shares and sent with their items.
+        Those items are read in share order, at most limit per call: a list
+        whose items do not fit is backfilled over the next calls, from the
+        last item sent.
+
+        The timestamps come from the app servers' clocks when the rows are
+        flushed, not from the commits, so a row can become visible with a
+        timestamp older than rows already read. Rows are only read up to
+        SYNC_SAFETY_WINDOW_SECONDS ago, and the cursor never passes that
+        point: the window must be longer than the longest write transaction
+        plus the clock drift between the servers.
+
+        Args:
+            cursor (str): the cursor returned by the previous call, None for a full sync
+            limit (int): maximum number of rows per source
+
+        Returns:
+            dict: lists, items, deleted, the next cursor and whether more changes are pending
+        """
+        position = decode_cursor(cursor)
+        until = datetime.now() - timedelta(seconds=settings.SYNC_SAFETY_WINDOW_SECONDS)
+        lists_query = select(ToDoList).options(noload(ToDoList.items))
+        items_query = select(ToDoItem).options(noload(ToDoItem.list)).execution_options(include_archived=True)
+        deleted_query = select(Tombstone)
+        if self.user is not None:
+            shared = select(ToDoListShare.todolist_id).where(ToDoListShare.user_id == self.user.id)
+            lists_query = lists_query.where(or_(ToDoList.owner_id == self.user.id, ToDoList.id.in_(shared)))
+            items_query = items_query.where(ToDoItem.todolist_id.in_(accessible_list_ids(self.user.id)))
+            deleted_query = deleted_query.where(or_(
+                Tombstone.user_id == self.user.id,
+                and_(Tombstone.user_id.is_(None), Tombstone.todolist_id.in_(accessible_list_ids(self.user.id))),
+            ))
+
+        lists = await self._changed_since(
+            lists_query, ToDoList.updated_at, ToDoList.id, position["lists"], until, limit,
+        )
+        items = await self._changed_since(
+            items_query, ToDoItem.updated_at, ToDoItem.id, position["items"], until, limit,
+        )
+        deleted = await self._changed_since(
+            deleted_query, Tombstone.deleted_at, Tombstone.id, position["deleted"], until, limit,
+        )
+
+        new_shares, shared_items = [], []
+        if self.user is not None:
+            new_shares = await self._changed_since(
+                select(ToDoListShare).where(ToDoListShare.user_id == self.user.id),
+                ToDoListShare.created_at, ToDoListShare.todolist_id, position["shared"], until, limit,
+            )
+        if new_shares:
+            shared_items = await self._shared_items(new_shares, position["backfill"], limit)
+
+        # Lists already sent by the call that started their backfill
+        sent = position["backfill"][2] if position["backfill"] else None
+        started = new_shares
+        if lists:
+            position["lists"] = (lists[-1].updated_at, lists[-1].id)
+        if items:
+            position["items"] = (items[-1].updated_at, items[-1].id)
+        if deleted:
+            position["deleted"] = (deleted[-1].deleted_at, deleted[-1].id)
+        if len(shared_items) == limit:
+            # The list of the last item may have more: it is backfilled next time.
+            last = shared_items[-1]
+            index = [share.todolist_id for share in new_shares].index(last.todolist_id)
+            started, new_shares = new_shares[:index + 1], new_shares[:index]
+            position["backfill"] = (last.updated_at, last.id, last.todolist_id)
+        else:
+            position["backfill"] = None
+        if new_shares:
+            position["shared"] = (new_shares[-1].created_at, new_shares[-1].todolist_id)
+        has_more = any(len(rows) == limit for rows in (lists, items, deleted, started, shared_items))
+
+        lists, items = await self._add_shared_lists(
+            lists, items, [share.todolist_id for share in started if share.todolist_id != sent], shared_items,
+        )
+        return {
+            "lists": lists,
+            "items": items,
+            "deleted": deleted,
+            "cursor": encode_cursor(position),
+            "has_more": has_more,
+        }
+
+    async def _shared_items(self, new_shares: list, backfill, limit: int):
+        """
+        The items of the newly shared lists, in share order and by
+        (updated_at, id) within a list, after the backfill position
+        """
+        query = (
+            select(ToDoItem).options(noload(ToDoItem.list))
+            .join(ToDoListShare, and_(
+                ToDoListShare.todolist_id == ToDoItem.todolist_id, ToDoListShare.user_id == self.user.id,
+            ))
+            .where(ToDoItem.todolist_id.in_([share.todolist_id for share in new_shares]))
+            .order_by(ToDoListShare.created_at, ToDoListShare.todolist_id, ToDoItem.updated_at, ToDoItem.id)
+            .limit(limit)
+            .execution_options(include_archived=True)
+        )
+        if backfill is not None:
+            timestamp, id, todolist_id = backfill
+            query = query.where(or_(
+                ToDoItem.todolist_id != todolist_id,
+                ToDoItem.updated_at > timestamp,
+                and_(ToDoItem.updated_at == timestamp, ToDoItem.id > id),
+            ))
+        results = await self.session.execute(query)
+        return results.scalars().all()
+
+    async def _add_shared_lists(self, lists: list, items: list, ids: list[uuid.UUID], shared_items: list):
+        """The changed lists and items, plus the newly shared lists and their items"""
+        if ids:
+            shared_lists = await self.session.execute(
+                select(ToDoList).options(noload(ToDoList.items)).where(ToDoList.id.in_(ids))
+            )
+            list_ids = {todo_list.id for todo_list in lists}
+            lists = lists + [todo_list for todo_list in shared_lists.scalars() if todo_list.id not in list_ids]
+        item_ids = {item.id for item in items}
+        return lists, items + [item for item in shared_items if item.id not in item_ids]
+
+    async def purge_tombstones(self, deleted_before: datetime, batch_size: int = 1000):
+        """
+        Remove tombstones older than the retention period. Clients whose
+        cursor is older than that have to run a full sync.
+
+        Returns:
+            int: the number of removed tombstones
+        """
+        purged = 0
+        while True:
+            batch = select(Tombstone.id).where(Tombstone.deleted_at < deleted_before).limit(batch_size)
+            query = delete(Tombstone).where(Tombstone.id.in_(batch)).execution_options(synchronize_session=False)
+            results = await self.session.execute(query)
+            await self.session.commit()
+            purged += results.rowcount
+            if results.rowcount < batch_size:
+                return purged
@@ -1,5 +1,7 @@
 import fastapi
 from fastapi import status
+from fastapi.responses import Response
+from src.utils.metrics import render_metrics
 from .schemas import SystemHealthCheckBase
 from .service import SystemHealthCheckervice
 
@@ -10,3 +12,7 @@ system_health_router = fastapi.APIRouter(prefix="/healthchecks")
 async def check_application_status():
     return await SystemHealthCheckervice().check_system_health()
 
+@system_health_router.get("/metrics", status_code=status.HTTP_200_OK)
+async def read_metrics():
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
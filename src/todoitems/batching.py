@@ -0,0 +1,81 @@
+import asyncio
+import uuid
+from collections import defaultdict
+from src.db.db_setup import AsyncSessionLocal
+from src.db.sharding import shard_for_user, sharding_enabled, use_shard
+from src.utils.config import settings
+from .schemas import ToDoItem as ToDoItemSchema
+
+
+class CompletionBatcher:
+    """
+    Per-worker write-behind buffer of item completion toggles.
+
+    Toggles arriving within ``window`` seconds of the first one are written
+    together by ``ToDoItemService.set_completions`` and committed once; a
+    full buffer is flushed right away. Every caller waits for the commit of
+    its own toggle before it gets its answer, so nothing is acknowledged
+    that could still be lost.
+
+    Args:
+        window (float): seconds to wait for more toggles before flushing
+        max_size (int): toggles that trigger a flush without waiting
+    """
+
+    def __init__(self, window: float, max_size: int):
+        self.window = window
+        self.max_size = max_size
+        self._pending: list[tuple[tuple[uuid.UUID, bool, uuid.UUID], asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def toggle(self, id: uuid.UUID, is_complete: bool, user_id: uuid.UUID) -> ToDoItemSchema | None:
+        """
+        Queue a toggle and wait until it is committed.
+
+        Returns:
+            ToDoItem: the updated item, None when it was not found or not accessible
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((id, is_complete, user_id), future))
+        if len(self._pending) >= self.max_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch: list):
+        from .service import ToDoItemService
+
+        # A user's items live on their shard, write each shard's toggles there.
+        by_shard = defaultdict(list)
+        for toggle, future in batch:
+            by_shard[shard_for_user(toggle[2]) if sharding_enabled() else None].append((toggle, future))
+
+        for shard_id, entries in by_shard.items():
+            try:
+                with use_shard(shard_id):
+                    async with AsyncSessionLocal() as session:
+                        results = await ToDoItemService(session).set_completions([toggle for toggle, _ in entries])
+            except Exception as e:
+                for _, future in entries:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(entries, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+completion_batcher = CompletionBatcher(
+    window=settings.COMPLETION_BATCH_WINDOW_MS / 1000,
+    max_size=settings.COMPLETION_BATCH_MAX_SIZE,
+)
@@ -1,19 +1,69 @@
 import uuid
 from typing import Optional
-from sqlalchemy import Boolean, Column, ForeignKey, String, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Index, String, Text, event, false, select, text
+from sqlalchemy.orm import Session, relationship, with_loader_criteria
 from sqlalchemy.dialects.postgresql import UUID
 
 from src.db.db_setup import Base
-from src.db.mixins import Timestamp
+from src.db.mixins import SoftDelete, Timestamp, soft_delete_filter_applies
+from src.todolists.models import ToDoList
 
+todolist_table = ToDoList.__table__
 
-class ToDoItem(Timestamp, Base):
+
+class ToDoItem(Timestamp, SoftDelete, Base):
     __tablename__ = "todoitems"
     id: uuid.UUID = Column(UUID, default=uuid.uuid4, primary_key=True, index=True, unique=True)
     name: str = Column(String(250), nullable=False, index=True)
     description: Optional[str] = Column(Text, nullable=True)
     is_complete: bool = Column(Boolean, default=False)
-    todolist_id: uuid.UUID = Column(UUID, ForeignKey("todolist.id"), nullable=False)
+    todolist_id: uuid.UUID = Column(UUID, ForeignKey("todolist.id", ondelete="CASCADE"), nullable=False)
+    # Completed items past ARCHIVE_COMPLETED_AFTER_DAYS, moved by the archive
+    # job. On PostgreSQL the table can be LIST partitioned on this column
+    # (see the partition_todoitems option of migration e1f93a6c58d2).
+    archived: bool = Column(Boolean, default=False, server_default=false(), nullable=False)
 
     list = relationship("ToDoList", back_populates="items", lazy="selectin")
+
+    __table_args__ = (
+        Index("ix_todoitems_updated_at_id", "updated_at", "id"),
+        Index("ix_todoitems_todolist_id_live", "todolist_id", postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_todoitems_deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL")),
+        Index("ix_todoitems_todolist_id_hot", "todolist_id", postgresql_where=text("NOT archived AND deleted_at IS NULL")),
+    )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _hide_items_of_soft_deleted_lists(execute_state):
+    # Deleting a list only marks the list; its items stay hidden until the
+    # purge job removes them. The subquery uses the table rather than the
+    # entity so the soft delete criteria is not applied to it as well.
+    if soft_delete_filter_applies(execute_state):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(
+                ToDoItem,
+                lambda cls: cls.todolist_id.not_in(
+                    select(todolist_table.c.id).where(todolist_table.c.deleted_at.is_not(None))
+                ),
+                include_aliases=True,
+            )
+        )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _hide_archived_items(execute_state):
+    # Queries of the items themselves only look at the hot items unless they
+    # pass ``execution_options(include_archived=True)``. The literal predicate
+    # lets the planner prune the archive partition or use the hot indexes.
+    # Items embedded in their list (ToDoList.items) are all loaded: a list
+    # keeps showing its archived items.
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get("include_archived", False)
+        and any(mapper.class_ is ToDoItem for mapper in execute_state.all_mappers)
+    ):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(ToDoItem, lambda cls: cls.archived == false(), include_aliases=True)
+        )
@@ -1,47 +1,117 @@
+import logging
 import uuid
 import fastapi
 from typing import List
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from src.auth.dependencies import get_current_active_user
+from src.auth.models import User
 from src.db.db_setup import get_async_session
-from .schemas import ToDoItemCreate, ToDoItem, ToDoItemUpdate
+from .schemas import (
+    ToDoItemCreate, ToDoItem, ToDoItemUpdate, ToDoItemBatchMove, ToDoItemBatchMoveResult,
+    ToDoItemBatchGet, ToDoItemBatchGetResult, ToDoItemCompletion,
+)
+from .batching import completion_batcher
 from .service import ToDoItemService
 from src.utils.errors import (
     InternalServerErrorException,
 )
+from src.utils.fields import parse_fields, sparse_response
 
 todo_items_router = fastapi.APIRouter(prefix="/todoitems")
+logger = logging.getLogger(__name__)
 
 
 @todo_items_router.get("/", response_model=List[ToDoItem], status_code=status.HTTP_200_OK)
-async def read_todo_items(skip: int = 0, limit: int = 100, session: AsyncSession = Depends(get_async_session)):
+async def read_todo_items(
+    skip: int = 0,
+    limit: int = 100,
+    include_archived: bool = False,
+    fields: str | None = None,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    selection = parse_fields(ToDoItem, fields)
     try:
-        return await ToDoItemService(session).get_todo_items(skip=skip, limit=limit)
-    except Exception as e:
-        print("===================================")
-        print(f"Request processing error: {str(e)}")
-        print("===================================")
+        results = await ToDoItemService(session, current_user).get_todo_items(
+            skip=skip, limit=limit, include_archived=include_archived, selection=selection,
+        )
+        if selection.fields is None:
+            return results
+        return sparse_response(ToDoItem, selection, results, many=True)
+    except Exception:
+        logger.exception("request processing error")
         raise InternalServerErrorException()
 
 @todo_items_router.post("/", response_model=ToDoItem, status_code=status.HTTP_201_CREATED)
-async def create_new_todo_item(item: ToDoItemCreate, session: AsyncSession = Depends(get_async_session)):
-    return await ToDoItemService(session).create_todo_item(todo_item=item)
+async def create_new_todo_item(
+    item: ToDoItemCreate,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    return await ToDoItemService(session, current_user).create_todo_item(todo_item=item)
+
+@todo_items_router.post("/move", response_model=ToDoItemBatchMoveResult, status_code=status.HTTP_200_OK)
+async def move_todo_items(
+    batch: ToDoItemBatchMove,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    affected = await ToDoItemService(session, current_user).move_todo_items(batch=batch)
+    return {"affected": affected}
+
+@todo_items_router.post("/batch", response_model=ToDoItemBatchGetResult, status_code=status.HTTP_200_OK)
+async def read_todo_items_batch(
+    batch: ToDoItemBatchGet,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    found, missing = await ToDoItemService(session, current_user).get_todo_items_by_ids(ids=batch.ids)
+    return {"found": found, "missing": missing}
 
 @todo_items_router.get("/{id}", response_model=ToDoItem, status_code=status.HTTP_200_OK)
-async def read_todo_item(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
-    results = await ToDoItemService(session).get_todo_item(id=id)
+async def read_todo_item(
+    id: uuid.UUID,
+    fields: str | None = None,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    selection = parse_fields(ToDoItem, fields)
+    results = await ToDoItemService(session, current_user).get_todo_item(id=id, selection=selection)
     if results is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Todo item not found")
-    return results
+    if selection.fields is None:
+        return results
+    return sparse_response(ToDoItem, selection, results)
 
 @todo_items_router.put("/{id}", response_model=ToDoItem, status_code=status.HTTP_200_OK)
-async def modify_todo_item(id: str, update_data: ToDoItemUpdate, session: AsyncSession = Depends(get_async_session)):
-    results = await ToDoItemService(session).update_todo_item(id=id, todo_item_update_data=update_data)
+async def modify_todo_item(
+    id: uuid.UUID,
+    update_data: ToDoItemUpdate,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    results = await ToDoItemService(session, current_user).update_todo_item(id=id, todo_item_update_data=update_data)
+    if results is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Todo item not found")
+    return results
+
+@todo_items_router.put("/{id}/complete", response_model=ToDoItem, status_code=status.HTTP_200_OK)
+async def complete_todo_item(
+    id: uuid.UUID,
+    completion: ToDoItemCompletion,
+    current_user: User = Depends(get_current_active_user),
+):
+    results = await completion_batcher.toggle(id, completion.is_complete, current_user.id)
     if results is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Todo item not found")
     return results
 
 @todo_items_router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def destroy_todo_item(id: str, session: AsyncSession = Depends(get_async_session)):
-    await ToDoItemService(session).delete_todo_item(id=id)
+async def destroy_todo_item(
+    id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    await ToDoItemService(session, current_user).delete_todo_item(id=id)
     return
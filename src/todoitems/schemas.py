@@ -1,6 +1,7 @@
 import uuid
+from typing import List, Literal
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 
 class ToDoItemBase(BaseModel):
@@ -20,11 +21,43 @@ class ToDoItemUpdate(BaseModel):
     todolist_id: uuid.UUID | None = None
 
 
+class ToDoItemCompletion(BaseModel):
+    is_complete: bool
+
+
 class ToDoItem(ToDoItemBase):
     id: uuid.UUID
     todolist_id: uuid.UUID
+    archived: bool = False
     created_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class ToDoItemBatchMove(BaseModel):
+    target_list_id: uuid.UUID
+    mode: Literal["move", "copy"] = "move"
+    item_ids: List[uuid.UUID] | None = Field(default=None, max_length=1000)
+    source_list_id: uuid.UUID | None = None
+    is_complete: bool | None = None
+
+    @model_validator(mode="after")
+    def check_selection(self):
+        if not self.item_ids and self.source_list_id is None:
+            raise ValueError("provide item_ids or source_list_id to select the items")
+        return self
+
+
+class ToDoItemBatchMoveResult(BaseModel):
+    affected: int
+
+
+class ToDoItemBatchGet(BaseModel):
+    ids: List[uuid.UUID] = Field(min_length=1, max_length=100)
+
+
+class ToDoItemBatchGetResult(BaseModel):
+    found: List[ToDoItem]
+    missing: List[uuid.UUID]
@@ -1,43 +1,160 @@
+import asyncio
 import uuid
+from datetime import datetime
+from collections import defaultdict
+from sqlalchemy import Boolean, bindparam, case, column, delete, false, insert, literal, or_, update, values
+from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from .models import ToDoItem
-from .schemas import ToDoItemCreate, ToDoItemUpdate
+from sqlalchemy.orm import load_only, noload
+from src.auth.models import User
+from src.changefeed.service import publish_change
+from src.db.db_setup import get_engine
+from src.sync.models import Tombstone
+from src.todolists.cache import invalidate_documents
+from src.todolists.models import ToDoList
+from src.todolists.service import ToDoListService, accessible_list_ids, list_members, match_ids
+from src.utils.errors import ResourceNotFoundException
+from src.utils.fields import FieldSelection, columns
+from .models import ToDoItem, todolist_table
+from .schemas import ToDoItemCreate, ToDoItemUpdate, ToDoItemBatchMove, ToDoItem as ToDoItemSchema
+
+
+# get_todo_item runs on every item request, its statements are built once
+# so the compiled SQL is reused from the engine cache.
+GET_TODO_ITEM = select(ToDoItem).where(ToDoItem.id == bindparam("id")).execution_options(include_archived=True)
+GET_ACCESSIBLE_TODO_ITEM = GET_TODO_ITEM.where(ToDoItem.todolist_id.in_(accessible_list_ids(bindparam("user_id"))))
+
+
+todoitems_table = ToDoItem.__table__
+
+# Items per statement when moving or copying, within the bind parameter limits.
+MOVE_BATCH_SIZE = 1000
+
+
+def completion_update(id, is_complete, user_id, now: datetime):
+    """
+    UPDATE setting ``is_complete`` on an item if ``user_id`` can access its
+    list. Reopened items leave the archive.
+    """
+    return (
+        update(todoitems_table)
+        .where(
+            todoitems_table.c.id == id,
+            todoitems_table.c.deleted_at.is_(None),
+            todoitems_table.c.todolist_id.in_(accessible_list_ids(user_id)),
+            todoitems_table.c.todolist_id.not_in(
+                select(todolist_table.c.id).where(todolist_table.c.deleted_at.is_not(None))
+            ),
+        )
+        .values(
+            is_complete=is_complete,
+            archived=case((is_complete, todoitems_table.c.archived), else_=false()),
+            updated_at=now,
+        )
+        .returning(*todoitems_table.c)
+    )
+
+
+def load_options(selection: FieldSelection | None) -> list:
+    """Loader options reading only the columns a client selected"""
+    if item_columns := columns(selection, ToDoItem):
+        return [load_only(*item_columns), noload(ToDoItem.list)]
+    return []
 
 
 class ToDoItemService:
     """
-    This class provides methods to create, read, update, and delete todo items
+    This class provides methods to create, read, update, and delete todo items.
+
+    Queries are scoped to the items of the lists ``user`` can access.
+    Without a user (background jobs) every item is reachable.
     """
 
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, user: User | None = None):
         self.session = session
+        self.user = user
+
+    def _accessible(self, query):
+        if self.user is None:
+            return query
+        return query.where(ToDoItem.todolist_id.in_(accessible_list_ids(self.user.id)))
 
-    async def get_todo_item(self, id: uuid.UUID):
+    async def _check_list_access(self, todolist_id: uuid.UUID):
+        if not await ToDoListService(self.session, self.user).has_access(todolist_id):
+            raise ResourceNotFoundException()
+
+    async def _tombstone_moved(self, moved: dict[uuid.UUID, list[uuid.UUID]], target_list_id: uuid.UUID, now: datetime):
+        """
+        Tell the users who can see the source list of moved items, but not
+        their new list, to drop them at their next sync. Users who see both
+        lists get the items' update instead.
+
+        Args:
+            moved (dict): the ids of the moved items by source list id
+            target_list_id (uuid.UUID): the list the items moved to
+        """
+        members = await list_members(self.session, [*moved, target_list_id])
+        self.session.add_all([
+            Tombstone(entity="item", entity_id=id, todolist_id=source_list_id, user_id=user_id, deleted_at=now)
+            for source_list_id, ids in moved.items()
+            for user_id in members[source_list_id] - members[target_list_id]
+            for id in ids
+        ])
+
+    async def get_todo_item(self, id: uuid.UUID, selection: FieldSelection | None = None):
         """
         Get a todo item by its UUID.
 
         Args:
             id (uuid.UUID): the UUID of the todo item
+            selection (FieldSelection): only load these fields
 
         Returns:
             ToDoItem: the todo item object
         """
-        query = select(ToDoItem).where(ToDoItem.id == id)
-        results = await self.session.execute(query)
+        query = GET_TODO_ITEM if self.user is None else GET_ACCESSIBLE_TODO_ITEM
+        if options := load_options(selection):
+            query = query.options(*options)
+        params = {"id": id} if self.user is None else {"id": id, "user_id": self.user.id}
+        results = await self.session.execute(query, params)
         return results.scalar_one_or_none()
 
-    async def get_todo_items(self, skip: int = 0, limit: int = 100):
+    async def get_todo_items(
+        self, skip: int = 0, limit: int = 100, include_archived: bool = False, selection: FieldSelection | None = None,
+    ):
         """
         Get a list of all todo items
 
+        Args:
+            include_archived (bool): also read the archived completed items
+            selection (FieldSelection): only load these fields
+
         Returns:
             list: list of todo items
         """
-        query = select(ToDoItem).offset(skip).limit(limit)
+        query = self._accessible(select(ToDoItem)).offset(skip).limit(limit).execution_options(include_archived=include_archived)
+        query = query.options(*load_options(selection))
         results = await self.session.execute(query)
         return results.scalars().all()
 
+    async def get_todo_items_by_ids(self, ids: list[uuid.UUID]) -> tuple[list, list[uuid.UUID]]:
+        """
+        Get a set of todo items with one query.
+
+        Args:
+            ids (list): the UUIDs of the todo items
+
+        Returns:
+            tuple: the items found, in the order of ``ids``, and the ids not
+            found or not accessible
+        """
+        ids = list(dict.fromkeys(ids))
+        query = self._accessible(select(ToDoItem).where(match_ids(ToDoItem.id, ids))).execution_options(include_archived=True)
+        results = await self.session.execute(query)
+        found = {item.id: item for item in results.scalars().all()}
+        return [found[id] for id in ids if id in found], [id for id in ids if id not in found]
+
     async def create_todo_item(self, todo_item: ToDoItemCreate):
         """
         Create a new todo item
@@ -48,6 +165,7 @@ class ToDoItemService:
         Returns:
             ToDoItem: the new todo item
         """
+        await self._check_list_access(todo_item.todolist_id)
         new_todo_item = ToDoItem(
             name=todo_item.name,
             description=todo_item.description,
@@ -57,44 +175,272 @@ class ToDoItemService:
         self.session.add(new_todo_item)
         await self.session.commit()
         await self.session.refresh(new_todo_item)
+        await publish_change(new_todo_item.todolist_id, "item.created", self._event_data(new_todo_item))
         return new_todo_item
     
-    async def update_todo_item(self, id: str, todo_item_update_data: ToDoItemUpdate):
+    async def update_todo_item(self, id: uuid.UUID, todo_item_update_data: ToDoItemUpdate):
         """
         Update a todo item
 
         Args:
-            id (str): the id of the todo item
+            id (uuid.UUID): the id of the todo item
             todo_item_update_data (ToDoItemCreate schema): data to update an existing todo item
 
         Returns:
             ToDoItem: the updated todo item
         """
-        query = select(ToDoItem).where(ToDoItem.id == id)
+        query = self._accessible(select(ToDoItem).where(ToDoItem.id == id)).execution_options(include_archived=True)
         results = await self.session.execute(query)
         existing_item = results.scalar_one_or_none()
 
         if not existing_item:
             return None
         
-        for key, value in todo_item_update_data.model_dump(exclude_unset=True).items():
+        previous_list_id = existing_item.todolist_id
+        update_data = todo_item_update_data.model_dump(exclude_unset=True)
+        new_list_id = update_data.get("todolist_id")
+        if new_list_id is not None and str(new_list_id) != str(previous_list_id):
+            await self._check_list_access(new_list_id)
+        for key, value in update_data.items():
             setattr(existing_item, key, value)
+        if existing_item.archived and not existing_item.is_complete:
+            # Reopened items go back to the hot partition.
+            existing_item.archived = False
+        if str(previous_list_id) != str(existing_item.todolist_id):
+            await self._tombstone_moved({previous_list_id: [existing_item.id]}, existing_item.todolist_id, datetime.now())
         await self.session.commit()
+
+        event_data = self._event_data(existing_item)
+        await publish_change(existing_item.todolist_id, "item.updated", event_data)
+        if str(previous_list_id) != str(existing_item.todolist_id):
+            await publish_change(previous_list_id, "item.updated", event_data)
         return existing_item
         
-    async def delete_todo_item(self, id: str):
+    async def set_completions(self, toggles: list[tuple[uuid.UUID, bool, uuid.UUID]]) -> list[ToDoItemSchema | None]:
+        """
+        Set ``is_complete`` on many items, each on behalf of its own user,
+        in one transaction. The access of each user is checked by the
+        statement itself.
+
+        On PostgreSQL the toggles are applied with one
+        ``UPDATE ... FROM (VALUES ...)`` per round of distinct items (an item
+        toggled twice goes in the next round, so the last toggle wins).
+        Other databases run one UPDATE per toggle.
+
+        Args:
+            toggles (list): (item id, is_complete, user id) in arrival order
+
+        Returns:
+            list: the updated item of each toggle, None when it was not found
+            or not accessible
+        """
+        now = datetime.now()
+        rounds, seen = defaultdict(list), defaultdict(int)
+        for index, toggle in enumerate(toggles):
+            rounds[seen[toggle[0]]].append(index)
+            seen[toggle[0]] += 1
+
+        results: list[ToDoItemSchema | None] = [None] * len(toggles)
+        batched = get_engine().dialect.name == "postgresql"
+        for indexes in rounds.values():
+            if batched:
+                source = values(
+                    column("id", UUID), column("is_complete", Boolean), column("user_id", UUID), name="toggles",
+                ).data([toggles[index] for index in indexes])
+                query = completion_update(source.c.id, source.c.is_complete, source.c.user_id, now)
+                rows = {row.id: row for row in (await self.session.execute(query)).all()}
+            else:
+                rows = {}
+                for index in indexes:
+                    id, is_complete, user_id = toggles[index]
+                    query = completion_update(id, literal(is_complete), user_id, now)
+                    rows.update((row.id, row) for row in (await self.session.execute(query)).all())
+            for index in indexes:
+                row = rows.get(toggles[index][0])
+                results[index] = ToDoItemSchema.model_validate(row._mapping) if row is not None else None
+        await self.session.commit()
+
+        await asyncio.gather(*(
+            publish_change(item.todolist_id, "item.updated", item.model_dump(mode="json"))
+            for item in {item.id: item for item in results if item is not None}.values()
+        ))
+        return results
+
+    async def delete_todo_item(self, id: uuid.UUID):
         """
-        Delete a todo item
+        Soft delete a todo item, the purge job removes it later
 
         Args:
-            id (str): the id of the todo item
+            id (uuid.UUID): the id of the todo item
         """
-        query = select(ToDoItem).where(ToDoItem.id == id)
+        now = datetime.now()
+        query = self._accessible(
+            update(ToDoItem)
+            .where(ToDoItem.id == id, ToDoItem.deleted_at.is_(None))
+            .values(deleted_at=now, updated_at=now)
+            .returning(ToDoItem.id, ToDoItem.todolist_id)
+            .execution_options(synchronize_session=False)
+        )
         results = await self.session.execute(query)
-        existing_item = results.scalars().first()
+        deleted_item = results.first()
 
-        if not existing_item:
+        if not deleted_item:
             return {}
-        await self.session.delete(existing_item)
+        self.session.add(Tombstone(entity="item", entity_id=deleted_item.id, todolist_id=deleted_item.todolist_id, deleted_at=now))
         await self.session.commit()
+        await publish_change(deleted_item.todolist_id, "item.deleted", {"id": str(deleted_item.id)})
         return {}
+
+    async def move_todo_items(self, batch: ToDoItemBatchMove):
+        """
+        Move or copy a set of items to another list. The items are read
+        first (locked on PostgreSQL), then moved with UPDATEs by id or
+        copied with multi-row INSERTs, with ids made here so it works on
+        every database. The target list is checked once.
+
+        Args:
+            batch (ToDoItemBatchMove schema): the target list and the items to select
+
+        Returns:
+            int: the number of moved or copied items
+        """
+        await self._check_list_access(batch.target_list_id)
+
+        conditions = [
+            ToDoItem.deleted_at.is_(None),
+            ToDoItem.todolist_id.not_in(select(todolist_table.c.id).where(todolist_table.c.deleted_at.is_not(None))),
+        ]
+        if self.user is not None:
+            conditions.append(ToDoItem.todolist_id.in_(accessible_list_ids(self.user.id)))
+        if batch.item_ids:
+            conditions.append(ToDoItem.id.in_(batch.item_ids))
+        if batch.source_list_id is not None:
+            conditions.append(ToDoItem.todolist_id == batch.source_list_id)
+        if batch.is_complete is not None:
+            conditions.append(ToDoItem.is_complete == batch.is_complete)
+
+        now = datetime.now()
+        if batch.mode == "copy":
+            query = (
+                select(ToDoItem.name, ToDoItem.description, ToDoItem.is_complete)
+                .where(*conditions)
+                .execution_options(include_archived=True)
+            )
+            copies = [
+                {
+                    "id": uuid.uuid4(), "name": row.name, "description": row.description, "is_complete": row.is_complete,
+                    "todolist_id": batch.target_list_id, "created_at": now, "updated_at": now,
+                }
+                for row in (await self.session.execute(query)).all()
+            ]
+            for start in range(0, len(copies), MOVE_BATCH_SIZE):
+                await self.session.execute(insert(todoitems_table).values(copies[start:start + MOVE_BATCH_SIZE]))
+            new_ids = [str(copy["id"]) for copy in copies]
+            await self.session.commit()
+            if new_ids:
+                await publish_change(batch.target_list_id, "items.copied", {"ids": new_ids, "to_list_id": str(batch.target_list_id)})
+            return len(new_ids)
+
+        query = (
+            select(ToDoItem.id, ToDoItem.todolist_id)
+            .where(ToDoItem.todolist_id != batch.target_list_id, *conditions)
+            .with_for_update()
+            .execution_options(include_archived=True)
+        )
+        moved = defaultdict(list)
+        for id, source_list_id in (await self.session.execute(query)).all():
+            moved[source_list_id].append(id)
+        ids = [id for list_ids in moved.values() for id in list_ids]
+        for start in range(0, len(ids), MOVE_BATCH_SIZE):
+            await self.session.execute(
+                update(ToDoItem)
+                .where(ToDoItem.id.in_(ids[start:start + MOVE_BATCH_SIZE]))
+                .values(todolist_id=batch.target_list_id, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        if moved:
+            await self._tombstone_moved(moved, batch.target_list_id, now)
+        await self.session.commit()
+
+        for source_list_id, ids in moved.items():
+            event_data = {
+                "ids": [str(id) for id in ids], "from_list_id": str(source_list_id), "to_list_id": str(batch.target_list_id),
+            }
+            await publish_change(source_list_id, "items.moved", event_data)
+            await publish_change(batch.target_list_id, "items.moved", event_data)
+        return sum(len(ids) for ids in moved.values())
+
+    async def purge_deleted_items(self, deleted_before: datetime, batch_size: int = 1000):
+        """
+        Hard delete, in batches of one transaction each, the items soft
+        deleted before a cutoff and the items of lists deleted before it
+
+        Args:
+            deleted_before (datetime): the cutoff
+            batch_size (int): maximum rows deleted per transaction
+
+        Returns:
+            int: the number of purged items
+        """
+        purged = 0
+        while True:
+            batch = (
+                select(ToDoItem.id)
+                .where(or_(
+                    ToDoItem.deleted_at < deleted_before,
+                    ToDoItem.todolist_id.in_(select(ToDoList.id).where(ToDoList.deleted_at < deleted_before)),
+                ))
+                .limit(batch_size)
+            )
+            query = delete(ToDoItem).where(ToDoItem.id.in_(batch)).execution_options(synchronize_session=False)
+            results = await self.session.execute(query)
+            await self.session.commit()
+            purged += results.rowcount
+            if results.rowcount < batch_size:
+                return purged
+
+    async def archive_completed_items(self, completed_before: datetime, batch_size: int = 1000):
+        """
+        Move the items completed before a cutoff to the archive, in batches
+        of one transaction each. On a partitioned table every UPDATE moves
+        the rows to the archive partition. ``updated_at`` is bumped so the
+        flag reaches the clients through sync, and the cached documents of
+        the lists are dropped.
+
+        Args:
+            completed_before (datetime): items last updated before it are archived
+            batch_size (int): maximum rows archived per transaction
+
+        Returns:
+            int: the number of archived items
+        """
+        archived = 0
+        while True:
+            batch = (
+                select(ToDoItem.id)
+                .where(
+                    ToDoItem.archived == false(),
+                    ToDoItem.is_complete.is_(True),
+                    ToDoItem.deleted_at.is_(None),
+                    ToDoItem.updated_at < completed_before,
+                )
+                .limit(batch_size)
+            )
+            query = (
+                update(ToDoItem)
+                .where(ToDoItem.archived == false(), ToDoItem.id.in_(batch))
+                .values(archived=True, updated_at=datetime.now())
+                .returning(ToDoItem.todolist_id)
+                .execution_options(synchronize_session=False)
+            )
+            results = await self.session.execute(query)
+            list_ids = results.scalars().all()
+            await self.session.commit()
+            await invalidate_documents(set(list_ids))
+            archived += len(list_ids)
+            if len(list_ids) < batch_size:
+                return archived
+
+    @staticmethod
+    def _event_data(todo_item: ToDoItem) -> dict:
+        return ToDoItemSchema.model_validate(todo_item).model_dump(mode="json")
@@ -0,0 +1,114 @@
+import logging
+import uuid
+from fastapi import Response
+from redis.exceptions import WatchError
+from src.db.redis import get_redis
+from src.utils.compression import negotiate
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Version of a list whose version key does not exist: never changed since
+# the key expired. None stays for "unknown", when redis could not be read.
+INITIAL_VERSION = b"0"
+
+
+def document_key(list_id: uuid.UUID | str) -> str:
+    return f"todolist:{list_id}:document"
+
+
+def version_key(list_id: uuid.UUID | str) -> str:
+    return f"todolist:{list_id}:version"
+
+
+def cache_enabled() -> bool:
+    return settings.TODOLIST_CACHE_TTL_SECONDS > 0
+
+
+def document_response(body: bytes, encoding: str) -> Response:
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def read_document(list_id: uuid.UUID, accept_encoding: str | None) -> tuple[Response | None, bytes | None]:
+    """
+    Get the cached JSON document of a todo list, in the coding the client
+    prefers when it was stored compressed.
+
+    Args:
+        list_id (uuid.UUID): the UUID of the todo list
+        accept_encoding (str): the request's Accept-Encoding header
+
+    Returns:
+        tuple: the response (None on a miss) and the list's version, to
+        load and store the document with on a miss, None when unknown
+    """
+    encoding = negotiate(accept_encoding)
+    fields = [encoding, "identity"] if encoding else ["identity"]
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.hmget(document_key(list_id), fields)
+            pipe.get(version_key(list_id))
+            values, version = await pipe.execute()
+    except Exception as e:
+        logger.warning("could not read the cached document of list %s: %s", list_id, e)
+        return None, None
+    for field, body in zip(fields, values):
+        if body is not None:
+            return document_response(body, field), version
+    return None, version or INITIAL_VERSION
+
+
+async def store_document(list_id: uuid.UUID, variants: dict[str, bytes], version: bytes | None):
+    """
+    Cache the JSON document of a todo list in every available coding, so
+    hits are served without compressing again.
+
+    Nothing is stored when the list changed since ``version`` was read:
+    the document may have been loaded before the change was committed.
+    """
+    key = document_key(list_id)
+    try:
+        async with get_redis().pipeline(transaction=True) as pipe:
+            await pipe.watch(version_key(list_id))
+            if (await pipe.get(version_key(list_id)) or INITIAL_VERSION) == version:
+                pipe.multi()
+                pipe.delete(key)
+                pipe.hset(key, mapping=variants)
+                pipe.expire(key, settings.TODOLIST_CACHE_TTL_SECONDS)
+                await pipe.execute()
+    except WatchError:
+        pass
+    except Exception as e:
+        logger.warning("could not cache the document of list %s: %s", list_id, e)
+
+
+def variant_response(variants: dict[str, bytes], accept_encoding: str | None) -> Response:
+    """Respond with the variant of a document in the coding the client prefers"""
+    encoding = negotiate(accept_encoding)
+    if encoding in variants:
+        return document_response(variants[encoding], encoding)
+    return document_response(variants["identity"], "identity")
+
+
+def invalidate_document(pipe, list_id: uuid.UUID | str):
+    """Queue the commands dropping a list's cached document on a redis pipeline"""
+    pipe.delete(document_key(list_id))
+    pipe.incr(version_key(list_id))
+    pipe.expire(version_key(list_id), settings.TODOLIST_CACHE_TTL_SECONDS * 2)
+
+
+async def invalidate_documents(list_ids):
+    """Drop the cached documents of lists changed outside of a request, e.g. by a job"""
+    if not list_ids:
+        return
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for list_id in list_ids:
+                invalidate_document(pipe, list_id)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("could not drop the cached documents of %d lists: %s", len(list_ids), e)
@@ -1,38 +1,135 @@
 import uuid
 import fastapi
 from typing import List
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from src.auth.dependencies import get_current_active_user
+from src.auth.models import User
 from src.db.db_setup import get_async_session
+from src.todoitems.schemas import ToDoItem
+from src.utils.fields import FieldSelection, parse_fields, sparse_response
+from .cache import cache_enabled, read_document, variant_response
 from .service import ToDoListService
-from .schemas import ToDoListCreate, ToDoList, ToDoListUpdate
+from .schemas import (
+    ToDoListCreate, ToDoList, ToDoListUpdate, ToDoListShare, ToDoListShareCreate,
+    ToDoListBatchGet, ToDoListBatchGetResult,
+)
 
 todo_list_router = fastapi.APIRouter(prefix="/todolists")
 
+# Relations a client can embed with include=, and what it gets by default.
+EMBEDDABLE = {"items": ToDoItem}
+FULL_SELECTION = FieldSelection(include=(("items", FieldSelection()),))
+
 
 @todo_list_router.get("/", response_model=List[ToDoList], status_code=status.HTTP_200_OK)
-async def read_todo_lists(skip: int = 0, limit: int = 100, session: AsyncSession = Depends(get_async_session)):
-    return await ToDoListService(session).get_todo_lists(skip=skip, limit=limit)
+async def read_todo_lists(
+    skip: int = 0,
+    limit: int = 100,
+    fields: str | None = None,
+    include: str = "items",
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    selection = parse_fields(ToDoList, fields, include, EMBEDDABLE)
+    results = await ToDoListService(session, current_user).get_todo_lists(skip=skip, limit=limit, selection=selection)
+    if selection == FULL_SELECTION:
+        return results
+    return sparse_response(ToDoList, selection, results, EMBEDDABLE, many=True)
 
 @todo_list_router.post("/", response_model=ToDoList, status_code=status.HTTP_201_CREATED)
-async def create_new_todo_list(list: ToDoListCreate, session: AsyncSession = Depends(get_async_session)):
-    return await ToDoListService(session).create_todo_list(todo_list=list)
+async def create_new_todo_list(
+    list: ToDoListCreate,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    return await ToDoListService(session, current_user).create_todo_list(todo_list=list)
+
+@todo_list_router.post("/batch", response_model=ToDoListBatchGetResult, status_code=status.HTTP_200_OK)
+async def read_todo_lists_batch(
+    batch: ToDoListBatchGet,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    found, missing = await ToDoListService(session, current_user).get_todo_lists_by_ids(ids=batch.ids)
+    return {"found": found, "missing": missing}
 
 @todo_list_router.get("/{id}", response_model=ToDoList, status_code=status.HTTP_200_OK)
-async def read_todo_list(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
-    results = await ToDoListService(session).get_todo_list(id=id)
-    if results is None:
+async def read_todo_list(
+    id: uuid.UUID,
+    request: Request,
+    fields: str | None = None,
+    include: str = "items",
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    service = ToDoListService(session, current_user)
+    selection = parse_fields(ToDoList, fields, include, EMBEDDABLE)
+    if selection != FULL_SELECTION:
+        results = await service.get_todo_list(id=id, selection=selection)
+        if results is None:
+            raise HTTPException(status_code=404, detail="Todo list not found")
+        return sparse_response(ToDoList, selection, results, EMBEDDABLE)
+
+    # The document is the same for everyone with access, check access
+    # first and serve it from the cache, already compressed.
+    if not await service.has_access(id):
         raise HTTPException(status_code=404, detail="Todo list not found")
-    return results
+    accept_encoding = request.headers.get("accept-encoding")
+    version = None
+    if cache_enabled():
+        cached, version = await read_document(id, accept_encoding)
+        if cached is not None:
+            return cached
+    variants = await service.get_todo_list_document(id=id, version=version)
+    if variants is None:
+        raise HTTPException(status_code=404, detail="Todo list not found")
+    return variant_response(variants, accept_encoding)
 
 @todo_list_router.put("/{id}", response_model=ToDoList, status_code=status.HTTP_200_OK)
-async def modify_todo_list(id: uuid.UUID, update_data: ToDoListUpdate, session: AsyncSession = Depends(get_async_session)):
-    results = await ToDoListService(session).update_todo_list(id=id, todo_list_update_data=update_data)
+async def modify_todo_list(
+    id: uuid.UUID,
+    update_data: ToDoListUpdate,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    results = await ToDoListService(session, current_user).update_todo_list(id=id, todo_list_update_data=update_data)
     if results is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Todo list not found")
     return results
 
 @todo_list_router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def destroy_todo_list(id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
-    await ToDoListService(session).delete_todo_list(id=id)
+async def destroy_todo_list(
+    id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    await ToDoListService(session, current_user).delete_todo_list(id=id)
+    return
+
+@todo_list_router.get("/{id}/shares", response_model=List[ToDoListShare], status_code=status.HTTP_200_OK)
+async def read_todo_list_shares(
+    id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    return await ToDoListService(session, current_user).get_shares(id=id)
+
+@todo_list_router.post("/{id}/shares", response_model=ToDoListShare, status_code=status.HTTP_201_CREATED)
+async def share_todo_list(
+    id: uuid.UUID,
+    share: ToDoListShareCreate,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    return await ToDoListService(session, current_user).share_todo_list(id=id, username=share.username)
+
+@todo_list_router.delete("/{id}/shares/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def unshare_todo_list(
+    id: uuid.UUID,
+    user_id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    await ToDoListService(session, current_user).unshare_todo_list(id=id, user_id=user_id)
     return
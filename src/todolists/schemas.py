@@ -1,7 +1,7 @@
 import uuid
 from typing import List
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from src.todoitems.schemas import ToDoItem
 
 
@@ -19,11 +19,44 @@ class ToDoListUpdate(BaseModel):
     is_active: bool | None = None
 
 
+class ToDoListSummary(ToDoListBase):
+    id: uuid.UUID
+    owner_id: uuid.UUID | None = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class ToDoList(ToDoListBase):
     id: uuid.UUID
+    owner_id: uuid.UUID | None = None
     items: List[ToDoItem] = []
     created_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class ToDoListShareCreate(BaseModel):
+    username: str
+
+
+class ToDoListShare(BaseModel):
+    todolist_id: uuid.UUID
+    user_id: uuid.UUID
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ToDoListBatchGet(BaseModel):
+    ids: List[uuid.UUID] = Field(min_length=1, max_length=100)
+
+
+class ToDoListBatchGetResult(BaseModel):
+    found: List[ToDoList]
+    missing: List[uuid.UUID]
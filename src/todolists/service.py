@@ -1,43 +1,208 @@
 import uuid
+from datetime import datetime
+from sqlalchemy import any_, bindparam, delete, or_, union_all, update
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from .models import ToDoList
-from .schemas import ToDoListCreate, ToDoListUpdate
+from sqlalchemy.orm import load_only, noload, selectinload
+from src.auth.models import User
+from src.auth.service import UserService
+from src.changefeed.service import publish_change
+from src.db.db_setup import AsyncSessionLocal, get_engine
+from src.db.sharding import shard_for_user, sharding_enabled
+from src.sync.models import Tombstone
+from src.todoitems.models import ToDoItem
+from src.utils.compression import compress_variants
+from src.utils.errors import CrossShardShareException, ResourceNotFoundException
+from src.utils.fields import FieldSelection, columns
+from src.utils.singleflight import SingleFlight
+from .cache import cache_enabled, store_document
+from .models import ToDoList, ToDoListShare
+from .schemas import ToDoListCreate, ToDoListUpdate, ToDoList as ToDoListSchema
+
+todolist_table = ToDoList.__table__
+share_table = ToDoListShare.__table__
+
+
+def accessible_list_ids(user_id: uuid.UUID):
+    """
+    Subquery of the ids of the lists a user owns or that are shared with
+    them. It reads the tables rather than the entities so soft deleted lists
+    are included, callers filter those out themselves when needed.
+    """
+    return union_all(
+        select(todolist_table.c.id).where(todolist_table.c.owner_id == user_id),
+        select(share_table.c.todolist_id).where(share_table.c.user_id == user_id),
+    )
+
+
+async def list_members(session: AsyncSession, ids: list[uuid.UUID]) -> dict[uuid.UUID, set[uuid.UUID]]:
+    """
+    The users who can access each of a set of lists: the owner and the
+    users the list is shared with
+
+    Returns:
+        dict: the user ids by list id
+    """
+    query = union_all(
+        select(todolist_table.c.id, todolist_table.c.owner_id).where(todolist_table.c.id.in_(ids)),
+        select(share_table.c.todolist_id, share_table.c.user_id).where(share_table.c.todolist_id.in_(ids)),
+    )
+    members = {id: set() for id in ids}
+    for list_id, user_id in (await session.execute(query)).all():
+        if user_id is not None:
+            members[list_id].add(user_id)
+    return members
+
+
+def match_ids(column, ids: list[uuid.UUID]):
+    """
+    Condition matching a set of ids. On PostgreSQL it is ``column = ANY(:ids)``
+    with one array parameter, so the statement (and its prepared statement)
+    is the same whatever the number of ids.
+    """
+    if get_engine().dialect.name == "postgresql":
+        return column == any_(bindparam("ids", list(ids), type_=ARRAY(column.type)))
+    return column.in_(ids)
+
+
+def load_options(selection: FieldSelection | None) -> list:
+    """Loader options reading only the columns and relations a client selected"""
+    if selection is None:
+        return []
+    options = []
+    if list_columns := columns(selection, ToDoList):
+        options.append(load_only(*list_columns))
+    items = selection.embedded("items")
+    if items is None:
+        options.append(noload(ToDoList.items))
+    elif item_columns := columns(items, ToDoItem):
+        options.append(selectinload(ToDoList.items).load_only(*item_columns))
+    return options
+
+
+# Concurrent reads of the same list document on this worker share one load.
+document_flight = SingleFlight("todolist_document")
+
+
+async def load_todo_list_document(id: uuid.UUID, version: bytes | None) -> dict[str, bytes] | None:
+    """
+    Load a todo list with its own session, serialize and compress it, and
+    cache the result. There is no access check, callers do their own.
+
+    Returns:
+        dict: the JSON document by coding, None when the list does not exist
+    """
+    async with AsyncSessionLocal() as session:
+        todo_list = await ToDoListService(session).get_todo_list(id=id)
+        if todo_list is None:
+            return None
+        body = ToDoListSchema.model_validate(todo_list).model_dump_json().encode()
+    variants = compress_variants(body)
+    if cache_enabled():
+        await store_document(id, variants, version)
+    return variants
 
 
 class ToDoListService:
     """
-    This class provides methods to create, read, update, and delete todo lists
+    This class provides methods to create, read, update, and delete todo lists.
+
+    Queries are scoped to the lists ``user`` owns or that are shared with
+    them. Without a user (background jobs) every list is reachable.
     """
 
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, user: User | None = None):
         self.session = session
+        self.user = user
+
+    def _accessible(self, query):
+        if self.user is None:
+            return query
+        shared = select(share_table.c.todolist_id).where(share_table.c.user_id == self.user.id)
+        return query.where(or_(ToDoList.owner_id == self.user.id, ToDoList.id.in_(shared)))
+
+    def _owned(self, query):
+        if self.user is None:
+            return query
+        return query.where(ToDoList.owner_id == self.user.id)
+
+    async def has_access(self, id: uuid.UUID) -> bool:
+        """
+        Whether the user can access a todo list, without loading its items
+
+        Args:
+            id (uuid.UUID): the UUID of the todo list
+        """
+        query = self._accessible(select(ToDoList.id).where(ToDoList.id == id))
+        results = await self.session.execute(query)
+        return results.scalar_one_or_none() is not None
 
-    async def get_todo_list(self, id: uuid.UUID):
+    async def get_todo_list(self, id: uuid.UUID, selection: FieldSelection | None = None):
         """
         Get a todo list by its UUID.
 
         Args:
             id (uuid.UUID): the UUID of the todo list
+            selection (FieldSelection): only load these fields and relations
 
         Returns:
             ToDoList: the todo list object
         """
-        query = select(ToDoList).where(ToDoList.id == id)
+        query = self._accessible(select(ToDoList).where(ToDoList.id == id)).options(*load_options(selection))
         results = await self.session.execute(query)
         return results.scalar_one_or_none()
 
-    async def get_todo_lists(self, skip: int = 0, limit: int = 100):
+    async def get_todo_list_document(self, id: uuid.UUID, version: bytes | None = None) -> dict[str, bytes] | None:
+        """
+        Get the JSON document of a todo list, once ``has_access`` allowed it.
+        Concurrent calls for the same list and cached version share one load.
+        Without a version (caching off, redis unavailable) every call loads
+        its own: a load started before the caller's last write could
+        otherwise be shared with it.
+
+        Args:
+            id (uuid.UUID): the UUID of the todo list
+            version (bytes): the list's cache version, from ``read_document``
+
+        Returns:
+            dict: the JSON document by coding, None when the list does not exist
+        """
+        if version is None:
+            return await load_todo_list_document(id, version)
+        return await document_flight.do((id, version), lambda: load_todo_list_document(id, version))
+
+    async def get_todo_lists(self, skip: int = 0, limit: int = 100, selection: FieldSelection | None = None):
         """
         Get a list of all todo lists
 
+        Args:
+            selection (FieldSelection): only load these fields and relations
+
         Returns:
             list: list of todo lists
         """
-        query = select(ToDoList).offset(skip).limit(limit)
+        query = self._accessible(select(ToDoList)).offset(skip).limit(limit).options(*load_options(selection))
         results = await self.session.execute(query)
         return results.scalars().all()
 
+    async def get_todo_lists_by_ids(self, ids: list[uuid.UUID]) -> tuple[list, list[uuid.UUID]]:
+        """
+        Get a set of todo lists with one query, and their items with one more.
+
+        Args:
+            ids (list): the UUIDs of the todo lists
+
+        Returns:
+            tuple: the lists found, in the order of ``ids``, and the ids not
+            found or not accessible
+        """
+        ids = list(dict.fromkeys(ids))
+        query = self._accessible(select(ToDoList).where(match_ids(ToDoList.id, ids)))
+        results = await self.session.execute(query)
+        found = {todo_list.id: todo_list for todo_list in results.scalars().all()}
+        return [found[id] for id in ids if id in found], [id for id in ids if id not in found]
+
     async def create_todo_list(self, todo_list: ToDoListCreate):
         """
         Create a new todo list
@@ -50,7 +215,8 @@ class ToDoListService:
         """
         new_todo_list = ToDoList(
             title=todo_list.title,
-            is_active=todo_list.is_active
+            is_active=todo_list.is_active,
+            owner_id=self.user.id if self.user else None,
         )
         self.session.add(new_todo_list)
         await self.session.commit()
@@ -68,7 +234,7 @@ class ToDoListService:
         Returns:
             ToDoList: the updated todo list
         """
-        query = select(ToDoList).where(ToDoList.id == id)
+        query = self._accessible(select(ToDoList).where(ToDoList.id == id))
         results = await self.session.execute(query)
         existing_todo_list = results.scalars().first()
         
@@ -78,21 +244,140 @@ class ToDoListService:
         for key, value in todo_list_update_data.model_dump(exclude_unset=True).items():
             setattr(existing_todo_list, key, value)
         await self.session.commit()
+        await publish_change(
+            existing_todo_list.id,
+            "list.updated",
+            ToDoListSchema.model_validate(existing_todo_list).model_dump(mode="json", exclude={"items"}),
+        )
         return existing_todo_list
 
     async def delete_todo_list(self, id: uuid.UUID):
         """
-        Delete a todo list
+        Soft delete a todo list. Only the list row is touched; its items are
+        hidden with it and removed by the purge job. Only the owner can
+        delete a list.
 
         Args:
             id (uuid.UUID): the UUID of the todo list
         """
-        query = select(ToDoList).where(ToDoList.id == id)
+        now = datetime.now()
+        query = self._owned(
+            update(ToDoList)
+            .where(ToDoList.id == id, ToDoList.deleted_at.is_(None))
+            .values(deleted_at=now, updated_at=now)
+            .returning(ToDoList.id, ToDoList.owner_id)
+            .execution_options(synchronize_session=False)
+        )
         results = await self.session.execute(query)
-        existing_todo_list = results.scalars().first()
+        deleted_list = results.first()
 
-        if not existing_todo_list:
+        if not deleted_list:
             return {}
-        await self.session.delete(existing_todo_list)
+        # One tombstone per user with access, they outlive the purged list and its shares.
+        query = select(share_table.c.user_id).where(share_table.c.todolist_id == id)
+        shared_with = (await self.session.execute(query)).scalars().all()
+        self.session.add_all([
+            Tombstone(entity="list", entity_id=deleted_list.id, todolist_id=deleted_list.id, user_id=user_id, deleted_at=now)
+            for user_id in [deleted_list.owner_id, *shared_with]
+        ])
+        await self.session.commit()
+        await publish_change(id, "list.deleted", {"id": str(id)})
+        return {}
+
+    async def purge_deleted_lists(self, deleted_before: datetime, batch_size: int = 1000):
+        """
+        Hard delete, in batches of one transaction each, the lists soft
+        deleted before a cutoff. Items left behind go with them through the
+        ON DELETE CASCADE foreign key.
+
+        Args:
+            deleted_before (datetime): the cutoff
+            batch_size (int): maximum rows deleted per transaction
+
+        Returns:
+            int: the number of purged lists
+        """
+        purged = 0
+        while True:
+            batch = select(ToDoList.id).where(ToDoList.deleted_at < deleted_before).limit(batch_size)
+            query = delete(ToDoList).where(ToDoList.id.in_(batch)).execution_options(synchronize_session=False)
+            results = await self.session.execute(query)
+            await self.session.commit()
+            purged += results.rowcount
+            if results.rowcount < batch_size:
+                return purged
+
+    async def get_shares(self, id: uuid.UUID):
+        """
+        Get the users a todo list is shared with. Only the owner can see them.
+
+        Args:
+            id (uuid.UUID): the UUID of the todo list
+
+        Returns:
+            list: the shares of the list
+        """
+        if not await self._is_owner(id):
+            raise ResourceNotFoundException()
+        query = select(ToDoListShare).where(ToDoListShare.todolist_id == id).order_by(ToDoListShare.created_at)
+        results = await self.session.execute(query)
+        return results.scalars().all()
+
+    async def share_todo_list(self, id: uuid.UUID, username: str):
+        """
+        Share a todo list with another user. Sharing again is a no-op.
+        With sharding enabled a list can only be shared with users on the
+        owner's shard, CrossShardShareException is raised for the others.
+
+        Args:
+            id (uuid.UUID): the UUID of the todo list
+            username (str): the user to share the list with
+
+        Returns:
+            ToDoListShare: the share
+        """
+        if not await self._is_owner(id):
+            raise ResourceNotFoundException()
+        user = await UserService().get_user_by_username(session=self.session, username=username)
+        if user is None or user.id == self.user.id:
+            raise ResourceNotFoundException()
+        if sharding_enabled() and shard_for_user(user.id) != shard_for_user(self.user.id):
+            raise CrossShardShareException()
+
+        share = await self.session.get(ToDoListShare, (id, user.id))
+        if share is None:
+            share = ToDoListShare(todolist_id=id, user_id=user.id)
+            self.session.add(share)
+            await self.session.commit()
+            await self.session.refresh(share)
+            await publish_change(id, "list.shared", {"user_id": str(user.id)})
+        return share
+
+    async def unshare_todo_list(self, id: uuid.UUID, user_id: uuid.UUID):
+        """
+        Stop sharing a todo list with a user. The owner can remove anyone,
+        a user the list is shared with can remove themselves.
+
+        Args:
+            id (uuid.UUID): the UUID of the todo list
+            user_id (uuid.UUID): the user losing access
+        """
+        if self.user.id != user_id and not await self._is_owner(id):
+            raise ResourceNotFoundException()
+        query = (
+            delete(ToDoListShare)
+            .where(ToDoListShare.todolist_id == id, ToDoListShare.user_id == user_id)
+            .returning(ToDoListShare.user_id)
+        )
+        results = await self.session.execute(query)
+        if results.scalar_one_or_none() is None:
+            raise ResourceNotFoundException()
+        self.session.add(Tombstone(entity="list", entity_id=id, todolist_id=id, user_id=user_id))
         await self.session.commit()
-        return {}
\ No newline at end of file
+        await publish_change(id, "list.unshared", {"user_id": str(user_id)})
+        return {}
+
+    async def _is_owner(self, id: uuid.UUID) -> bool:
+        query = self._owned(select(ToDoList.id).where(ToDoList.id == id))
+        results = await self.session.execute(query)
+        return results.scalar_one_or_none() is not None
@@ -1,18 +1,177 @@
+"""
+Celery app and tasks.
+
+Tasks are routed to named queues so that bulk traffic can't delay the
+emails a user is waiting for:
+
+- transactional: account verification and password reset emails
+- bulk: emails sent to many recipients, e.g. from POST /auth/send-mail
+- maintenance: the periodic purge and archive jobs
+
+Queues are listed by priority. A worker consuming several of them on the
+redis broker (``-Q transactional,bulk,maintenance``) drains them in that
+order. For a hard guarantee, run a dedicated worker per queue
+(``celery -A src.utils.celery_tasks worker -Q transactional``). The rate
+limits of the email tasks apply per worker, so they are the rate limits
+of their queues.
+"""
+import logging
+from datetime import datetime, timedelta
 from celery import Celery
-from .mail import mail, create_message
+from celery.signals import before_task_publish, setup_logging, task_postrun, task_prerun, worker_init
+from celery.utils.time import get_exponential_backoff_interval
+from kombu import Queue
 from .config import settings
+from .logs import configure_logging, request_id
 from asgiref.sync import async_to_sync
 
+logger = logging.getLogger(__name__)
+
+TRANSACTIONAL_QUEUE = "transactional"
+BULK_QUEUE = "bulk"
+MAINTENANCE_QUEUE = "maintenance"
+
 
 celery_app = Celery(
     backend=settings.CELERY_RESULT_BACKEND,
     broker=settings.CELERY_BROKER_URL,
     broker_connection_retry_on_startup=True
 )
+celery_app.conf.update(
+    task_queues=[Queue(TRANSACTIONAL_QUEUE), Queue(BULK_QUEUE), Queue(MAINTENANCE_QUEUE)],
+    task_default_queue=BULK_QUEUE,
+    broker_transport_options={
+        "queue_order_strategy": "priority",
+        "visibility_timeout": settings.CELERY_BROKER_VISIBILITY_TIMEOUT_SECONDS,
+    },
+    # A worker only reserves the tasks it is about to run, and acknowledges
+    # them once done: a task of a crashed worker is delivered again instead
+    # of being lost, so tasks must be safe to run twice.
+    worker_prefetch_multiplier=settings.CELERY_WORKER_PREFETCH_MULTIPLIER,
+    task_acks_late=settings.CELERY_TASK_ACKS_LATE,
+    task_reject_on_worker_lost=settings.CELERY_TASK_ACKS_LATE,
+)
 
-@celery_app.task()
-def send_email(recipients: list[str], subject: str, body: str):
+@setup_logging.connect
+def _configure_logging(**kwargs):
+    # Connected, so Celery leaves the root logger to us.
+    configure_logging()
+
+@before_task_publish.connect
+def _add_request_id(headers=None, **kwargs):
+    # Tasks enqueued while handling a request carry its id to the worker.
+    if headers is not None and request_id.get() is not None:
+        headers.setdefault("request_id", request_id.get())
+
+@task_prerun.connect
+def _set_request_id(task_id=None, task=None, **kwargs):
+    # Tasks not enqueued by a request, e.g. scheduled ones, log their task id.
+    request_id.set(getattr(task.request, "request_id", None) or task_id)
+
+@task_postrun.connect
+def _clear_request_id(**kwargs):
+    request_id.set(None)
+
+@worker_init.connect
+def _precompile_email_templates(**kwargs):
+    # Compiled once in the main process, before a prefork pool forks.
+    from .email_templates import precompile_templates
+
+    precompile_templates()
+
+def _deliver_email(task, recipients: list[str], template: str, context: dict, locale: str | None):
+    """
+    Render an email and send it, retrying with an exponential backoff when
+    the SMTP server can't be reached. Messages on the broker only carry the
+    template name and its context.
+    """
+    from fastapi_mail.errors import ConnectionErrors
+    from .email_templates import render_email
+    from .mail import get_mail, create_message
+
+    subject, body = render_email(template, context, locale)
     message = create_message(recipients=recipients, subject=subject, body=body)
-    async_to_sync(mail.send_message)(message)
-    print("Email sent successfully by Celery task")
+    try:
+        async_to_sync(get_mail().send_message)(message)
+    except (ConnectionErrors, OSError) as e:
+        countdown = get_exponential_backoff_interval(
+            factor=settings.CELERY_TASK_RETRY_BACKOFF_SECONDS,
+            retries=task.request.retries,
+            maximum=settings.CELERY_TASK_RETRY_BACKOFF_MAX_SECONDS,
+            full_jitter=True,
+        )
+        raise task.retry(exc=e, countdown=countdown)
+
+@celery_app.task(bind=True, max_retries=settings.CELERY_TASK_MAX_RETRIES, rate_limit=settings.CELERY_TRANSACTIONAL_RATE_LIMIT)
+def send_email(self, recipients: list[str], template: str, context: dict, locale: str | None = None):
+    _deliver_email(self, recipients, template, context, locale)
+    logger.info("email %s sent", template)
+
+@celery_app.task(bind=True, max_retries=settings.CELERY_TASK_MAX_RETRIES, rate_limit=settings.CELERY_BULK_RATE_LIMIT)
+def send_bulk_email(self, recipients: list[str], template: str, context: dict, locale: str | None = None):
+    _deliver_email(self, recipients, template, context, locale)
+    logger.info("bulk email %s sent to %d recipients", template, len(recipients))
+
+async def _purge_deleted_records():
+    from src.db.db_setup import AsyncSessionLocal, get_engine, dispose_engine
+    from src.todoitems.service import ToDoItemService
+    from src.todolists.service import ToDoListService
+    from src.sync.service import SyncService
+
+    now = datetime.now()
+    deleted_before = now - timedelta(hours=settings.SOFT_DELETE_RETENTION_HOURS)
+    tombstones_before = now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    batch_size = settings.PURGE_BATCH_SIZE
+
+    get_engine()
+    try:
+        async with AsyncSessionLocal() as session:
+            items = await ToDoItemService(session).purge_deleted_items(deleted_before, batch_size)
+            lists = await ToDoListService(session).purge_deleted_lists(deleted_before, batch_size)
+            tombstones = await SyncService(session).purge_tombstones(tombstones_before, batch_size)
+    finally:
+        # Each task run gets its own event loop, pooled connections can't be reused.
+        await dispose_engine()
+    return {"items": items, "lists": lists, "tombstones": tombstones}
+
+@celery_app.task()
+def purge_deleted_records():
+    results = async_to_sync(_purge_deleted_records)()
+    logger.info("purged deleted records", extra={"purged": results})
+    return results
+
+async def _archive_completed_items():
+    from src.db.db_setup import AsyncSessionLocal, get_engine, dispose_engine
+    from src.todoitems.service import ToDoItemService
+
+    completed_before = datetime.now() - timedelta(days=settings.ARCHIVE_COMPLETED_AFTER_DAYS)
+    get_engine()
+    try:
+        async with AsyncSessionLocal() as session:
+            return await ToDoItemService(session).archive_completed_items(completed_before, settings.PURGE_BATCH_SIZE)
+    finally:
+        await dispose_engine()
+
+@celery_app.task()
+def archive_completed_items():
+    archived = async_to_sync(_archive_completed_items)()
+    logger.info("archived %d completed items", archived)
+    return archived
+
+celery_app.conf.task_routes = {
+    send_email.name: {"queue": TRANSACTIONAL_QUEUE},
+    send_bulk_email.name: {"queue": BULK_QUEUE},
+    purge_deleted_records.name: {"queue": MAINTENANCE_QUEUE},
+    archive_completed_items.name: {"queue": MAINTENANCE_QUEUE},
+}
 
+celery_app.conf.beat_schedule = {
+    "purge-deleted-records": {
+        "task": purge_deleted_records.name,
+        "schedule": settings.PURGE_INTERVAL_SECONDS,
+    },
+    "archive-completed-items": {
+        "task": archive_completed_items.name,
+        "schedule": settings.ARCHIVE_INTERVAL_SECONDS,
+    },
+}
@@ -0,0 +1,187 @@
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from .config import settings
+
+# Preferred first when the client accepts several codings equally.
+# brotli and zstd need the optional ``brotli`` and ``zstandard`` packages
+# listed in requirements-optional.txt.
+PREFERRED_ENCODINGS = ("zstd", "br", "gzip")
+
+# Streams that must reach the client event by event, or are already compressed.
+EXCLUDED_MEDIA_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+def _load_codecs() -> dict:
+    codecs = {"gzip": None}
+    try:
+        import brotli
+        codecs["br"] = brotli
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        codecs["zstd"] = zstandard
+    except ImportError:
+        pass
+    return codecs
+
+
+_codecs = _load_codecs()
+
+
+def available_encodings() -> list[str]:
+    return [encoding for encoding in PREFERRED_ENCODINGS if encoding in _codecs]
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """
+    Pick the content coding for a response from an Accept-Encoding header
+
+    Args:
+        accept_encoding (str): the header value, e.g. "gzip, br;q=0.9"
+
+    Returns:
+        str: the chosen coding, None to send the body as is
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                continue
+        weights[coding.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, wildcard)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a whole body with one of the available codings"""
+    if encoding == "gzip":
+        compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == "br":
+        return _codecs["br"].compress(data, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return _codecs["zstd"].ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compress(data)
+
+
+def compress_variants(data: bytes) -> dict[str, bytes]:
+    """
+    The body in every available coding, for caching a response once and
+    serving it to any client. Bodies under COMPRESSION_MINIMUM_SIZE are
+    only kept as is.
+
+    Returns:
+        dict: body by coding, "identity" for the uncompressed one
+    """
+    variants = {"identity": data}
+    if len(data) >= settings.COMPRESSION_MINIMUM_SIZE:
+        variants.update((encoding, compress(data, encoding)) for encoding in available_encodings())
+    return variants
+
+
+class StreamCompressor:
+    """Compress a body sent in several chunks, flushing after each one"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = _codecs["br"].Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = _codecs["zstd"].ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        zstandard = _codecs["zstd"]
+        return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with the best coding the client
+    accepts (zstd, brotli or gzip).
+
+    Bodies sent in one message are left alone under ``minimum_size``.
+    Streamed bodies are compressed chunk by chunk, each chunk flushed so
+    the client is not kept waiting. Responses that already carry a
+    Content-Encoding, e.g. a pre-compressed cache entry, pass through.
+    """
+
+    def __init__(self, app, minimum_size: int | None = None):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MINIMUM_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        compressor: StreamCompressor | None = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is not None:
+                chunk = compressor.compress(body)
+                if not more_body:
+                    chunk += compressor.finish()
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+
+            headers = MutableHeaders(raw=list(start_message["headers"]))
+            media_type = headers.get("content-type", "")
+            if (
+                "content-encoding" in headers
+                or media_type.startswith(EXCLUDED_MEDIA_TYPES)
+                or (not more_body and len(body) < self.minimum_size)
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            headers["Content-Encoding"] = encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+                compressor = StreamCompressor(encoding)
+                body = compressor.compress(body)
+            else:
+                body = compress(body, encoding)
+                headers["Content-Length"] = str(len(body))
+            await send({**start_message, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
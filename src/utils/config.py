@@ -24,8 +24,73 @@ class Settings(BaseSettings):
     MAIL_PORT: int
     MAIL_SERVER: str
     MAIL_FROM_NAME: str
+    EMAIL_DEFAULT_LOCALE: str = "en"
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
+    CELERY_WORKER_PREFETCH_MULTIPLIER: int = 1
+    CELERY_TASK_ACKS_LATE: bool = True
+    CELERY_TASK_MAX_RETRIES: int = 5
+    CELERY_TASK_RETRY_BACKOFF_SECONDS: int = 10
+    CELERY_TASK_RETRY_BACKOFF_MAX_SECONDS: int = 600
+    # Must outlast the longest task and retry countdown with late acks on redis.
+    CELERY_BROKER_VISIBILITY_TIMEOUT_SECONDS: int = 3600
+    CELERY_TRANSACTIONAL_RATE_LIMIT: str | None = None
+    CELERY_BULK_RATE_LIMIT: str | None = "120/m"
+    SQL_INSTRUMENTATION_ENABLED: bool = True
+    SQL_COMPILED_CACHE_SIZE: int = 1000
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 256
+    DB_PGBOUNCER_TRANSACTION_MODE: bool = False
+    SQL_SLOW_REQUEST_MS: float = 500.0
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    REQUEST_ID_HEADER: str = "X-Request-ID"
+    # Fraction of the successful requests that are logged, errors and
+    # requests slower than LOG_ACCESS_SLOW_MS are always logged.
+    LOG_ACCESS_SAMPLE_RATE: float = 1.0
+    LOG_ACCESS_SLOW_MS: float = 1000.0
+    SQL_SLOW_REQUEST_QUERY_COUNT: int = 25
+    LOOP_MONITOR_ENABLED: bool = False
+    LOOP_MONITOR_INTERVAL_MS: float = 100.0
+    LOOP_MONITOR_BLOCK_THRESHOLD_MS: float = 100.0
+    PROFILING_ENABLED: bool = False
+    PROFILING_MAX_SECONDS: int = 60
+    PROFILING_REQUEST_TOKEN: str = ""
+    CHANGE_FEED_MAXLEN: int = 1000
+    CHANGE_FEED_POLL_MS: int = 1000
+    CHANGE_FEED_HEARTBEAT_SECONDS: int = 15
+    CHANGE_FEED_QUEUE_SIZE: int = 100
+    FEED_TOKEN_EXPIRE_SECONDS: int = 60
+    SOFT_DELETE_RETENTION_HOURS: int = 24
+    SYNC_TOMBSTONE_RETENTION_DAYS: int = 30
+    SYNC_SAFETY_WINDOW_SECONDS: float = 5.0
+    PURGE_BATCH_SIZE: int = 1000
+    PURGE_INTERVAL_SECONDS: int = 3600
+    ARCHIVE_COMPLETED_AFTER_DAYS: int = 365
+    ARCHIVE_INTERVAL_SECONDS: int = 86400
+    SHARD_URLS: dict[str, str] = {}
+    SHARD_VIRTUAL_NODES: int = 64
+    SHARD_REBALANCE_FROM_URLS: dict[str, str] = {}
+    SHARD_FENCE_SECONDS: int = 600
+    SHARD_FENCE_GRACE_SECONDS: float = 5.0
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    TODOLIST_CACHE_TTL_SECONDS: int = 300
+    IDEMPOTENT_PATHS: list[str] = ["/todolists/", "/todoitems/", "/auth/users/signup"]
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_LOCK_SECONDS: int = 30
+    IDEMPOTENCY_LOCK_WAIT_SECONDS: float = 5.0
+    COMPLETION_BATCH_WINDOW_MS: float = 5.0
+    COMPLETION_BATCH_MAX_SIZE: int = 500
+    # New passwords are hashed with the first scheme, hashes of the others
+    # are upgraded at login. argon2 needs the optional ``argon2-cffi`` package.
+    PASSWORD_HASH_SCHEMES: list[str] = ["bcrypt"]
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_ARGON2_TIME_COST: int = 3
+    PASSWORD_ARGON2_MEMORY_COST: int = 65536
+    PASSWORD_ARGON2_PARALLELISM: int = 4
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 
@@ -0,0 +1,95 @@
+from functools import lru_cache
+from pathlib import Path
+from .config import settings
+
+# One folder per locale ("en", "fr", "pt_BR", ...) holding a template per
+# email, all extending the shared base.html. The subject is the template's
+# ``subject`` block.
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "templates" / "email"
+
+
+@lru_cache
+def get_environment():
+    """
+    Build the Jinja2 environment on first use, so only the worker loads it.
+    Compiled templates are never evicted nor checked for changes on disk.
+    """
+    from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(["html"]),
+        undefined=StrictUndefined,
+        auto_reload=False,
+        cache_size=-1,
+    )
+
+
+def precompile_templates() -> int:
+    """
+    Compile every email template into the environment's cache, run when a
+    worker starts so no email pays for parsing its template.
+
+    Returns:
+        int: the number of templates compiled
+    """
+    environment = get_environment()
+    names = environment.list_templates(extensions=["html"])
+    for name in names:
+        environment.get_template(name)
+    return len(names)
+
+
+def preferred_locale(accept_language: str | None) -> str | None:
+    """
+    The locale a client prefers the most, from an Accept-Language header
+
+    Args:
+        accept_language (str): the header value, e.g. "fr-CA,fr;q=0.9,en;q=0.8"
+
+    Returns:
+        str: e.g. "fr_CA", None when the header names no locale
+    """
+    best, best_weight = None, 0.0
+    for part in (accept_language or "").split(","):
+        tag, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                continue
+        tag = tag.strip()
+        if tag and tag != "*" and weight > best_weight:
+            best, best_weight = tag.replace("-", "_"), weight
+    return best
+
+
+def _candidates(name: str, locale: str | None) -> list[str]:
+    """Template paths to try for a locale: "fr_CA", then "fr", then the default"""
+    locales = []
+    if locale:
+        locales += [locale, locale.split("_")[0]]
+    locales.append(settings.EMAIL_DEFAULT_LOCALE)
+    return [f"{candidate}/{name}.html" for candidate in dict.fromkeys(locales)]
+
+
+def render_email(name: str, context: dict, locale: str | None = None) -> tuple[str, str]:
+    """
+    Render an email in the closest available locale
+
+    Args:
+        name (str): the template name, e.g. "verify_email"
+        context (dict): the template variables
+        locale (str): e.g. "fr_CA", None for EMAIL_DEFAULT_LOCALE
+
+    Returns:
+        tuple: the subject and the HTML body
+    """
+    from markupsafe import Markup
+
+    template = get_environment().select_template(_candidates(name, locale))
+    context = {**context, "language": template.name.split("/")[0].replace("_", "-")}
+    subject = "".join(template.blocks["subject"](template.new_context(context)))
+    return Markup(subject).unescape().strip(), template.render(context)
@@ -79,6 +79,31 @@ class UserInactiveOrNotFoundException(ToDOApiException):
     pass
 
 
+class ProfilerBusyException(ToDOApiException):
+    """A profiling session is already running on this worker."""
+    pass
+
+
+class InvalidSyncCursorException(ToDOApiException):
+    """The provided sync cursor could not be decoded."""
+    pass
+
+
+class InvalidFieldSelectionException(ToDOApiException):
+    """The fields or include query parameters name an unknown field."""
+    pass
+
+
+class ShardMoveInProgressException(ToDOApiException):
+    """The user's data is being moved to another shard, writes are refused."""
+    pass
+
+
+class CrossShardShareException(ToDOApiException):
+    """The list can't be shared with a user whose data is on another shard."""
+    pass
+
+
 class InternalServerErrorException(ToDOApiException):
     """Custom HTTP 500 error"""
     pass
@@ -233,6 +258,56 @@ def register_custom_errors(app: FastAPI):
             }
         )
     )
+    app.add_exception_handler(
+        ProfilerBusyException,
+        create_exception_handler(
+            status_code=status.HTTP_409_CONFLICT,
+            details={
+                "message": "a profiling session is already running on this worker",
+                "error_code": "CE018"
+            }
+        )
+    )
+    app.add_exception_handler(
+        InvalidSyncCursorException,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            details={
+                "message": "invalid sync cursor, start a full sync without a cursor",
+                "error_code": "CE020"
+            }
+        )
+    )
+    app.add_exception_handler(
+        InvalidFieldSelectionException,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            details={
+                "message": "unknown field in the fields or include parameters",
+                "error_code": "CE021"
+            }
+        )
+    )
+    app.add_exception_handler(
+        ShardMoveInProgressException,
+        create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            details={
+                "message": "your data is being moved, please retry in a few minutes",
+                "error_code": "CE025"
+            }
+        )
+    )
+    app.add_exception_handler(
+        CrossShardShareException,
+        create_exception_handler(
+            status_code=status.HTTP_409_CONFLICT,
+            details={
+                "message": "sharing with this user is not supported, their data is stored on another shard",
+                "error_code": "CE026"
+            }
+        )
+    )
     app.add_exception_handler(
         InternalServerErrorException,
         create_exception_handler(
@@ -0,0 +1,120 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, List
+from fastapi import Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from .errors import InvalidFieldSelectionException
+
+
+@dataclass(frozen=True)
+class FieldSelection:
+    """
+    The fields a client asked for with ``fields=`` and ``include=``.
+
+    Attributes:
+        fields (frozenset): the resource's own fields, None for all of them
+        include (tuple): (relation, FieldSelection) pairs of the embedded relations
+    """
+    fields: frozenset[str] | None = None
+    include: tuple[tuple[str, "FieldSelection"], ...] = ()
+
+    def embedded(self, relation: str) -> "FieldSelection | None":
+        return dict(self.include).get(relation)
+
+
+def _split(value: str | None) -> list[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+def parse_fields(
+    model: type[BaseModel],
+    fields: str | None = None,
+    include: str | None = None,
+    embeddable: dict[str, type[BaseModel]] | None = None,
+) -> FieldSelection:
+    """
+    Parse the ``fields`` and ``include`` query parameters of a read endpoint.
+
+    ``fields`` is a comma separated list of the resource's fields, with
+    ``relation.field`` for the fields of an embedded relation. ``include``
+    lists the embedded relations. ``id`` is always returned.
+
+    Args:
+        model (BaseModel): the full response schema
+        fields (str): e.g. "title,items.name,items.is_complete"
+        include (str): e.g. "items", or "" to embed nothing
+        embeddable (dict): the relations that can be embedded and their schema
+
+    Returns:
+        FieldSelection: the parsed selection
+    """
+    embeddable = embeddable or {}
+    own, nested = set(), {relation: set() for relation in embeddable}
+    for name in _split(fields):
+        relation, _, field = name.rpartition(".")
+        if relation:
+            if relation not in embeddable or field not in embeddable[relation].model_fields:
+                raise InvalidFieldSelectionException()
+            nested[relation].add(field)
+        elif name in model.model_fields and name not in embeddable:
+            own.add(name)
+        else:
+            raise InvalidFieldSelectionException()
+
+    included = _split(include)
+    if any(relation not in embeddable for relation in included):
+        raise InvalidFieldSelectionException()
+    return FieldSelection(
+        fields=frozenset(own | {"id"}) if own else None,
+        include=tuple(
+            (relation, FieldSelection(fields=frozenset(nested[relation] | {"id"}) if nested[relation] else None))
+            for relation in included
+        ),
+    )
+
+
+def columns(selection: FieldSelection | None, mapped) -> list:
+    """The mapped attributes to load for a selection, empty to load them all"""
+    if selection is None or selection.fields is None:
+        return []
+    return [getattr(mapped, name) for name in sorted(selection.fields)]
+
+
+@lru_cache(maxsize=256)
+def sparse_model(model: type[BaseModel], selection: FieldSelection, embeddable: tuple = ()) -> type[BaseModel]:
+    """A schema with only the selected fields of ``model``, built once per selection"""
+    embeddable = dict(embeddable)
+    definitions = {
+        name: (field.annotation, field)
+        for name, field in model.model_fields.items()
+        if name not in embeddable and (selection.fields is None or name in selection.fields)
+    }
+    for relation, nested in selection.include:
+        definitions[relation] = (List[sparse_model(embeddable[relation], nested)], [])
+    return create_model(
+        f"{model.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **definitions,
+    )
+
+
+@lru_cache(maxsize=256)
+def _adapter(model: type[BaseModel], many: bool) -> TypeAdapter:
+    return TypeAdapter(List[model] if many else model)
+
+
+def sparse_response(
+    model: type[BaseModel],
+    selection: FieldSelection,
+    data: Any,
+    embeddable: dict[str, type[BaseModel]] | None = None,
+    many: bool = False,
+) -> Response:
+    """
+    Serialize ORM objects with only the selected fields. The objects are
+    read attribute by attribute, so the columns left out of the SELECT
+    are never touched.
+    """
+    adapter = _adapter(sparse_model(model, selection, tuple((embeddable or {}).items())), many)
+    body = adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+    return Response(content=body, media_type="application/json")
@@ -0,0 +1,205 @@
+import asyncio
+import contextlib
+import hashlib
+import logging
+import secrets
+import time
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from src.db.redis import get_redis
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+# Response headers stored with the body and sent again on replay.
+REPLAYED_HEADERS = ("content-type", "location")
+
+# Locks hold a random token of their owner, so a request whose lock expired
+# can't extend or release the lock a retry took after it.
+EXTEND_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+# Stores the response unless another request holds the key's lock, and
+# releases the lock when it is still ours. ARGV: token, ttl, then the
+# record as field, value pairs (none for a failed request).
+RELEASE_LOCK_SCRIPT = """
+local owner = redis.call('get', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return 0
+end
+if owner then
+    redis.call('del', KEYS[1])
+end
+if #ARGV > 2 then
+    redis.call('hset', KEYS[2], unpack(ARGV, 3))
+    redis.call('expire', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+
+def record_key(principal: str, key: str) -> str:
+    return f"idempotency:{principal}:{key}"
+
+
+def lock_key(principal: str, key: str) -> str:
+    return f"idempotency:{principal}:{key}:lock"
+
+
+def _principal(headers: Headers) -> str:
+    """The user a key belongs to, so two users can't replay each other's responses"""
+    from src.auth.utils import decode_token
+
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        sub = decode_token(token).get("sub")
+        if sub:
+            return f"user:{sub}"
+    return "anonymous"
+
+
+# Same body as the errors in src.utils.errors, sent before the app runs.
+def _error(status_code: int, message: str, error_code: str) -> JSONResponse:
+    return JSONResponse(content={"message": message, "error_code": error_code}, status_code=status_code)
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware making POST requests with an ``Idempotency-Key`` header
+    safe to retry, on the paths listed in IDEMPOTENT_PATHS.
+
+    The first request runs while holding a short lock on the key. A
+    successful response is stored in Redis with a fingerprint of the
+    request for IDEMPOTENCY_TTL_SECONDS. A retry with the same key and body
+    gets the stored response back without reaching the route, one with
+    another body is rejected, and one arriving while the first still runs
+    waits for it up to IDEMPOTENCY_LOCK_WAIT_SECONDS. The lock is extended
+    while the request runs, and only its owner can release it. Failed
+    requests are not stored, so they can be retried. Without Redis
+    requests run as if no key was sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.paths = {settings.API_PATH_PREFIX + path for path in settings.IDEMPOTENT_PATHS}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        key = headers.get(HEADER)
+        if key is None:
+            return await self.app(scope, receive, send)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return await _error(400, "invalid Idempotency-Key header", "CE022")(scope, receive, send)
+
+        body, more_body = b"", True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        fingerprint = hashlib.sha256(scope["path"].encode() + b"\n" + body).hexdigest()
+        principal = _principal(headers)
+
+        token = secrets.token_hex(16)
+        try:
+            response = await self._acquire(principal, key, token, fingerprint)
+        except Exception as e:
+            logger.warning("idempotency key %s not checked, redis is unavailable: %s", key, e)
+            return await self.app(scope, _replay_body(body, receive), send)
+        if response is not None:
+            return await response(scope, receive, send)
+
+        status_code, response_headers, chunks = None, [], []
+
+        async def send_and_capture(message):
+            nonlocal status_code, response_headers
+            if message["type"] == "http.response.start":
+                status_code, response_headers = message["status"], message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        keep_alive = asyncio.ensure_future(self._extend(principal, key, token))
+        try:
+            await self.app(scope, _replay_body(body, receive), send_and_capture)
+        finally:
+            keep_alive.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await keep_alive
+            await self._release(principal, key, token, fingerprint, status_code, response_headers, b"".join(chunks))
+
+    async def _acquire(self, principal: str, key: str, token: str, fingerprint: str) -> Response | None:
+        """Take the key's lock, or return the response to send instead of running the request"""
+        redis = get_redis()
+        deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_WAIT_SECONDS
+        while True:
+            record = await redis.hgetall(record_key(principal, key))
+            if record:
+                if record[b"fingerprint"].decode() != fingerprint:
+                    return _error(422, "the Idempotency-Key was already used with another request", "CE023")
+                headers = {
+                    name.decode()[len("header:"):]: value.decode()
+                    for name, value in record.items() if name.startswith(b"header:")
+                }
+                headers["Idempotent-Replayed"] = "true"
+                return Response(content=record[b"body"], status_code=int(record[b"status"]), headers=headers)
+            if await redis.set(lock_key(principal, key), token, nx=True, ex=settings.IDEMPOTENCY_LOCK_SECONDS):
+                return None
+            if time.monotonic() >= deadline:
+                return _error(409, "a request with this Idempotency-Key is still being processed", "CE024")
+            await asyncio.sleep(0.05)
+
+    async def _extend(self, principal: str, key: str, token: str):
+        """Keep the key's lock while the request runs, for as long as we own it"""
+        interval = settings.IDEMPOTENCY_LOCK_SECONDS / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                owned = await get_redis().eval(
+                    EXTEND_LOCK_SCRIPT, 1, lock_key(principal, key), token, settings.IDEMPOTENCY_LOCK_SECONDS,
+                )
+            except Exception as e:
+                logger.warning("could not extend the lock of idempotency key %s: %s", key, e)
+                continue
+            if not owned:
+                logger.warning("lost the lock of idempotency key %s while the request ran", key)
+                return
+
+    async def _release(self, principal: str, key: str, token: str, fingerprint: str, status_code, headers: list, body: bytes):
+        """Store a successful response and release the key's lock, if it is still ours"""
+        record = []
+        if status_code is not None and 200 <= status_code < 300:
+            record = ["fingerprint", fingerprint, "status", status_code, "body", body]
+            for name, value in headers:
+                if name.decode().lower() in REPLAYED_HEADERS:
+                    record += [f"header:{name.decode().lower()}", value]
+        try:
+            released = await get_redis().eval(
+                RELEASE_LOCK_SCRIPT, 2, lock_key(principal, key), record_key(principal, key),
+                token, settings.IDEMPOTENCY_TTL_SECONDS, *record,
+            )
+        except Exception as e:
+            logger.warning("could not store the response of idempotency key %s: %s", key, e)
+            return
+        if not released:
+            logger.warning("idempotency key %s was taken over by a retry, the response was not stored", key)
+
+
+def _replay_body(body: bytes, receive):
+    """A receive callable handing the already read body to the app"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
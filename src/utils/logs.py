@@ -0,0 +1,170 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from starlette.datastructures import Headers
+from .config import settings
+
+access_logger = logging.getLogger("src.access")
+
+# Id of the request (or Celery task) being handled, added to every log record.
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# Incoming ids are only reused when they can't break a log line or a header.
+VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+# Attributes every LogRecord has, anything else was passed with ``extra=``.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line, with its ``extra`` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_")
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _RequestQueueHandler(QueueHandler):
+    """
+    Hand records to the listener thread, which does the formatting and the
+    writes. Only what must be captured on the caller's side is done here:
+    the request id, the message and the traceback text.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = getattr(record, "request_id", None) or request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging():
+    """
+    Send the logs of the process to stdout through a queue, so writing them
+    never blocks the event loop or a worker. Formatted as JSON lines, or as
+    text with LOG_FORMAT=text. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_RequestQueueHandler(records))
+    root.setLevel(settings.LOG_LEVEL)
+
+    _listener = QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def new_request_id(incoming: str | None = None) -> str:
+    """The id of a request: the caller's when it is usable, otherwise a new one"""
+    if incoming and VALID_REQUEST_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+class RequestLoggingMiddleware:
+    """
+    ASGI middleware giving each request an id and logging it once done.
+
+    The id is taken from the REQUEST_ID_HEADER of the request when there is
+    one, sent back in the same response header, added to the records logged
+    while handling the request, and to the Celery tasks it enqueues.
+
+    Each request is logged with its status, latency and database time.
+    Successful requests faster than LOG_ACCESS_SLOW_MS are only logged for
+    a LOG_ACCESS_SAMPLE_RATE fraction of them; errors and slow requests
+    always are.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.header = settings.REQUEST_ID_HEADER.lower()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        from src.db.instrumentation import count_queries
+
+        id = new_request_id(Headers(scope=scope).get(self.header))
+        token = request_id.set(id)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((self.header.encode("latin-1"), id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            with count_queries() as stats:
+                await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            self._log(scope, status_code, duration_ms, stats)
+            request_id.reset(token)
+
+    def _log(self, scope, status_code: int, duration_ms: float, stats):
+        sample_rate = settings.LOG_ACCESS_SAMPLE_RATE
+        if status_code < 400 and duration_ms < settings.LOG_ACCESS_SLOW_MS:
+            if random.random() >= sample_rate:
+                return
+        else:
+            sample_rate = 1.0
+        access_logger.log(
+            logging.ERROR if status_code >= 500 else logging.INFO,
+            "%s %s %d",
+            scope["method"],
+            scope["path"],
+            status_code,
+            extra={
+                "method": scope["method"],
+                "path": scope["path"],
+                "status_code": status_code,
+                "duration_ms": round(duration_ms, 3),
+                "db_queries": stats.count,
+                "db_duration_ms": round(stats.duration_ms, 3),
+                "sample_rate": sample_rate,
+            },
+        )
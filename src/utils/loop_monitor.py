@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from dataclasses import dataclass
+from .config import settings
+from .metrics import event_loop_lag, event_loop_blocked
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Stall:
+    handler: str
+    stack: str
+    heartbeat: float
+
+
+class EventLoopMonitor:
+    """
+    Samples event loop lag and reports the handler (and its stack) that was
+    running when the loop was blocked for longer than a threshold.
+
+    A coroutine wakes up every ``interval`` seconds and records how late it
+    was. A watchdog thread checks the coroutine's heartbeat; when the loop
+    has not come back for ``threshold`` seconds it captures the loop
+    thread's stack while the blocking call is still on it.
+    """
+
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._heartbeat = 0.0
+        self._stall: _Stall | None = None
+        self._requests: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._sampler: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start sampling the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._stopped.clear()
+        self._sampler = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        """Stop the sampler and the watchdog thread"""
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+            try:
+                await self._sampler
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    def track(self, scope: dict):
+        """Remember which request the current task is serving"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._requests[task] = scope
+
+    def _current_handler(self) -> str:
+        # Called from the watchdog thread while the loop thread is blocked,
+        # so the task that is "current" is the one doing the blocking.
+        task = asyncio.current_task(self._loop)
+        scope = self._requests.get(task) if task is not None else None
+        if scope is None:
+            return "-"
+        route = scope.get("route")
+        if route is None:
+            # The path and method are the client's: one label for them all
+            # keeps the metric's label values bounded.
+            return "unmatched"
+        return f"{scope['method']} {route.path}"
+
+    async def _sample(self):
+        while True:
+            previous = self._heartbeat
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._heartbeat = now
+            lag = max(now - previous - self.interval, 0.0)
+            event_loop_lag.observe(lag)
+
+            stall, self._stall = self._stall, None
+            if stall is not None and stall.heartbeat == previous:
+                event_loop_blocked.labels(handler=stall.handler).observe(lag)
+                logger.warning(
+                    "event loop blocked for %.1fms by %s\n%s", lag * 1000, stall.handler, stall.stack
+                )
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked_for = time.perf_counter() - heartbeat - self.interval
+            if blocked_for < self.threshold or self._stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self._stall = _Stall(handler=self._current_handler(), stack=stack, heartbeat=heartbeat)
+
+
+class LoopMonitorMiddleware:
+    """ASGI middleware telling the event loop monitor which request each task serves"""
+
+    def __init__(self, app, monitor: EventLoopMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            self.monitor.track(scope)
+        await self.app(scope, receive, send)
+
+
+loop_monitor = EventLoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_MS / 1000,
+    threshold=settings.LOOP_MONITOR_BLOCK_THRESHOLD_MS / 1000,
+)
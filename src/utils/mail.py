@@ -1,22 +1,32 @@
-from fastapi_mail import MessageSchema, MessageType, FastMail, ConnectionConfig
+from functools import lru_cache
 from .config import settings
 
-mail_config = ConnectionConfig(
-    MAIL_USERNAME=settings.MAIL_USERNAME,
-    MAIL_PASSWORD=settings.MAIL_PASSWORD,
-    MAIL_FROM=settings.MAIL_FROM,
-    MAIL_PORT=settings.MAIL_PORT,
-    MAIL_SERVER=settings.MAIL_SERVER,
-    MAIL_FROM_NAME=settings.MAIL_FROM_NAME,
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
-)
 
-mail = FastMail(mail_config)
+@lru_cache
+def get_mail():
+    """
+    Build the mail client on first use so that fastapi_mail and its
+    SMTP config are only loaded by the process that actually sends email.
+    """
+    from fastapi_mail import FastMail, ConnectionConfig
+
+    mail_config = ConnectionConfig(
+        MAIL_USERNAME=settings.MAIL_USERNAME,
+        MAIL_PASSWORD=settings.MAIL_PASSWORD,
+        MAIL_FROM=settings.MAIL_FROM,
+        MAIL_PORT=settings.MAIL_PORT,
+        MAIL_SERVER=settings.MAIL_SERVER,
+        MAIL_FROM_NAME=settings.MAIL_FROM_NAME,
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True
+    )
+    return FastMail(mail_config)
 
 def create_message(recipients: list[str], subject: str, body: str):
+    from fastapi_mail import MessageSchema, MessageType
+
     message = MessageSchema(
         recipients=recipients,
         subject=subject,
@@ -0,0 +1,30 @@
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Latency buckets (seconds) shared by the event loop histograms.
+LOOP_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between when the event loop monitor should have woken up and when it did",
+    buckets=LOOP_BUCKETS,
+)
+event_loop_blocked = Histogram(
+    "event_loop_blocked_seconds",
+    "Duration of event loop stalls longer than the configured threshold, by running handler",
+    ["handler"],
+    buckets=LOOP_BUCKETS,
+)
+singleflight_calls = Counter(
+    "singleflight_calls_total",
+    "Reads that ran a query (leader) or shared the result of an identical one in flight (coalesced)",
+    ["resource", "role"],
+)
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Render every registered metric in the Prometheus text format.
+
+    Returns:
+        tuple: the payload and its content type
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
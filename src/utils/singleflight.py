@@ -0,0 +1,47 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+from .metrics import singleflight_calls
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Per-worker coalescing of identical concurrent reads.
+
+    The first caller for a key starts the work in its own task; callers
+    arriving while it runs await the same task instead of repeating it.
+    The work runs to completion even if the caller that started it goes
+    away, so it must not use that caller's session.
+
+    Args:
+        resource (str): label of the coalesced reads in the metrics
+    """
+
+    def __init__(self, resource: str):
+        self.resource = resource
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run ``work`` for a key, or wait for the run already in flight.
+
+        Returns:
+            the result of the shared run, exceptions included
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(work())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            singleflight_calls.labels(self.resource, "leader").inc()
+        else:
+            singleflight_calls.labels(self.resource, "coalesced").inc()
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Retrieved here so an error nobody waited for is not logged as unhandled.
+            task.exception()
@@ -0,0 +1,70 @@
+import pytest
+
+USERS_URL = "/api/v1/auth/users/"
+
+
+@pytest.fixture
+def sent_emails(monkeypatch):
+    """The recipients of the emails the app queued"""
+    from src.utils.celery_tasks import send_email
+
+    sent = []
+    monkeypatch.setattr(send_email, "delay", lambda recipients, *args: sent.extend(recipients))
+    return sent
+
+
+def sign_up(client, username: str, email: str):
+    return client.post(USERS_URL + "signup", headers={"Authorization": ""}, json={
+        "username": username, "password": "password", "email": email, "first_name": username, "last_name": "Test",
+    })
+
+
+def test_sign_up_with_a_taken_username_or_email(client, sent_emails):
+    assert sign_up(client, "bob", "bob@example.com").status_code == 201
+    assert sent_emails == ["bob@example.com"]
+
+    for username, email in (("bob", "robert@example.com"), ("robert", "bob@example.com")):
+        response = sign_up(client, username, email)
+        assert response.status_code == 400
+        assert response.json()["detail"]["error_code"] == "CE006"
+    assert sent_emails == ["bob@example.com"]
+
+
+def test_changing_the_email_to_a_taken_one(client, create_user, sent_emails):
+    bob = create_user("bob")
+    bob_id = client.get(USERS_URL + "profile", headers=bob).json()["id"]
+
+    response = client.put(USERS_URL + bob_id, headers=bob, json={"email": "admin@example.com"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["error_code"] == "CE006"
+    assert sent_emails == []
+    assert client.get(USERS_URL + "profile", headers=bob).json()["email"] == "bob@example.com"
+
+    response = client.put(USERS_URL + bob_id, headers=bob, json={"email": "robert@example.com"})
+    assert response.status_code == 200
+    assert sent_emails == ["robert@example.com"]
+
+
+def test_sharded_sign_ups_and_email_changes_check_every_shard_first(client, create_user, monkeypatch, sent_emails):
+    from src.auth import routes, service
+    from src.db.instrumentation import count_queries
+
+    # The unique constraints only hold within a shard: the check runs first.
+    monkeypatch.setattr(service, "sharding_enabled", lambda: True)
+    monkeypatch.setattr(routes, "sharding_enabled", lambda: True)
+    assert sign_up(client, "bob", "bob@example.com").status_code == 201
+
+    with count_queries(all_contexts=True) as stats:
+        response = sign_up(client, "robert", "bob@example.com")
+    assert response.status_code == 400
+    assert response.json()["detail"]["error_code"] == "CE006"
+    assert stats.count and not any(statement.startswith("INSERT INTO users") for statement in stats.statements)
+
+    carol = create_user("carol")
+    carol_id = client.get(USERS_URL + "profile", headers=carol).json()["id"]
+    with count_queries(all_contexts=True) as stats:
+        response = client.put(USERS_URL + carol_id, headers=carol, json={"email": "bob@example.com"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["error_code"] == "CE006"
+    assert stats.count and not any(statement.startswith("UPDATE users") for statement in stats.statements)
+    assert sent_emails == ["bob@example.com"]
@@ -0,0 +1,85 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+LISTS_URL = "/api/v1/todolists/"
+
+
+def test_websocket_closes_once_the_list_is_unshared(client, create_user):
+    bob = create_user("bob")
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+    client.post(LISTS_URL + todo_list["id"] + "/shares", json={"username": "bob"})
+    bob_id = client.get(LISTS_URL + todo_list["id"] + "/shares").json()[0]["user_id"]
+    token = client.post(f"{LISTS_URL}{todo_list['id']}/feed-token", headers=bob).json()["feed_token"]
+
+    with client.websocket_connect(f"ws://localhost{LISTS_URL}{todo_list['id']}/ws?feed_token={token}") as websocket:
+        client.put(LISTS_URL + todo_list["id"], json={"title": "shopping"})
+        assert websocket.receive_json()["type"] == "list.updated"
+
+        client.delete(f"{LISTS_URL}{todo_list['id']}/shares/{bob_id}")
+        assert websocket.receive_json()["type"] == "list.unshared"
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+        assert closed.value.code == 1008
+
+
+def test_feed_tokens_only_open_the_feed_of_their_list(client):
+    first, second = (
+        client.post(LISTS_URL, json={"title": title, "description": "", "is_active": True}).json()
+        for title in ("groceries", "chores")
+    )
+    access_token = client.headers["Authorization"].split()[1]
+    response = client.post(f"{LISTS_URL}{first['id']}/feed-token")
+    assert response.status_code == 200
+    feed_token = response.json()["feed_token"]
+
+    # Access tokens are not accepted in the URL.
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"ws://localhost{LISTS_URL}{first['id']}/ws?access_token={access_token}"):
+            pass
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"ws://localhost{LISTS_URL}{second['id']}/ws?feed_token={feed_token}"):
+            pass
+    with client.websocket_connect(f"ws://localhost{LISTS_URL}{first['id']}/ws?feed_token={feed_token}"):
+        pass
+
+    # Nor are feed tokens anywhere else.
+    response = client.get(LISTS_URL, headers={"Authorization": f"Bearer {feed_token}"})
+    assert response.status_code == 401
+
+
+
+def test_subscribers_that_fall_behind_resume_from_their_last_event(client, monkeypatch):
+    import asyncio
+    from src.changefeed.service import ChangeFeedHub, publish_change
+    from src.utils.config import settings
+
+    monkeypatch.setattr(settings, "CHANGE_FEED_QUEUE_SIZE", 1)
+    list_id = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()["id"]
+
+    async def read(events) -> list[str]:
+        received = []
+        async for event in events:
+            received.append(event.id)
+        return received
+
+    async def fall_behind():
+        hub = ChangeFeedHub()
+        reader = asyncio.ensure_future(read(hub.subscribe(list_id)))
+        await asyncio.sleep(0.1)
+        published = [(await publish_change(list_id, "item.created", {"n": 0}))["id"]]
+        await asyncio.sleep(0.1)
+        # Three events arrive at once, more than the subscriber's queue holds.
+        published += [(await publish_change(list_id, "item.created", {"n": n}))["id"] for n in range(1, 4)]
+        received = await asyncio.wait_for(reader, 5)
+
+        second = hub.subscribe(list_id, last_event_id=received[-1])
+        resumed = []
+        while len(received) + len(resumed) < len(published):
+            resumed.append((await asyncio.wait_for(anext(second), 5)).id)
+        await second.aclose()
+        await hub.close()
+        return published, received, resumed
+
+    published, received, resumed = client.portal.call(fall_behind)
+    assert len(received) < len(published)
+    assert received + resumed == published
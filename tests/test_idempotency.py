@@ -0,0 +1,61 @@
+import pytest
+
+# The lock and record scripts run on fakeredis through lupa.
+pytest.importorskip("lupa")
+
+LISTS_URL = "/api/v1/todolists/"
+GROCERIES = {"title": "groceries", "description": "", "is_active": True}
+
+
+def test_retries_get_the_stored_response(client):
+    first = client.post(LISTS_URL, json=GROCERIES, headers={"Idempotency-Key": "k1"})
+    assert first.status_code == 201
+
+    retry = client.post(LISTS_URL, json=GROCERIES, headers={"Idempotency-Key": "k1"})
+    assert retry.status_code == 201
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert [row["id"] for row in client.get(LISTS_URL).json()] == [first.json()["id"]]
+
+
+def test_a_key_reused_with_another_body_is_rejected(client):
+    assert client.post(LISTS_URL, json=GROCERIES, headers={"Idempotency-Key": "k1"}).status_code == 201
+
+    response = client.post(LISTS_URL, json={**GROCERIES, "title": "chores"}, headers={"Idempotency-Key": "k1"})
+    assert response.status_code == 422
+    assert response.json()["error_code"] == "CE023"
+    assert len(client.get(LISTS_URL).json()) == 1
+
+
+def test_concurrent_duplicates_run_once(client):
+    import asyncio
+    import httpx
+
+    async def post_twice():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost", headers=client.headers) as http:
+            return await asyncio.gather(*[
+                http.post(LISTS_URL, json=GROCERIES, headers={"Idempotency-Key": "k1"}) for _ in range(2)
+            ])
+
+    responses = client.portal.call(post_twice)
+    assert [response.status_code for response in responses] == [201, 201]
+    assert responses[0].json() == responses[1].json()
+    assert sorted("Idempotent-Replayed" in response.headers for response in responses) == [False, True]
+    assert len(client.get(LISTS_URL).json()) == 1
+
+
+def test_a_duplicate_gives_up_waiting_for_a_request_still_running(client, monkeypatch):
+    from starlette.datastructures import Headers
+    from src.db.redis import get_redis
+    from src.utils import idempotency
+    from src.utils.config import settings
+
+    monkeypatch.setattr(settings, "IDEMPOTENCY_LOCK_WAIT_SECONDS", 0.2)
+    principal = idempotency._principal(Headers(client.headers))
+    client.portal.call(get_redis().set, idempotency.lock_key(principal, "k1"), "another request")
+
+    response = client.post(LISTS_URL, json=GROCERIES, headers={"Idempotency-Key": "k1"})
+    assert response.status_code == 409
+    assert response.json()["error_code"] == "CE024"
+    assert client.get(LISTS_URL).json() == []
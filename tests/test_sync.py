@@ -0,0 +1,89 @@
+LISTS_URL = "/api/v1/todolists/"
+ITEMS_URL = "/api/v1/todoitems/"
+SYNC_URL = "/api/v1/sync/changes"
+
+
+def test_sync_sends_lists_shared_after_the_cursor(client, create_user, safety_window):
+    bob = create_user("bob")
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+    item = client.post(ITEMS_URL, json={
+        "name": "milk", "description": "", "is_complete": False, "todolist_id": todo_list["id"],
+    }).json()
+
+    # Bob's cursor moves past the list and item with a change of his own.
+    own = client.post(LISTS_URL, headers=bob, json={"title": "chores", "description": "", "is_active": True}).json()
+    changes = client.get(SYNC_URL, headers=bob).json()
+    assert [own["id"]] == [row["id"] for row in changes["lists"]]
+
+    response = client.post(LISTS_URL + todo_list["id"] + "/shares", json={"username": "bob"})
+    assert response.status_code == 201
+
+    # Neither the list nor the item changed: they come with the share.
+    changes = client.get(SYNC_URL, headers=bob, params={"cursor": changes["cursor"]}).json()
+    assert [todo_list["id"]] == [row["id"] for row in changes["lists"]]
+    assert [item["id"]] == [row["id"] for row in changes["items"]]
+
+    changes = client.get(SYNC_URL, headers=bob, params={"cursor": changes["cursor"]}).json()
+    assert changes["lists"] == [] and changes["items"] == [] and not changes["has_more"]
+
+
+def test_sync_cursor_stays_behind_the_safety_window(client, safety_window):
+    safety_window(60)
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+
+    # A change this recent may have been flushed by a transaction that
+    # commits after older, not yet committed ones: it waits for the window.
+    changes = client.get(SYNC_URL).json()
+    assert changes["lists"] == [] and not changes["has_more"]
+
+    safety_window(0)
+    changes = client.get(SYNC_URL, params={"cursor": changes["cursor"]}).json()
+    assert [todo_list["id"]] == [row["id"] for row in changes["lists"]]
+
+
+def test_sync_drops_the_lists_of_a_deleted_user(client, create_user, safety_window):
+    bob = create_user("bob")
+    carol = create_user("carol")
+    todo_list = client.post(LISTS_URL, headers=carol, json={"title": "groceries", "description": "", "is_active": True}).json()
+    client.post(LISTS_URL + todo_list["id"] + "/shares", headers=carol, json={"username": "bob"})
+    changes = client.get(SYNC_URL, headers=bob).json()
+    assert [todo_list["id"]] == [row["id"] for row in changes["lists"]]
+
+    carol_id = client.get("/api/v1/auth/users/profile", headers=carol).json()["id"]
+    assert client.delete(f"/api/v1/auth/users/{carol_id}", headers=carol).status_code == 204
+
+    changes = client.get(SYNC_URL, headers=bob, params={"cursor": changes["cursor"]}).json()
+    assert [("list", todo_list["id"])] == [(row["entity"], row["entity_id"]) for row in changes["deleted"]]
+    assert client.get(LISTS_URL, headers=bob).json() == []
+
+
+def test_sync_backfills_shared_lists_within_the_limit(client, create_user, safety_window):
+    bob = create_user("bob")
+    lists = [
+        client.post(LISTS_URL, json={"title": title, "description": "", "is_active": True}).json()
+        for title in ("groceries", "chores", "empty")
+    ]
+    items = {
+        client.post(ITEMS_URL, json={
+            "name": f"item {n}", "description": "", "is_complete": False, "todolist_id": todo_list["id"],
+        }).json()["id"]
+        for todo_list in lists[:2] for n in range(3)
+    }
+    client.post(LISTS_URL, headers=bob, json={"title": "own", "description": "", "is_active": True})
+    cursor = client.get(SYNC_URL, headers=bob).json()["cursor"]
+    for todo_list in lists:
+        client.post(LISTS_URL + todo_list["id"] + "/shares", json={"username": "bob"})
+
+    # Six items and three lists come with the shares, two items at a time.
+    synced_lists, synced_items = [], []
+    for _ in range(10):
+        changes = client.get(SYNC_URL, headers=bob, params={"cursor": cursor, "limit": 2}).json()
+        assert len(changes["items"]) <= 2
+        synced_lists += [row["id"] for row in changes["lists"]]
+        synced_items += [row["id"] for row in changes["items"]]
+        cursor = changes["cursor"]
+        if not changes["has_more"]:
+            break
+    assert sorted(synced_lists) == sorted(todo_list["id"] for todo_list in lists)
+    assert sorted(synced_items) == sorted(items)
+    assert not changes["has_more"]
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+
+LISTS_URL = "/api/v1/todolists/"
+ITEMS_URL = "/api/v1/todoitems/"
+SYNC_URL = "/api/v1/sync/changes"
+
+
+def archive_completed_items(client) -> int:
+    from src.db.db_setup import AsyncSessionLocal
+    from src.todoitems.service import ToDoItemService
+
+    async def archive():
+        async with AsyncSessionLocal() as session:
+            return await ToDoItemService(session).archive_completed_items(datetime.now() + timedelta(minutes=1))
+
+    return client.portal.call(archive)
+
+
+def test_archived_items_stay_in_their_list(client):
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+    for name, is_complete in (("milk", True), ("eggs", False)):
+        response = client.post(ITEMS_URL, json={
+            "name": name, "description": "", "is_complete": is_complete, "todolist_id": todo_list["id"],
+        })
+        assert response.status_code == 201
+
+    assert archive_completed_items(client) == 1
+
+    # Reads of the items only return the hot ones unless asked for the archive.
+    assert [item["name"] for item in client.get(ITEMS_URL).json()] == ["eggs"]
+    assert sorted(item["name"] for item in client.get(ITEMS_URL, params={"include_archived": True}).json()) == ["eggs", "milk"]
+
+    # Lists embed all their items.
+    response = client.get(LISTS_URL + todo_list["id"])
+    assert response.status_code == 200
+    assert sorted(item["name"] for item in response.json()["items"]) == ["eggs", "milk"]
+    [listed] = client.get(LISTS_URL).json()
+    assert sorted(item["name"] for item in listed["items"]) == ["eggs", "milk"]
+    [found] = client.post(LISTS_URL + "batch", json={"ids": [todo_list["id"]]}).json()["found"]
+    assert sorted(item["name"] for item in found["items"]) == ["eggs", "milk"]
+
+
+def create_list(client, title: str, headers=None) -> str:
+    response = client.post(LISTS_URL, headers=headers, json={"title": title, "description": "", "is_active": True})
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def create_item(client, todolist_id: str, name: str, headers=None) -> str:
+    response = client.post(ITEMS_URL, headers=headers, json={
+        "name": name, "description": "", "is_complete": False, "todolist_id": todolist_id,
+    })
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_copy_items(client):
+    source, target = create_list(client, "groceries"), create_list(client, "shopping")
+    ids = [create_item(client, source, name) for name in ("milk", "eggs")]
+
+    response = client.post(ITEMS_URL + "move", json={"target_list_id": target, "mode": "copy", "source_list_id": source})
+    assert response.status_code == 200
+    assert response.json()["affected"] == 2
+
+    copies = client.get(LISTS_URL + target).json()["items"]
+    assert sorted(item["name"] for item in copies) == ["eggs", "milk"]
+    assert not {item["id"] for item in copies} & set(ids)
+    assert len(client.get(LISTS_URL + source).json()["items"]) == 2
+
+
+def test_moved_items_leave_the_sync_of_users_who_only_see_the_source_list(client, create_user, safety_window):
+    bob = create_user("bob")
+    source, target = create_list(client, "groceries"), create_list(client, "shopping")
+    client.post(f"{LISTS_URL}{source}/shares", json={"username": "bob"})
+    id = create_item(client, source, "milk")
+    bob_cursor = client.get(SYNC_URL, headers=bob).json()["cursor"]
+    owner_cursor = client.get(SYNC_URL).json()["cursor"]
+
+    response = client.post(ITEMS_URL + "move", json={"target_list_id": target, "item_ids": [id]})
+    assert response.json()["affected"] == 1
+
+    changes = client.get(SYNC_URL, headers=bob, params={"cursor": bob_cursor}).json()
+    assert [(row["entity"], row["entity_id"], row["todolist_id"]) for row in changes["deleted"]] == [("item", id, source)]
+    assert changes["items"] == []
+
+    # The owner sees both lists: the item is updated, not deleted.
+    changes = client.get(SYNC_URL, params={"cursor": owner_cursor}).json()
+    assert changes["deleted"] == []
+    assert [(row["id"], row["todolist_id"]) for row in changes["items"]] == [(id, target)]
+
+
+def test_archiving_reaches_sync_and_the_cached_list(client, safety_window):
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+    item = client.post(ITEMS_URL, json={
+        "name": "milk", "description": "", "is_complete": True, "todolist_id": todo_list["id"],
+    }).json()
+    assert [row["archived"] for row in client.get(LISTS_URL + todo_list["id"]).json()["items"]] == [False]
+    cursor = client.get(SYNC_URL).json()["cursor"]
+
+    assert archive_completed_items(client) == 1
+
+    changes = client.get(SYNC_URL, params={"cursor": cursor}).json()
+    assert [(row["id"], row["archived"]) for row in changes["items"]] == [(item["id"], True)]
+    assert [row["archived"] for row in client.get(LISTS_URL + todo_list["id"]).json()["items"]] == [True]
+
+
+def user_id(client, headers=None) -> str:
+    return client.get("/api/v1/auth/users/profile", headers=headers).json()["id"]
+
+
+def toggle_together(client, toggles: list, **batcher_options) -> list:
+    """Send toggles to one fresh batcher at once, returning each answer or error"""
+    import asyncio
+    import uuid
+    from src.todoitems.batching import CompletionBatcher
+
+    async def toggle():
+        batcher = CompletionBatcher(**{"window": 0.05, "max_size": 100, **batcher_options})
+        return await asyncio.gather(*(
+            batcher.toggle(uuid.UUID(id), is_complete, uuid.UUID(user)) for id, is_complete, user in toggles
+        ), return_exceptions=True)
+
+    return client.portal.call(toggle)
+
+
+def test_completions_of_items_the_user_cannot_access_are_denied(client, create_user):
+    bob = create_user("bob")
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+    item_id = create_item(client, todo_list["id"], "milk")
+
+    response = client.put(ITEMS_URL + item_id + "/complete", headers=bob, json={"is_complete": True})
+    assert response.status_code == 404
+    [denied, allowed] = toggle_together(client, [(item_id, True, user_id(client, bob)), (item_id, False, user_id(client))])
+    assert denied is None and allowed.is_complete is False
+    assert client.get(ITEMS_URL + item_id).json()["is_complete"] is False
+
+    response = client.put(ITEMS_URL + item_id + "/complete", json={"is_complete": True})
+    assert response.status_code == 200 and response.json()["is_complete"] is True
+
+
+def test_the_last_toggle_in_a_window_wins(client):
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+    item_id = create_item(client, todo_list["id"], "milk")
+    admin = user_id(client)
+
+    results = toggle_together(client, [(item_id, True, admin), (item_id, False, admin), (item_id, True, admin)])
+    assert [item.is_complete for item in results] == [True, False, True]
+    assert client.get(ITEMS_URL + item_id).json()["is_complete"] is True
+
+    toggle_together(client, [(item_id, False, admin), (item_id, True, admin), (item_id, False, admin)])
+    assert client.get(ITEMS_URL + item_id).json()["is_complete"] is False
+
+
+def test_a_failed_flush_answers_every_toggle_of_the_batch(client, monkeypatch):
+    from src.todoitems.service import ToDoItemService
+
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+    items = [create_item(client, todo_list["id"], name) for name in ("milk", "eggs")]
+    admin = user_id(client)
+
+    async def fail(self, toggles):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(ToDoItemService, "set_completions", fail)
+    first, second = toggle_together(client, [(item_id, True, admin) for item_id in items])
+    assert isinstance(first, RuntimeError) and second is first
+
+
+def test_update_and_delete_an_item(client):
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+    item_id = create_item(client, todo_list["id"], "milk")
+
+    response = client.put(ITEMS_URL + item_id, json={"is_complete": True})
+    assert response.status_code == 200 and response.json()["is_complete"] is True
+    assert client.delete(ITEMS_URL + item_id).status_code == 204
+    assert client.get(ITEMS_URL + item_id).status_code == 404
@@ -0,0 +1,53 @@
+LISTS_URL = "/api/v1/todolists/"
+ITEMS_URL = "/api/v1/todoitems/"
+
+
+def create_lists(client, count: int, items_per_list: int) -> list[str]:
+    ids = []
+    for i in range(count):
+        response = client.post(LISTS_URL, json={"title": f"list {i}", "description": "", "is_active": True})
+        assert response.status_code == 201
+        ids.append(response.json()["id"])
+        for j in range(items_per_list):
+            response = client.post(ITEMS_URL, json={
+                "name": f"item {j}", "description": "", "is_complete": False, "todolist_id": ids[-1],
+            })
+            assert response.status_code == 201
+    return ids
+
+
+def test_read_todo_lists_query_count(client, assert_max_queries):
+    create_lists(client, count=5, items_per_list=3)
+
+    with assert_max_queries(3):
+        response = client.get(LISTS_URL)
+
+    assert response.status_code == 200
+    assert len(response.json()) == 5
+    assert all(len(todo_list["items"]) == 3 for todo_list in response.json())
+
+
+def test_read_todo_lists_batch_query_count(client, assert_max_queries):
+    ids = create_lists(client, count=5, items_per_list=3)
+
+    with assert_max_queries(3):
+        response = client.post(LISTS_URL + "batch", json={"ids": ids})
+
+    assert response.status_code == 200
+    assert len(response.json()["found"]) == 5
+    assert response.json()["missing"] == []
+
+
+def test_sharing_with_a_user_on_another_shard_is_refused(client, create_user, monkeypatch):
+    from src.todolists import service
+
+    bob = create_user("bob")
+    bob_id = client.get("/api/v1/auth/users/profile", headers=bob).json()["id"]
+    monkeypatch.setattr(service, "sharding_enabled", lambda: True)
+    monkeypatch.setattr(service, "shard_for_user", lambda user_id: "b" if str(user_id) == bob_id else "a")
+    todo_list = client.post(LISTS_URL, json={"title": "groceries", "description": "", "is_active": True}).json()
+
+    response = client.post(LISTS_URL + todo_list["id"] + "/shares", json={"username": "bob"})
+    assert response.status_code == 409
+    assert response.json()["error_code"] == "CE026"
+    assert client.post(LISTS_URL + todo_list["id"] + "/shares", json={"username": "nobody"}).status_code == 404